@@ -0,0 +1,789 @@
+#!/usr/bin/env python3
+"""End-to-end latency benchmark for the security-guidance hooks.
+
+Replays a session's hook stdin payloads (UserPromptSubmit → PostToolUse
+edits → PostToolUse[Bash] `git commit` → Stop, per turn) against
+security_reminder_hook.py as fresh subprocesses, exactly as Claude Code
+spawns them, inside a scratch git repo. The LLM calls go to mock_api's
+in-process stand-in through ANTHROPIC_BASE_URL, so no API key or network
+is needed and model latency/errors are under control.
+
+Per event type it reports p50/p95/p99 wall-clock latency, git subprocesses
+per event (counted by a `git` shim on PATH; a persistent `cat-file --batch`
+counts once), and requests and bytes sent to the model. `--max-git
+EVENT=N` turns the git count into a regression check: the run exits 1 if
+any event whose label contains EVENT spawned more than N git processes.
+`--check` applies the budgets in _GIT_BUDGETS, the counts the default
+session spawns today; it is the regression gate for the git plumbing in
+diffstate/gitutil, so run it after changing either and lower a budget
+when a change saves a process.
+
+    python3 bench_hooks.py                              # 200-file repo, 5 turns
+    python3 bench_hooks.py --files 2000 --turns 10 --edits 20 --latency-ms 1500
+    python3 bench_hooks.py --rate-529 0.2               # exercise the fallbacks
+    python3 bench_hooks.py --dump-scenario s.jsonl      # write payloads, no run
+    python3 bench_hooks.py --replay s.jsonl             # replay recorded payloads
+    python3 bench_hooks.py --max-git Stop=13 --max-git Edit=0  # fail on regressions
+    python3 bench_hooks.py --check                      # the checked-in budgets
+    python3 bench_hooks.py --diff-parse 50              # diff parser, 50 MB diff
+    python3 bench_hooks.py --rewrite-filter 2000        # rewrite filter, 2000 files
+    python3 bench_hooks.py --rewrite-corpus             # rewrite filter equivalence
+    python3 bench_hooks.py --max-import-ms 60           # edit-path import budget
+
+Replay files hold one hook stdin payload per line. `{repo}` and `{session}`
+in any string are replaced with the scratch repo path and a fresh session
+id. The driver performs each tool call's side effect before firing its
+hook, as the real tool would: Edit/Write change the file, and a Bash
+`git commit` is really run so tool_response.stdout carries its
+`[branch sha]` line.
+
+The agentic commit reviewer talks to the Agent SDK rather than
+/v1/messages, so it is switched off (SG_AGENTIC_COMMIT_REVIEW=0) and
+commits get the single-shot review. Other SG_* settings in the
+environment pass through to the hooks.
+
+--diff-parse MB skips the session and instead times gitutil's diff parser
+on a synthetic MB-sized diff (mostly a vendored-dependency bump plus some
+source files): the buffered path the hooks used to take (decode all of
+stdout, then parse) against iter_diff_files reading a byte stream, with
+tracemalloc peak memory for each.
+
+--rewrite-filter N times gitutil.filter_preexisting_from_diff on N
+synthetic full-file-rewrite diffs against the set-based filter it
+replaced (kept below as _set_rewrite_filter), and checks the two agree
+on every file whose -/+ lines are distinct — the inputs where set and
+multiset matching must give the same answer. Exits non-zero on a
+mismatch.
+
+--rewrite-corpus runs the filter over _REWRITE_CORPUS, a fixed set of
+hand-written diffs: ones with distinct -/+ lines must match the set-based
+filter exactly, and the duplicate-line cases where the two differ on
+purpose must give their pinned multiset output. Exits non-zero on any
+difference.
+
+--max-import-ms MS skips the session and fires one PostToolUse[Edit]
+hook under `python -X importtime`, the path every file edit pays for.
+It reports the hook's own import time (modules the bare interpreter
+doesn't already load; best of --import-runs) and exits 1 if that is over
+MS or if the edit path imported any of _EDIT_PATH_LAZY, which only the
+Stop and commit/push reviews need.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mock_api import MockAnthropic  # noqa: E402
+
+_HOOK_DIR = os.path.dirname(os.path.abspath(__file__))
+_HOOK = os.path.join(_HOOK_DIR, "security_reminder_hook.py")
+_WORKER = os.path.join(_HOOK_DIR, "warm_worker.py")
+
+# Most git processes a single hook of each event type may spawn in the
+# default session (synchronous baseline capture), for --check. A commit is
+# numstat + patch text, then `git log -p | git patch-id` for the dedup
+# against the reviewed-shas store, whose ids (and full shas) the record
+# after the review reuses.
+_GIT_BUDGETS = (("UserPromptSubmit", 2), ("Edit", 0), ("Bash(commit)", 4), ("Stop", 8))
+
+_ANCHOR = "    # sg-bench-anchor"
+_DIRS = ("app/api", "app/core", "app/models", "app/services", "lib/util",
+         "lib/net", "scripts", "web/handlers")
+_REAL_GIT = shutil.which("git") or "git"
+# Stripped from the hook env so the run only ever talks to the mock and
+# never picks up the caller's credentials, gateway or remote-pod probe.
+_STRIP_ENV = ("ANTHROPIC_API_KEY", "ANTHROPIC_AUTH_TOKEN", "ANTHROPIC_BASE_URL",
+              "CLAUDE_CODE_USE_BEDROCK", "CLAUDE_CODE_USE_VERTEX",
+              "CLAUDE_CODE_USE_FOUNDRY", "CLAUDE_CODE_REMOTE",
+              "HTTPS_PROXY", "https_proxy", "HTTP_PROXY", "http_proxy")
+
+
+def _git(repo, *args):
+    """Driver-side git (real binary, not the counting shim)."""
+    return subprocess.run(
+        [_REAL_GIT, "-C", repo, "-c", "user.name=bench", "-c", "user.email=bench@example.com",
+         "-c", "commit.gpgsign=false", *args],
+        capture_output=True, text=True, check=False)
+
+
+def _module_source(i, lines):
+    body = [f'"""Bench module {i}."""', "import os", "import subprocess", "", ""]
+    n_funcs = max(1, lines // 6)
+    for f in range(n_funcs):
+        body += [f"def handler_{i}_{f}(request, value_{f}=None):",
+                 f"    key = request.get('k{f}')",
+                 "    if key is None:",
+                 f"        return value_{f}",
+                 f"    return str(key) + str(value_{f})", ""]
+    body += [f"def entry_{i}(request):", _ANCHOR, "    return request", ""]
+    return "\n".join(body)
+
+
+def make_repo(root, n_files, file_lines):
+    """Scratch repo with `n_files` Python modules spread over a few package
+    dirs, committed once. Returns the list of repo-relative paths."""
+    os.makedirs(root)
+    _git(root, "init", "-q", "-b", "main")
+    paths = []
+    for i in range(n_files):
+        rel = f"{_DIRS[i % len(_DIRS)]}/mod_{i}.py"
+        full = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, "w") as f:
+            f.write(_module_source(i, file_lines))
+        paths.append(rel)
+    _git(root, "add", "-A")
+    _git(root, "commit", "-q", "-m", "initial")
+    return paths
+
+
+def make_scenario(paths, turns, edits, vuln_every, seed):
+    """Hook payloads for `turns` turns of `edits` edits each."""
+    rng = random.Random(seed)
+    out = []
+    n = 0
+    for t in range(turns):
+        out.append({"session_id": "{session}", "hook_event_name": "UserPromptSubmit",
+                    "cwd": "{repo}", "prompt": f"bench turn {t}"})
+        for e in range(edits):
+            n += 1
+            rel = rng.choice(paths)
+            added = [f"    flag_{t}_{e} = request.get('q{e}')"]
+            if vuln_every and n % vuln_every == 0:
+                added.append(f"    os.system('convert ' + flag_{t}_{e})  # SG_BENCH_VULN")
+            out.append({
+                "session_id": "{session}", "hook_event_name": "PostToolUse",
+                "tool_name": "Edit", "cwd": "{repo}", "tool_use_id": f"toolu_bench_{t}_{e}",
+                "tool_input": {"file_path": "{repo}/" + rel, "old_string": _ANCHOR,
+                               "new_string": _ANCHOR + "\n" + "\n".join(added)},
+                "tool_response": {},
+            })
+        out.append({
+            "session_id": "{session}", "hook_event_name": "PostToolUse",
+            "tool_name": "Bash", "cwd": "{repo}", "tool_use_id": f"toolu_bench_{t}_commit",
+            "tool_input": {"command": f"git commit -am 'bench turn {t}'"},
+            "tool_response": {"stdout": "", "stderr": "", "interrupted": False},
+        })
+        out.append({"session_id": "{session}", "hook_event_name": "Stop",
+                    "cwd": "{repo}", "stop_hook_active": False})
+    return out
+
+
+def _substitute(obj, repo, session):
+    if isinstance(obj, str):
+        return obj.replace("{repo}", repo).replace("{session}", session)
+    if isinstance(obj, list):
+        return [_substitute(v, repo, session) for v in obj]
+    if isinstance(obj, dict):
+        return {k: _substitute(v, repo, session) for k, v in obj.items()}
+    return obj
+
+
+def _event_label(p):
+    ev = p.get("hook_event_name", "?")
+    tool = p.get("tool_name")
+    if ev != "PostToolUse" or not tool:
+        return ev
+    if tool == "Bash":
+        cmd = (p.get("tool_input") or {}).get("command", "")
+        return "PostToolUse:Bash(commit)" if "git commit" in cmd else (
+            "PostToolUse:Bash(push)" if "git push" in cmd else "PostToolUse:Bash")
+    return f"PostToolUse:{tool}"
+
+
+def apply_side_effect(p, repo):
+    """Do what the tool itself did before its PostToolUse hook fires."""
+    if p.get("hook_event_name") != "PostToolUse":
+        return p
+    tool = p.get("tool_name")
+    ti = p.get("tool_input") or {}
+    fp = ti.get("file_path") or ""
+    if tool == "Write" and fp:
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
+        with open(fp, "w") as f:
+            f.write(ti.get("content", ""))
+    elif tool == "Edit" and fp:
+        try:
+            with open(fp) as f:
+                text = f.read()
+        except OSError:
+            text = ""
+        old, new = ti.get("old_string", ""), ti.get("new_string", "")
+        text = text.replace(old, new, 1) if old and old in text else text + new + "\n"
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
+        with open(fp, "w") as f:
+            f.write(text)
+    elif tool == "Bash" and "git commit" in ti.get("command", ""):
+        _git(repo, "add", "-A")
+        r = _git(repo, "commit", "-m", "bench commit")
+        p = dict(p)
+        p["tool_response"] = {"stdout": r.stdout, "stderr": r.stderr, "interrupted": False}
+    return p
+
+
+def _write_git_shim(bin_dir, log_path):
+    os.makedirs(bin_dir)
+    shim = os.path.join(bin_dir, "git")
+    with open(shim, "w") as f:
+        f.write("#!/bin/sh\n"
+                f"printf '%s\\n' \"$*\" >> '{log_path}'\n"
+                f"exec '{_REAL_GIT}' \"$@\"\n")
+    os.chmod(shim, 0o755)
+
+
+def _git_subcommand(argline):
+    """First non-option word of a logged git argv (skips `-c k=v`, `-C dir`)."""
+    words = argline.split()
+    i = 0
+    while i < len(words):
+        w = words[i]
+        if w in ("-c", "-C"):
+            i += 2
+            continue
+        if not w.startswith("-"):
+            return w
+        i += 1
+    return "?"
+
+
+def _pct(sorted_vals, q):
+    if not sorted_vals:
+        return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, int(round(q * (len(sorted_vals) - 1))))]
+
+
+def _hook_metrics(stdout):
+    for line in stdout.splitlines():
+        if line.startswith("{"):
+            try:
+                return json.loads(line).get("metrics") or {}
+            except ValueError:
+                return {}
+    return {}
+
+
+def run(payloads, repo, tmp, mock, use_worker=False, timeout=600):
+    """Fire each payload's hook in order; return one result dict per event."""
+    state = os.path.join(tmp, "state")
+    home = os.path.join(tmp, "home")
+    os.makedirs(state, exist_ok=True)
+    os.makedirs(home, exist_ok=True)
+    # Pretend the Agent SDK bootstrap already ran so PostToolUse doesn't
+    # spawn a detached venv build into the measurements.
+    open(os.path.join(state, ".sdk_bootstrap_spawned"), "w").close()
+    git_log = os.path.join(tmp, "git_calls.log")
+    open(git_log, "w").close()
+    _write_git_shim(os.path.join(tmp, "bin"), git_log)
+
+    env = {k: v for k, v in os.environ.items() if k not in _STRIP_ENV}
+    env.update({
+        "PATH": os.path.join(tmp, "bin") + os.pathsep + env.get("PATH", ""),
+        "HOME": home,
+        "SECURITY_WARNINGS_STATE_DIR": state,
+        "SECURITY_GUIDANCE_DEBUG_LOG": os.path.join(tmp, "log.txt"),
+        "CLAUDE_PROJECT_DIR": repo,
+        "ANTHROPIC_BASE_URL": mock.base_url,
+        "ANTHROPIC_API_KEY": "sk-ant-bench",
+        "SG_AGENTIC_COMMIT_REVIEW": "0",
+        "NO_PROXY": "127.0.0.1,localhost",
+    })
+    if use_worker:
+        env.setdefault("SG_WARM_WORKER", "1")
+        env.setdefault("SG_WARM_WORKER_IDLE_S", "30")
+
+    results = []
+    for p in payloads:
+        p = apply_side_effect(p, repo)
+        label = _event_label(p)
+        entry = (_WORKER if use_worker and p.get("tool_name") in ("Edit", "Write", "MultiEdit")
+                 else _HOOK)
+        with open(git_log) as f:
+            git_before = sum(1 for _ in f)
+        api_before = mock.snapshot()
+        t0 = time.perf_counter()
+        r = subprocess.run([sys.executable, entry], input=json.dumps(p), env=env,
+                           cwd=p.get("cwd") or repo, capture_output=True, text=True,
+                           timeout=timeout)
+        ms = (time.perf_counter() - t0) * 1000
+        api_after = mock.snapshot()
+        with open(git_log) as f:
+            git_lines = f.read().splitlines()[git_before:]
+        m = _hook_metrics(r.stdout)
+        results.append({
+            "event": label, "ms": ms, "rc": r.returncode,
+            "git_calls": len(git_lines),
+            "git_cmds": Counter(_git_subcommand(l) for l in git_lines),
+            "api_requests": api_after["requests"] - api_before["requests"],
+            "api_bytes": api_after["request_bytes"] - api_before["request_bytes"],
+            "skip_reason": m.get("skip_reason"),
+            "vulns": m.get("vulns_found") or m.get("high_count") or 0,
+        })
+    return results
+
+
+def summarize(results):
+    by = {}
+    for r in results:
+        by.setdefault(r["event"], []).append(r)
+    out = {}
+    for ev, rs in by.items():
+        lat = sorted(r["ms"] for r in rs)
+        git_cmds = Counter()
+        for r in rs:
+            git_cmds.update(r["git_cmds"])
+        out[ev] = {
+            "n": len(rs),
+            "p50_ms": round(_pct(lat, 0.50), 1),
+            "p95_ms": round(_pct(lat, 0.95), 1),
+            "p99_ms": round(_pct(lat, 0.99), 1),
+            "git_calls_per_event": round(sum(r["git_calls"] for r in rs) / len(rs), 2),
+            "git_calls_max": max(r["git_calls"] for r in rs),
+            "git_top": dict(git_cmds.most_common(6)),
+            "api_requests": sum(r["api_requests"] for r in rs),
+            "api_bytes": sum(r["api_bytes"] for r in rs),
+            "exit_codes": dict(Counter(r["rc"] for r in rs)),
+            "skips": dict(Counter(r["skip_reason"] for r in rs if r["skip_reason"] is not None)),
+        }
+    return out
+
+
+def _print_table(summary, mock_stats):
+    print(f"{'event':26s} {'n':>4s} {'p50ms':>8s} {'p95ms':>8s} {'p99ms':>8s} "
+          f"{'git/evt':>8s} {'api req':>8s} {'api KB':>9s}  exit codes / skips")
+    for ev, s in summary.items():
+        extra = " ".join(f"rc{k}={v}" for k, v in sorted(s["exit_codes"].items()))
+        if s["skips"]:
+            extra += "  skip " + " ".join(f"{k}:{v}" for k, v in s["skips"].items())
+        print(f"{ev:26s} {s['n']:4d} {s['p50_ms']:8.1f} {s['p95_ms']:8.1f} {s['p99_ms']:8.1f} "
+              f"{s['git_calls_per_event']:8.2f} {s['api_requests']:8d} "
+              f"{s['api_bytes'] / 1024:9.1f}  {extra}")
+    for ev, s in summary.items():
+        if s["git_top"]:
+            print(f"  git {ev}: " + ", ".join(f"{k}×{v}" for k, v in s["git_top"].items()))
+    print(f"mock API: {mock_stats['requests']} requests, "
+          f"{mock_stats['request_bytes'] / 1024:.1f} KB sent, "
+          f"~{mock_stats['input_tokens']} input tokens "
+          f"({mock_stats['cache_read_tokens']} cache-read), "
+          f"{mock_stats['injected_429']}×429 / {mock_stats['injected_529']}×529 injected, "
+          f"{mock_stats['findings']} findings returned")
+
+
+def _synthetic_diff(mb, vendored_share=0.8, seed=0):
+    """~`mb` MB of `git diff` output: `vendored_share` of it under
+    node_modules/ (unreviewable), the rest .py source files."""
+    rng = random.Random(seed)
+    out, size, i = [], 0, 0
+    target = int(mb * 1024 * 1024)
+    while size < target:
+        vendored = rng.random() < vendored_share
+        path = (f"node_modules/pkg{i % 97}/lib/m{i}.js" if vendored
+                else f"{_DIRS[i % len(_DIRS)]}/mod{i}.py")
+        lines = [f"diff --git a/{path} b/{path}\n", f"index {i:07x}..{i + 1:07x} 100644\n",
+                 f"--- a/{path}\n", f"+++ b/{path}\n"]
+        for h in range(rng.randint(1, 6)):
+            n = rng.randint(5, 60)
+            lines.append(f"@@ -{h * 100 + 1},{n} +{h * 100 + 1},{n} @@\n")
+            for k in range(n):
+                tag = rng.choice(" +-")
+                lines.append(f"{tag}    value_{k} = compute(request, {rng.random():.6f})\n")
+        chunk = "".join(lines)
+        out.append(chunk)
+        size += len(chunk)
+        i += 1
+    return "".join(out).encode()
+
+
+def bench_diff_parse(mb, repeat=3):
+    import io
+    import gitutil
+
+    data = _synthetic_diff(mb)
+
+    def buffered():
+        return gitutil.parse_diff_into_files(data.decode("utf-8", errors="replace"))
+
+    def streamed():
+        return gitutil.parse_diff_into_files(io.BytesIO(data))
+
+    rows = {}
+    for name, fn in (("buffered", buffered), ("streamed", streamed)):
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            files = fn()
+            times.append(time.perf_counter() - t0)
+        tracemalloc.start()
+        fn()
+        _cur, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rows[name] = {"files": len(files), "ms": round(min(times) * 1000, 1),
+                      "peak_mb": round(peak / 1048576, 1)}
+    return {"diff_mb": round(len(data) / 1048576, 1), **rows}
+
+
+# Modules the per-edit pattern check must not import; security_reminder_hook
+# loads them lazily for the LLM reviews (_ensure_llm, _cached_review).
+_EDIT_PATH_LAZY = ("llm", "review_api", "review_cache", "urllib.request",
+                   "http.client", "concurrent.futures", "tempfile")
+
+
+def _importtime(cmd, **kw):
+    """{module: cumulative us} for the top-level imports `python -X
+    importtime` reports for `cmd`, plus every module name it imported."""
+    r = subprocess.run([sys.executable, "-X", "importtime", *cmd],
+                       capture_output=True, text=True, check=False, **kw)
+    top, names = {}, set()
+    for line in r.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _self, cum, name = line[len("import time:"):].split("|")
+        names.add(name.strip())
+        if not name[1:].startswith(" "):  # nesting indents by two spaces
+            top[name.strip()] = int(cum)
+    return top, names, r
+
+
+def bench_edit_imports(runs=5):
+    """Import cost of the PostToolUse[Edit] hook, against a scratch repo."""
+    tmp = tempfile.mkdtemp(prefix="sg_bench_imp_")
+    try:
+        repo = os.path.join(tmp, "repo")
+        rel = make_repo(repo, 1, 12)[0]
+        home = os.path.join(tmp, "home")
+        state = os.path.join(tmp, "state")
+        os.makedirs(home)
+        os.makedirs(state)
+        # As in run(): no detached Agent SDK venv build competing for CPU.
+        open(os.path.join(state, ".sdk_bootstrap_spawned"), "w").close()
+        env = {k: v for k, v in os.environ.items() if k not in _STRIP_ENV}
+        env.update({"HOME": home, "SECURITY_WARNINGS_STATE_DIR": state,
+                    "SECURITY_GUIDANCE_DEBUG_LOG": os.path.join(tmp, "log.txt"),
+                    "CLAUDE_PROJECT_DIR": repo})
+        payload = json.dumps(_substitute({
+            "session_id": "{session}", "hook_event_name": "PostToolUse",
+            "tool_name": "Edit", "cwd": "{repo}", "tool_use_id": "toolu_bench_imp",
+            "tool_input": {"file_path": "{repo}/" + rel, "old_string": _ANCHOR,
+                           "new_string": _ANCHOR + "\n    return eval(request)"},
+            "tool_response": {},
+        }, repo, "bench-imp"))
+        base, _names, _r = _importtime(["-c", "pass"], env=env)
+        best, lazy = None, set()
+        for _ in range(runs):
+            top, names, r = _importtime([_HOOK], input=payload, env=env, cwd=repo)
+            if r.returncode != 0:
+                raise RuntimeError(f"edit hook exited {r.returncode}: {r.stderr[-500:]}")
+            us = sum(v for k, v in top.items() if k not in base)
+            best = us if best is None else min(best, us)
+            lazy |= names & set(_EDIT_PATH_LAZY)
+            slowest = sorted(((v, k) for k, v in top.items() if k not in base),
+                             reverse=True)[:8]
+        return {"import_ms": round(best / 1000, 1), "lazy_imported": sorted(lazy),
+                "slowest": [(k, round(v / 1000, 1)) for v, k in slowest]}
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _set_rewrite_filter(diff_files):
+    """The set-based filter_preexisting_from_diff that gitutil's counted
+    multiset replaced, as the reference for --rewrite-filter."""
+    out = []
+    for fp, diff_content in diff_files:
+        lines = diff_content.split('\n')
+        removed_lines = set()
+        added_lines = []
+        for line in lines:
+            if line.startswith('-') and not line.startswith('---'):
+                removed_lines.add(line[1:].strip())
+            elif line.startswith('+') and not line.startswith('+++'):
+                added_lines.append(line[1:].strip())
+        if not removed_lines or not any(l in removed_lines for l in added_lines):
+            out.append((fp, diff_content))
+            continue
+        added_set = set(added_lines)
+        new_lines = []
+        for line in lines:
+            if line.startswith('+') and not line.startswith('+++'):
+                if line[1:].strip() in removed_lines:
+                    new_lines.append(' ' + line[1:])
+                    continue
+            elif line.startswith('-') and not line.startswith('---'):
+                if line[1:].strip() in added_set:
+                    continue
+            new_lines.append(line)
+        out.append((fp, '\n'.join(new_lines)))
+    return out
+
+
+# (name, diff, expected) for --rewrite-corpus. expected None: every -/+
+# line is distinct, so the multiset filter must give exactly what the set
+# filter gives. Otherwise the pinned multiset output, for the duplicate-line
+# inputs where a removed line used to mask every re-added copy.
+_REWRITE_CORPUS = (
+    ("empty", "", None),
+    ("new file", "@@ -0,0 +1,3 @@\n+import os\n+\n+x = os.getcwd()\n", None),
+    ("pure deletion", "@@ -1,2 +0,0 @@\n-import os\n-x = 1\n", None),
+    ("context only", "@@ -1,2 +1,2 @@\n import os\n x = 1\n", None),
+    ("one-line edit",
+     "@@ -1,3 +1,3 @@\n import os\n-x = 1\n+x = os.system(cmd)\n y = 2\n", None),
+    ("full rewrite, one new line",
+     "@@ -1,3 +1,4 @@\n-import os\n-def f(a):\n-    return a\n"
+     "+import os\n+def f(a):\n+    os.system(a)\n+    return a\n", None),
+    ("full rewrite, reindented",
+     "@@ -1,2 +1,2 @@\n-def f():\n-  return 1\n+def f():\n+    return 1\n", None),
+    ("rewrite, trailing whitespace",
+     "@@ -1,2 +1,2 @@\n-a = 1   \n-b = 2\n+a = 1\n+b = eval(s)\n", None),
+    ("moved block",
+     "@@ -1,4 +1,4 @@\n-def a():\n-    pass\n-def b():\n-    return 0\n"
+     "+def b():\n+    return 0\n+def a():\n+    pass\n", None),
+    ("two hunks",
+     "@@ -1,2 +1,2 @@\n-x = 1\n+x = 2\n y\n@@ -10,2 +10,3 @@\n z\n-q = 1\n"
+     "+q = 1\n+r = pickle.loads(b)\n", None),
+    ("added line equals a context line",
+     "@@ -1,2 +1,3 @@\n import os\n-x = 1\n+import os\n+x = 1\n", None),
+    ("lines that look like file headers",
+     "@@ -1,2 +1,2 @@\n--- a comment\n-keep = 1\n+++ counter\n+keep = 1\n", None),
+    ("no trailing newline",
+     "@@ -1 +1 @@\n-a = 1\n\\ No newline at end of file\n+a = 1\n+b = 2", None),
+    ("CRLF lines", "@@ -1,2 +1,2 @@\n-a = 1\r\n-b = 2\r\n+a = 1\r\n+c = 3\r\n", None),
+    ("third copy of a line that existed twice",
+     "@@ -1,2 +1,3 @@\n-x = f()\n-x = f()\n+x = f()\n+x = f()\n+x = f()\n",
+     "@@ -1,2 +1,3 @@\n x = f()\n x = f()\n+x = f()\n"),
+    ("blank lines and braces repeated",
+     "@@ -1,3 +1,5 @@\n-if (a) {\n-}\n-\n+if (a) {\n+}\n+\n+if (b) {\n+}\n",
+     "@@ -1,3 +1,5 @@\n if (a) {\n }\n \n+if (b) {\n+}\n"),
+)
+
+
+def check_rewrite_corpus():
+    """Names of _REWRITE_CORPUS cases whose output is wrong, with the
+    reason; [] when every case passes."""
+    import gitutil
+
+    bad = []
+    for name, diff, expected in _REWRITE_CORPUS:
+        got = gitutil.filter_preexisting_from_diff([("f.py", diff)], None, "HEAD")[0][1]
+        if expected is None:
+            if not _distinct_lines(diff):
+                bad.append(f"{name}: has repeated -/+ lines, needs a pinned output")
+            elif got != _set_rewrite_filter([("f.py", diff)])[0][1]:
+                bad.append(f"{name}: differs from the set-based filter")
+        elif got != expected:
+            bad.append(f"{name}: not the pinned multiset output")
+    return bad
+
+
+def _rewrite_diffs(n, seed=0, dup_share=0.2):
+    """`n` full-file-rewrite diffs: every line removed then re-added with a
+    few edits and reindents. `dup_share` of them repeat lines (blank lines,
+    closing braces) the way real files do and paste two more copies of an
+    existing line, which the set filter hides; the rest have distinct
+    lines."""
+    rng = random.Random(seed)
+    files = []
+    for i in range(n):
+        dup = rng.random() < dup_share
+        body = [f"value_{i}_{k} = compute(request, {k})" for k in range(rng.randint(20, 400))]
+        if dup:
+            body = [l for b in body for l in (b, "", "}")]
+        new = [("    " + l if rng.random() < 0.1 else l) for l in body
+               if rng.random() > 0.05]
+        new += [f"added_{i}_{k} = os.system(cmd_{k})" for k in range(rng.randint(1, 10))]
+        if dup:
+            new += [body[0], body[0]]
+        hunk = [f"@@ -1,{len(body)} +1,{len(new)} @@"]
+        hunk += ["-" + l for l in body] + ["+" + l for l in new]
+        files.append((f"app/m{i}.py", "\n".join(hunk) + "\n"))
+    return files
+
+
+def _distinct_lines(content):
+    seen = {"-": set(), "+": set()}
+    for line in content.split("\n"):
+        c = line[:1]
+        if c in seen:
+            k = line[1:].strip()
+            if k in seen[c]:
+                return False
+            seen[c].add(k)
+    return True
+
+
+def bench_rewrite_filter(n, repeat=3):
+    import gitutil
+
+    files = _rewrite_diffs(n)
+    rows = {}
+    for name, fn in (("set", _set_rewrite_filter),
+                     ("multiset", lambda f: gitutil.filter_preexisting_from_diff(f, None, "HEAD"))):
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            out = fn(files)
+            times.append(time.perf_counter() - t0)
+        rows[name] = {"ms": round(min(times) * 1000, 1), "out": out}
+    distinct = [k for k, (_fp, c) in enumerate(files) if _distinct_lines(c)]
+    mismatched = [files[k][0] for k in distinct
+                  if rows["set"]["out"][k] != rows["multiset"]["out"][k]]
+
+    def _plus(out):
+        return sum(c.count("\n+") for _fp, c in out)
+
+    return {"files": n, "lines": sum(c.count("\n") for _fp, c in files),
+            "distinct_files": len(distinct), "mismatched": mismatched,
+            "set_ms": rows["set"]["ms"], "multiset_ms": rows["multiset"]["ms"],
+            "set_added_left": _plus(rows["set"]["out"]),
+            "multiset_added_left": _plus(rows["multiset"]["out"])}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--files", type=int, default=200, help="modules in the scratch repo")
+    ap.add_argument("--file-lines", type=int, default=60, help="approx. lines per module")
+    ap.add_argument("--turns", type=int, default=5)
+    ap.add_argument("--edits", type=int, default=10, help="Edit events per turn")
+    ap.add_argument("--vuln-every", type=int, default=7,
+                    help="every Nth edit adds a marked shell-injection line (0 = never)")
+    ap.add_argument("--latency-ms", type=float, default=800)
+    ap.add_argument("--jitter-ms", type=float, default=0)
+    ap.add_argument("--ms-per-ktok", type=float, default=0)
+    ap.add_argument("--rate-429", type=float, default=0)
+    ap.add_argument("--rate-529", type=float, default=0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--replay", help="JSONL of recorded hook payloads to replay")
+    ap.add_argument("--dump-scenario", help="write the generated payloads as JSONL and exit")
+    ap.add_argument("--worker", action="store_true",
+                    help="route Edit/Write through warm_worker.py (SG_WARM_WORKER=1)")
+    ap.add_argument("--json", action="store_true", help="print the summary as JSON")
+    ap.add_argument("--keep", action="store_true", help="keep the scratch dir")
+    ap.add_argument("--max-git", action="append", default=[], metavar="EVENT=N",
+                    help="exit 1 if any EVENT hook ran more than N git processes (repeatable)")
+    ap.add_argument("--check", action="store_true",
+                    help="apply the checked-in per-event git budgets (_GIT_BUDGETS)")
+    ap.add_argument("--diff-parse", type=float, metavar="MB",
+                    help="benchmark the diff parser on an MB-sized synthetic diff and exit")
+    ap.add_argument("--rewrite-filter", type=int, metavar="N",
+                    help="benchmark and check the rewrite filter on N synthetic files and exit")
+    ap.add_argument("--rewrite-corpus", action="store_true",
+                    help="check the rewrite filter against the fixed corpus and exit")
+    ap.add_argument("--max-import-ms", type=float, metavar="MS",
+                    help="exit 1 if the Edit hook's imports take over MS or load the LLM "
+                         "modules, and exit")
+    ap.add_argument("--import-runs", type=int, default=5,
+                    help="runs for --max-import-ms; the fastest counts")
+    a = ap.parse_args(argv)
+    try:
+        max_git = [(ev, int(n)) for ev, _, n in (m.rpartition("=") for m in a.max_git)]
+    except ValueError:
+        ap.error("--max-git takes EVENT=N")
+    if a.check:
+        max_git = list(_GIT_BUDGETS) + max_git
+
+    if a.rewrite_corpus:
+        bad = check_rewrite_corpus()
+        for msg in bad:
+            print(f"MISMATCH {msg}", file=sys.stderr)
+        print(f"rewrite corpus: {len(_REWRITE_CORPUS) - len(bad)}/{len(_REWRITE_CORPUS)} ok")
+        return 1 if bad else 0
+
+    if a.rewrite_filter:
+        r = bench_rewrite_filter(a.rewrite_filter)
+        if a.json:
+            print(json.dumps(r, indent=2))
+        else:
+            print(f"{r['files']} rewritten files, {r['lines']} diff lines")
+            print(f"  set       {r['set_ms']:>9.1f} ms  {r['set_added_left']} + lines left")
+            print(f"  multiset  {r['multiset_ms']:>9.1f} ms  {r['multiset_added_left']} + lines left")
+            print(f"  identical on {r['distinct_files'] - len(r['mismatched'])}/"
+                  f"{r['distinct_files']} files with distinct -/+ lines")
+            for fp in r["mismatched"][:10]:
+                print(f"  MISMATCH {fp}")
+        return 1 if r["mismatched"] else 0
+
+    if a.max_import_ms is not None:
+        r = bench_edit_imports(a.import_runs)
+        if a.json:
+            print(json.dumps(r, indent=2))
+        else:
+            print(f"edit hook imports: {r['import_ms']:.1f} ms "
+                  f"(budget {a.max_import_ms:.0f} ms, best of {a.import_runs})")
+            for name, ms in r["slowest"]:
+                print(f"  {name:<28} {ms:>7.1f} ms")
+        failed = False
+        if r["import_ms"] > a.max_import_ms:
+            print(f"FAIL edit hook imports took {r['import_ms']:.1f} ms > "
+                  f"--max-import-ms {a.max_import_ms:.0f}", file=sys.stderr)
+            failed = True
+        if r["lazy_imported"]:
+            print(f"FAIL edit hook imported {', '.join(r['lazy_imported'])}", file=sys.stderr)
+            failed = True
+        return 1 if failed else 0
+
+    if a.diff_parse:
+        r = bench_diff_parse(a.diff_parse)
+        if a.json:
+            print(json.dumps(r, indent=2))
+        else:
+            print(f"{r['diff_mb']} MB diff")
+            for name in ("buffered", "streamed"):
+                row = r[name]
+                print(f"  {name:<9} {row['ms']:>9.1f} ms  peak {row['peak_mb']:>7.1f} MB  "
+                      f"{row['files']} reviewable files")
+        return 0
+
+    tmp = tempfile.mkdtemp(prefix="sg_bench_")
+    repo = os.path.join(tmp, "repo")
+    session = "bench-" + uuid.uuid4().hex[:12]
+    try:
+        paths = make_repo(repo, a.files, a.file_lines)
+        if a.replay:
+            with open(a.replay) as f:
+                payloads = [json.loads(l) for l in f if l.strip()]
+        else:
+            payloads = make_scenario(paths, a.turns, a.edits, a.vuln_every, a.seed)
+        if a.dump_scenario:
+            with open(a.dump_scenario, "w") as f:
+                for p in payloads:
+                    f.write(json.dumps(p) + "\n")
+            print(f"wrote {len(payloads)} payloads to {a.dump_scenario}")
+            return 0
+        payloads = [_substitute(p, repo, session) for p in payloads]
+        mock = MockAnthropic(latency_ms=a.latency_ms, jitter_ms=a.jitter_ms,
+                             ms_per_ktok=a.ms_per_ktok, rate_429=a.rate_429,
+                             rate_529=a.rate_529, seed=a.seed).start()
+        try:
+            results = run(payloads, repo, tmp, mock, use_worker=a.worker)
+            summary = summarize(results)
+            over = [(label, s["git_calls_max"], n) for ev, n in max_git
+                    for label, s in summary.items()
+                    if ev in label and s["git_calls_max"] > n]
+            if a.json:
+                print(json.dumps({"summary": summary, "mock": mock.snapshot()}, indent=2))
+            else:
+                print(f"repo: {a.files} files, {len(payloads)} hook events, "
+                      f"model latency {a.latency_ms:.0f}ms")
+                _print_table(summary, mock.snapshot())
+            for label, got, n in over:
+                print(f"FAIL {label}: {got} git processes > --max-git {n}", file=sys.stderr)
+            if over:
+                return 1
+        finally:
+            mock.stop()
+    finally:
+        if a.keep:
+            print(f"scratch dir kept: {tmp}", file=sys.stderr)
+        else:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,16 +6,21 @@ there so callers keep resolving bare names through the hook module's
 globals — tests that ``monkeypatch.setattr(hook, "<fn>", …)`` continue
 to work without retargeting.
 """
+import contextlib
+import json
 import os
 import subprocess
+import time
 
 from _base import debug_log, _PV
+from tracing import traced
 from gitutil import (
     GIT_CMD,
-    _git_dir, _git_toplevel, _git_status_porcelain,
-    _git_rev_parse_head, _is_ancestor, _git_name_only,
+    _git_dir, _git_toplevel, _git_status_v2, _is_ancestor, _git_name_only,
+    _git_rev_parse_head, _git_worktree_dir,
+    git_object_reader, git_patch_ids, run_concurrently,
 )
-from session_state import with_locked_state
+from session_state import get_state_file, with_locked_state
 
 
 # =====================================================================
@@ -71,6 +76,7 @@ def record_touched_path(session_id, file_path):
     with_locked_state(session_id, _record)
 
 
+@traced()
 def consume_stop_state(session_id):
     """Atomically snapshot all state the Stop hook needs and clear touched_paths.
 
@@ -95,10 +101,7 @@ def consume_stop_state(session_id):
             "touched_paths": list(state.get("touched_paths", [])),
             "baseline_sha": state.get("baseline_sha"),
             "head_at_capture": state.get("head_at_capture"),
-            "untracked_at_baseline": (
-                dict(state["untracked_at_baseline"])
-                if isinstance(state.get("untracked_at_baseline"), dict) else {}
-            ),
+            "untracked_at_baseline": get_untracked_baseline(state, session_id),
             "fire_count": 0 if expired else state.get("stop_hook_fire_count", 0),
             "fire_count_expired": expired and state.get("stop_hook_fire_count", 0) > 0,
             "previous_findings": [] if findings_expired else list(state.get("previous_findings", [])),
@@ -137,6 +140,7 @@ def restore_unreviewed_stop_state(session_id, paths, baseline_sha):
     with_locked_state(session_id, _restore)
 
 
+@traced()
 def get_baseline_file_content(session_id, file_path, cwd):
     """Get the content of a file at the baseline SHA. Returns None if unavailable.
 
@@ -159,6 +163,18 @@ def get_baseline_file_content(session_id, file_path, cwd):
             rel_path = os.path.relpath(abs_path, cwd_abs)
         except ValueError:
             return None
+        # Persistent cat-file reader first (no fork per Write); any transport
+        # failure falls through to the one-shot `git show` below.
+        reader = git_object_reader(cwd_abs)
+        if reader is not None:
+            try:
+                obj = reader.read(f"{baseline_sha}:{rel_path}")
+            except OSError:
+                pass
+            else:
+                if obj is None or obj[1] != "blob":
+                    return None
+                return obj[2].decode("utf-8", errors="replace")
         result = subprocess.run(
             [*GIT_CMD, "show", f"{baseline_sha}:{rel_path}"],
             cwd=cwd, capture_output=True, timeout=5
@@ -170,6 +186,73 @@ def get_baseline_file_content(session_id, file_path, cwd):
         return None
 
 
+def get_baseline_blob_oid(session_id, file_path, cwd):
+    """Object id of `file_path` at the baseline SHA (`git rev-parse
+    <sha>:<path>`), or None if there is no baseline, the path isn't a blob
+    there, or git can't answer. Goes through the persistent cat-file reader
+    when available — a --batch-check lookup, no blob read."""
+    baseline_sha = load_baseline_sha(session_id)
+    if not baseline_sha:
+        return None
+    try:
+        abs_path = os.path.abspath(file_path)
+        cwd_abs = os.path.abspath(cwd) if cwd else os.getcwd()
+        try:
+            rel_path = os.path.relpath(abs_path, cwd_abs)
+        except ValueError:
+            return None
+        name = f"{baseline_sha}:{rel_path}"
+        reader = git_object_reader(cwd_abs)
+        if reader is not None:
+            try:
+                obj = reader.resolve(name)
+            except OSError:
+                pass
+            else:
+                return obj[0] if obj is not None and obj[1] == "blob" else None
+        # See #2099: bytes stdout, decoded manually.
+        result = subprocess.run(
+            [*GIT_CMD, "rev-parse", "--verify", "-q", f"{name}^{{blob}}"],
+            cwd=cwd, capture_output=True, timeout=5
+        )
+        if result.returncode == 0:
+            return result.stdout.decode("utf-8", errors="replace").strip() or None
+        return None
+    except (subprocess.TimeoutExpired, FileNotFoundError, OSError, ValueError):
+        return None
+
+
+# Per-session memo of which pattern rules a baseline blob matches, so a file
+# rewritten many times in one turn is scanned at its baseline only once. Keyed
+# "<rule-set version>:<blob oid>" — a changed security-patterns file or
+# built-in list yields a new version and simply misses. Bounded; oldest
+# entries go first.
+BASELINE_VERDICTS_MAX = 256
+
+
+def load_baseline_verdict(session_id, key):
+    """Cached list of content-matched rule names for `key`, or None."""
+    def _load(state):
+        v = (state.get("baseline_verdicts") or {}).get(key)
+        return v if isinstance(v, list) else None
+    return with_locked_state(session_id, _load)
+
+
+def save_baseline_verdict(session_id, key, rule_names):
+    """Record the content-matched rule names for `key`."""
+    def _save(state):
+        verdicts = state.get("baseline_verdicts")
+        if not isinstance(verdicts, dict):
+            verdicts = {}
+        verdicts.pop(key, None)
+        verdicts[key] = list(rule_names)
+        for old in list(verdicts)[:max(0, len(verdicts) - BASELINE_VERDICTS_MAX)]:
+            del verdicts[old]
+        state["baseline_verdicts"] = verdicts
+    with_locked_state(session_id, _save)
+
+
+@traced()
 def capture_git_baseline(cwd):
     """
     Capture a git ref representing the current working tree state.
@@ -190,11 +273,8 @@ def capture_git_baseline(cwd):
     # leniently for symmetry with _list_untracked. See #2056.
     try:
         # Check if HEAD exists (i.e., repo has at least one commit)
-        head_check = subprocess.run(
-            [*GIT_CMD, "rev-parse", "HEAD"],
-            cwd=cwd, capture_output=True, timeout=5
-        )
-        if head_check.returncode != 0:
+        head = _git_rev_parse_head(cwd)
+        if not head:
             # No commits yet — skip review rather than creating commits in the user's repo
             debug_log("No commits in repo, skipping baseline capture")
             return None
@@ -208,31 +288,108 @@ def capture_git_baseline(cwd):
             return sha
 
         # Working tree is clean — stash create returns empty. Use HEAD.
-        result = subprocess.run(
-            [*GIT_CMD, "rev-parse", "HEAD"],
-            cwd=cwd, capture_output=True, timeout=5
-        )
-        sha = (result.stdout or b"").decode("utf-8", errors="replace").strip()
-        return sha if sha else None
+        return head
     except (subprocess.TimeoutExpired, FileNotFoundError, OSError, ValueError) as e:
         debug_log(f"Failed to capture git baseline: {e}")
         return None
 
 
-# ─── push-sweep reviewed-commit tracking ────────────────────────────────────
+# ─── deferred baseline capture (SG_ASYNC_BASELINE) ──────────────────────────
 #
-# Repo-local (not session-local) record of which commits the commit-review
-# hook has already reviewed, so the push-sweep can advance its diff base past
-# the contiguous reviewed prefix and skip entirely when everything pushed was
-# already covered. Lives under `.git/` (same precedent as CC's
-# `.git/claude-trailers`) so it survives across sessions and is per-clone.
+# `git stash create` + `_list_untracked` walk the whole worktree, and UPS
+# blocks the user's prompt on them — seconds per prompt in a very large
+# repo. With SG_ASYNC_BASELINE=1, UPS instead writes HEAD as the baseline
+# plus a `baseline_pending` marker {token, ts, head} and spawns a detached
+# `security_reminder_hook.py --capture-baseline` that runs both walks and
+# lands the result under the session lock via land_deferred_baseline.
 #
-# Format: one line per reviewed sha, append-only:
-#   <40-hex-sha>\t<unix-ts>\t<pv>\t<vulns_found>
+# Until it lands the state holds the degraded baseline: HEAD (so the diff
+# also covers tracked changes that predate the prompt) and the previous
+# turn's untracked snapshot. Stop waits up to SG_ASYNC_BASELINE_WAIT_S for
+# the capture and otherwise reviews against that degraded baseline —
+# more to review, never less.
 #
-# The trailing columns are observability only — load reads just the sha set.
-# GC keeps the last _REVIEWED_SHAS_CAP entries; the file is small (~64 bytes
-# per line) so even at the cap it's ~32KB.
+# The capture is discarded (the degraded baseline stays) when:
+#   - a newer UPS or a Stop that gave up waiting replaced the marker,
+#   - touched_paths is non-empty or HEAD moved by the time it lands — an
+#     edit or commit may have happened before `stash create` ran, and a
+#     stash that contains Claude's own edit would hide it from review.
+# Files written only through Bash aren't recorded in touched_paths, so a
+# Bash edit that lands before the capture finishes can slip into the
+# baseline; the model's first tool call normally comes well after it.
+
+ASYNC_BASELINE = os.environ.get("SG_ASYNC_BASELINE", "").strip().lower() in ("1", "on")
+ASYNC_BASELINE_WAIT_S = float(os.environ.get("SG_ASYNC_BASELINE_WAIT_S", "5"))
+# A marker older than this belongs to a capture that died (killed, crashed);
+# Stop doesn't wait on it.
+_ASYNC_BASELINE_STALE_S = 300
+_ASYNC_BASELINE_POLL_S = 0.05
+
+
+def land_deferred_baseline(session_id, cwd, token):
+    """Body of the detached `--capture-baseline` process. Returns the
+    outcome ("landed" / "superseded" / "raced") for the debug log."""
+    sha, untracked = run_concurrently(
+        lambda: capture_git_baseline(cwd),
+        lambda: _list_untracked(cwd),
+    )
+    head_now = _git_rev_parse_head(cwd)
+
+    def _land(state):
+        pending = state.get("baseline_pending")
+        if not isinstance(pending, dict) or pending.get("token") != token:
+            return "superseded"
+        state.pop("baseline_pending", None)
+        if state.get("touched_paths") or head_now != pending.get("head"):
+            return "raced"
+        if sha:
+            state["baseline_sha"] = sha
+        set_untracked_baseline(state, session_id, untracked)
+        return "landed"
+    outcome = with_locked_state(session_id, _land) or "lock_failed"
+    debug_log(f"Deferred baseline capture: {outcome}"
+              + (f" ({sha[:12]})" if sha and outcome == "landed" else ""))
+    return outcome
+
+
+@traced()
+def await_baseline_capture(session_id, timeout=None):
+    """Block until a pending deferred capture lands, up to `timeout`
+    seconds (default SG_ASYNC_BASELINE_WAIT_S).
+
+    Returns (waited_ms, degraded): (None, False) when nothing was pending.
+    On timeout the marker is cleared so a late capture can't overwrite the
+    baseline this Stop has already reviewed against."""
+    import time as _time
+    if timeout is None:
+        timeout = ASYNC_BASELINE_WAIT_S
+    t0 = _time.time()
+
+    def _pending(state):
+        p = state.get("baseline_pending")
+        return p if isinstance(p, dict) else None
+
+    pending = with_locked_state(session_id, _pending)
+    if not pending:
+        return None, False
+    token = pending.get("token")
+    deadline = min(t0 + timeout, (pending.get("ts") or 0) + _ASYNC_BASELINE_STALE_S)
+    while _time.time() < deadline:
+        _time.sleep(_ASYNC_BASELINE_POLL_S)
+        p = with_locked_state(session_id, _pending)
+        if not p or p.get("token") != token:
+            return round((_time.time() - t0) * 1000), False
+
+    def _give_up(state):
+        p = state.get("baseline_pending")
+        if isinstance(p, dict) and p.get("token") == token:
+            state.pop("baseline_pending", None)
+            return True
+        return False  # landed between the last poll and now
+    degraded = bool(with_locked_state(session_id, _give_up))
+    if degraded:
+        debug_log("Stop: deferred baseline capture not done, reviewing against HEAD")
+    return round((_time.time() - t0) * 1000), degraded
 
 
 # =====================================================================
@@ -244,54 +401,222 @@ def capture_git_baseline(cwd):
 # Repo-local (not session-local) record of which commits the commit-review
 # hook has already reviewed, so the push-sweep can advance its diff base past
 # the contiguous reviewed prefix and skip entirely when everything pushed was
-# already covered. Lives under `.git/` (same precedent as CC's
-# `.git/claude-trailers`) so it survives across sessions and is per-clone.
+# already covered. Lives in the shared gitdir (`--git-common-dir`, same
+# precedent as CC's `.git/claude-trailers`) so it survives across sessions
+# and every worktree of a clone sees it.
 #
-# Format: one line per reviewed sha, append-only:
-#   <40-hex-sha>\t<unix-ts>\t<pv>\t<vulns_found>
+# Store: `sg-reviewed.sqlite3`, one WAL-mode table keyed by sha:
+#   reviewed(sha PRIMARY KEY, ts, pv, vulns, patch_id)   + indexes on ts
+#   and patch_id
+# Callers pass the candidate shas (reflog-fresh commits, the pushed range),
+# so a lookup is a handful of primary-key probes instead of reading the
+# whole history. Candidates that miss by sha are matched on
+# `git patch-id --stable` (gitutil.git_patch_ids, one pipeline for all of
+# them), so a rebased stack, a cherry-pick or a content-free amend of
+# reviewed commits counts as reviewed. The commit review computes those
+# ids itself, after its numstat plan and only for commits of at most
+# _PATCH_ID_MAX_LINES changed lines, and hands the same map to the lookup
+# and the append, so no commit's full patch is generated twice and a
+# vendoring commit's never is. An append is one INSERT OR REPLACE
+# under SQLite's own
+# write lock — safe across concurrent sessions, Windows included. Rows older
+# than SG_REVIEWED_RETENTION_DAYS (default 180) are pruned on append; there
+# is no count cap, so heavy committers don't age out a week's history.
 #
-# The trailing columns are observability only — load reads just the sha set.
-# GC keeps the last _REVIEWED_SHAS_CAP entries; the file is small (~64 bytes
-# per line) so even at the cap it's ~32KB.
+# The legacy flat file `sg-reviewed-shas` (<sha>\t<ts>\t<pv>\t<vulns> per
+# line, capped at _REVIEWED_SHAS_CAP) is imported whenever its mtime differs
+# from the last import, so commits reviewed by an older plugin version in
+# another session still count. Without sqlite3 (some minimal Python builds)
+# the flat file remains the store.
 
 _REVIEWED_SHAS_BASENAME = "sg-reviewed-shas"
 _REVIEWED_SHAS_CAP = 500
+_REVIEWED_DB_BASENAME = "sg-reviewed.sqlite3"
+_REVIEWED_RETENTION_S = int(float(os.environ.get("SG_REVIEWED_RETENTION_DAYS", "180")) * 86400)
+_REVIEWED_BUSY_TIMEOUT_S = 10.0
+_HEX = frozenset("0123456789abcdef")
+
+
+def _is_full_sha(s):
+    return len(s) == 40 and _HEX.issuperset(s)
+
 
 def _reviewed_shas_path(repo_root):
     gd = _git_dir(repo_root)
     return os.path.join(gd, _REVIEWED_SHAS_BASENAME) if gd else None
 
 
-def _load_reviewed_shas(repo_root):
-    """Set of full 40-hex shas previously reviewed in this clone."""
-    p = _reviewed_shas_path(repo_root)
-    if not p or not os.path.exists(p):
-        return set()
-    out = set()
+def _read_flat_reviewed(p):
+    """[(sha, ts, pv, vulns)] from a legacy flat file; [] if missing."""
+    rows = []
     try:
         with open(p, "r") as f:
             for line in f:
-                sha = line.split("\t", 1)[0].strip()
-                if len(sha) == 40 and all(c in "0123456789abcdef" for c in sha):
-                    out.add(sha)
+                cols = line.rstrip("\n").split("\t")
+                sha = cols[0].strip()
+                if not _is_full_sha(sha):
+                    continue
+                try:
+                    ts, pv, vulns = int(cols[1]), str(cols[2]), int(cols[3])
+                except (IndexError, ValueError):
+                    ts, pv, vulns = int(time.time()), "", 0
+                rows.append((sha, ts, pv, vulns))
     except OSError:
         pass
-    return out
+    return rows
+
+
+def _reviewed_db(repo_root):
+    """Open the reviewed-commit store for repo_root's clone, importing the
+    legacy flat file if it changed. None when sqlite3 is unavailable or the
+    database can't be opened (callers fall back to the flat file)."""
+    gd = _git_dir(repo_root)
+    if not gd:
+        return None
+    try:
+        import sqlite3
+    except ImportError:
+        return None
+    conn = None
+    try:
+        conn = sqlite3.connect(os.path.join(gd, _REVIEWED_DB_BASENAME),
+                               timeout=_REVIEWED_BUSY_TIMEOUT_S, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS reviewed (sha TEXT PRIMARY KEY, "
+                     "ts INTEGER NOT NULL, pv TEXT, vulns INTEGER, patch_id TEXT) WITHOUT ROWID")
+        if "patch_id" not in {r[1] for r in conn.execute("PRAGMA table_info(reviewed)")}:
+            try:
+                conn.execute("ALTER TABLE reviewed ADD COLUMN patch_id TEXT")
+            except sqlite3.OperationalError:
+                pass  # a concurrent opener added it first
+        conn.execute("CREATE INDEX IF NOT EXISTS reviewed_ts ON reviewed (ts)")
+        conn.execute("CREATE INDEX IF NOT EXISTS reviewed_patch ON reviewed (patch_id)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+        flat = os.path.join(gd, _REVIEWED_SHAS_BASENAME)
+        try:
+            flat_mtime = str(os.stat(flat).st_mtime_ns)
+        except OSError:
+            flat_mtime = None
+        if flat_mtime is not None:
+            row = conn.execute("SELECT v FROM meta WHERE k = 'flat_mtime'").fetchone()
+            if not row or row[0] != flat_mtime:
+                rows = _read_flat_reviewed(flat)
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany("INSERT OR IGNORE INTO reviewed (sha, ts, pv, vulns) "
+                                     "VALUES (?, ?, ?, ?)", rows)
+                    conn.execute("INSERT OR REPLACE INTO meta (k, v) VALUES ('flat_mtime', ?)",
+                                 (flat_mtime,))
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                debug_log(f"reviewed-shas: imported {len(rows)} from {_REVIEWED_SHAS_BASENAME}")
+        return conn
+    except sqlite3.Error as e:
+        debug_log(f"reviewed-shas: sqlite store unavailable ({e}), using flat file")
+        if conn is not None:
+            conn.close()
+        return None
+
+
+def _in_chunks(conn, sql, values):
+    """Rows of `sql` (one `{}` placeholder for an IN list) over `values`,
+    500 at a time to stay under SQLite's bound-parameter limit."""
+    for i in range(0, len(values), 500):
+        chunk = values[i:i + 500]
+        yield from conn.execute(sql.format(",".join("?" * len(chunk))), chunk)
+
+
+def _load_reviewed_shas(repo_root, candidates=None, patch_ids=None):
+    """Shas previously reviewed in this clone — restricted to `candidates`
+    (full or abbreviated; returned as given) when given, otherwise every
+    full sha in the retained history. A candidate counts as reviewed when
+    its sha or its patch-id was recorded.
+
+    `patch_ids` is the caller's {full sha: patch-id} for the candidates it
+    has already sized up (git_patch_ids); only those are matched by
+    patch-id, and nothing is computed here. None computes them for every
+    sha miss, once any recorded row has a patch-id."""
+    conn = _reviewed_db(repo_root)
+    if conn is not None:
+        try:
+            with contextlib.closing(conn):
+                if candidates is None:
+                    return {r[0] for r in conn.execute("SELECT sha FROM reviewed")}
+                want = list(dict.fromkeys(s for s in candidates if s))
+                out = {r[0] for r in _in_chunks(
+                    conn, "SELECT sha FROM reviewed WHERE sha IN ({})", want)}
+                rest = [s for s in want if s not in out]
+                if patch_ids is not None:
+                    pids = patch_ids
+                elif rest and conn.execute(
+                        "SELECT 1 FROM reviewed WHERE patch_id IS NOT NULL LIMIT 1").fetchone():
+                    pids = git_patch_ids(repo_root, rest) or {}
+                else:
+                    pids = {}
+                if rest and pids:
+                    seen = {r[0] for r in _in_chunks(
+                        conn, "SELECT DISTINCT patch_id FROM reviewed WHERE patch_id IN ({})",
+                        list(set(pids.values())))}
+                    for s in rest:
+                        if any(full.startswith(s) and pid in seen for full, pid in pids.items()):
+                            out.add(s)
+                return out
+        except Exception as e:
+            debug_log(f"reviewed-shas: lookup failed ({e}), using flat file")
+    p = _reviewed_shas_path(repo_root)
+    if not p or not os.path.exists(p):
+        return set()
+    out = {row[0] for row in _read_flat_reviewed(p)}
+    return out if candidates is None else out.intersection(candidates)
+
+
+def _append_reviewed_shas(repo_root, shas, vulns_found=0, patch_ids=None):
+    """Record that `shas` (full 40-hex) were reviewed, with their patch-ids.
+    `patch_ids` is the caller's {full sha: patch-id}, as handed to
+    _load_reviewed_shas: shas missing from it are stored without one rather
+    than paying another `git log -p`. None computes them here. Best-effort;
+    never raises."""
+    if not shas:
+        return
+    import time as _time
+    ts = int(_time.time())
+    pv = _PV or 0
+    conn = _reviewed_db(repo_root)
+    if conn is not None:
+        try:
+            with contextlib.closing(conn):
+                pids = (patch_ids if patch_ids is not None
+                        else git_patch_ids(repo_root, shas) or {})
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO reviewed (sha, ts, pv, vulns, patch_id) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        [(s, ts, str(pv), int(vulns_found), pids.get(s)) for s in shas])
+                    conn.execute("DELETE FROM reviewed WHERE ts < ?", (ts - _REVIEWED_RETENTION_S,))
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            return
+        except Exception as e:
+            debug_log(f"reviewed-shas: append failed ({e}), using flat file")
+    _append_reviewed_shas_flat(repo_root, shas, ts, pv, vulns_found)
 
 
-def _append_reviewed_shas(repo_root, shas, vulns_found=0):
-    """Record that `shas` were reviewed. Best-effort; never raises.
+def _append_reviewed_shas_flat(repo_root, shas, ts, pv, vulns_found):
+    """Legacy flat-file append (no sqlite3).
 
     Uses fcntl.flock for the read-gc-write; appends are O_APPEND-atomic but
     GC needs the lock so concurrent CC sessions in the same clone don't race
     each other's truncation.
     """
     p = _reviewed_shas_path(repo_root)
-    if not p or not shas:
+    if not p:
         return
-    import time as _time
-    ts = int(_time.time())
-    pv = _PV or 0
     lines = [f"{s}\t{ts}\t{pv}\t{int(vulns_found)}\n" for s in shas]
     try:
         import fcntl
@@ -328,17 +653,246 @@ def _append_reviewed_shas(repo_root, shas, vulns_found=0):
 # v2 review-set computation (Stop hook)
 # =====================================================================
 
+# Inline limit for the untracked snapshot in session state. Every hook call
+# reads and (JSON backend) rewrites the whole state file, so a larger
+# snapshot is kept in a side file instead (set_untracked_baseline) rather
+# than truncated — a truncated baseline made every file past the cap look
+# new to Stop.
 UNTRACKED_BASELINE_CAP = 2000
 
 
+# ─── incremental untracked snapshot ─────────────────────────────────────────
+#
+# `ls-files --others` readdir()s every non-ignored directory in the worktree
+# on every prompt. A directory's mtime changes exactly when an entry is
+# created, removed or renamed in it, so a per-worktree snapshot file
+# (`<gitdir>/sg-untracked-snapshot.json`) records:
+#   dirs     every non-ignored directory in the worktree → mtime_ns
+#   ignores  directories with a .gitignore → that file's mtime_ns
+#   files    the untracked paths found
+# and the next call stats those directories and re-asks git only about the
+# subtrees under the ones that changed: one scoped `git status -uall
+# --ignored=matching` lists their untracked files and the directories an
+# ignore rule matches, and an os.scandir walk that skips those collects
+# `dirs`. (`ls-files -o -i --directory` would also report a directory that
+# merely holds only ignored files, which must still be watched.) Every
+# directory has to be stamped, not only the parents of listed files — a
+# new file in an empty directory, or in one that holds only ignored files,
+# would otherwise go unseen. Ignore rules and index
+# membership stay git's call. With core.untrackedCache enabled git applies
+# the same trick inside each scoped walk. Nested repositories and
+# submodules are not walked; the outer repo's ls-files doesn't look inside
+# them either.
+#
+# Not noticed until the next full rescan (after _UNTRACKED_FULL_RESCAN_S, or
+# when .git/info/exclude changes): a global excludes file change, and
+# `git rm --cached` of a file in an otherwise unchanged directory. Both only
+# make Stop review a file it could have skipped. Files staged with `git add`
+# linger in the snapshot until their directory changes, which is harmless —
+# compute_v2_review_set only looks baseline entries up for paths that are
+# untracked now. Every listed file is still re-stat'ed on each call so an
+# edit between turns is not mistaken for an edit during the turn.
+#
+# A directory whose mtime is within _UNTRACKED_RACY_NS of the scan is stored
+# as -1 (always rescanned next time): an entry created in the same mtime
+# tick as the walk would otherwise go unseen.
+#
+# SG_UNTRACKED_SNAPSHOT=0 goes back to one full `ls-files --others` per call.
+
+UNTRACKED_SNAPSHOT = os.environ.get("SG_UNTRACKED_SNAPSHOT", "1").strip().lower() not in ("0", "off")
+_UNTRACKED_SNAPSHOT_BASENAME = "sg-untracked-snapshot.json"
+_UNTRACKED_SNAPSHOT_VERSION = 2
+_UNTRACKED_FULL_RESCAN_S = 3600
+_UNTRACKED_RACY_NS = 2_000_000_000
+# More changed subtrees than this → one full walk instead of a huge pathspec.
+_UNTRACKED_MAX_PREFIXES = 200
+
+
+def _ls_files_z(repo, args, prefixes):
+    """`git ls-files -z <args>` over the `prefixes` subtrees ("" = whole
+    repo). Returns the repo-relative paths, or None on failure."""
+    spec = []
+    if "" not in prefixes:
+        spec = ["--"] + [f":(top,literal){p}/" for p in prefixes]
+    r = subprocess.run([*GIT_CMD, "ls-files", "-z", *args, *spec],
+                       cwd=repo, capture_output=True, timeout=15)
+    if r.returncode != 0:
+        stderr_str = (r.stderr or b"").decode("utf-8", errors="replace")
+        debug_log(f"_ls_files_z rc={r.returncode}: {stderr_str[:200]}")
+        return None
+    return [p for p in (r.stdout or b"").decode("utf-8", errors="replace").split("\0") if p]
+
+
+def _status_others(repo, prefixes):
+    """One `git status -uall --ignored=matching` over the `prefixes`
+    subtrees → (untracked paths, ignored directories), or None on failure.
+    matching mode names an ignored directory only when a rule matches the
+    directory itself, and then nothing under it."""
+    spec = []
+    if "" not in prefixes:
+        spec = ["--"] + [f":(top,literal){p}/" for p in prefixes]
+    r = subprocess.run([*GIT_CMD, "status", "--porcelain=v2", "-z", "-uall",
+                        "--ignored=matching", *spec],
+                       cwd=repo, capture_output=True, timeout=15)
+    if r.returncode != 0:
+        stderr_str = (r.stderr or b"").decode("utf-8", errors="replace")
+        debug_log(f"_status_others rc={r.returncode}: {stderr_str[:200]}")
+        return None
+    untracked, ignored = [], set()
+    entries = (r.stdout or b"").decode("utf-8", errors="replace").split("\0")
+    i = 0
+    while i < len(entries):
+        e = entries[i]
+        i += 1
+        if e.startswith("? "):
+            untracked.append(e[2:])
+        elif e.startswith("! ") and e.endswith("/"):
+            ignored.add(e[2:-1])
+        elif e.startswith("2 "):
+            i += 1  # rename/copy: the original path follows as its own entry
+    return untracked, ignored
+
+
+def _under(path, prefix):
+    return not prefix or path == prefix or path.startswith(prefix + "/")
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _outermost(dirs):
+    """Drop every directory that sits under another one in `dirs`."""
+    out = []
+    for d in sorted(set(dirs)):
+        if not out or not _under(d, out[-1]):
+            out.append(d)
+    return out
+
+
+def _walk_dirs(repo, prefix, ignored):
+    """Yield `prefix` and every directory under it, repo-relative, skipping
+    `ignored` subtrees, .git and nested repositories."""
+    stack = [prefix]
+    while stack:
+        rel = stack.pop()
+        try:
+            with os.scandir(os.path.join(repo, rel) if rel else repo) as it:
+                entries = [e for e in it if e.is_dir(follow_symlinks=False)]
+        except OSError:
+            continue
+        yield rel
+        for e in entries:
+            child = f"{rel}/{e.name}" if rel else e.name
+            if e.name == ".git" or child in ignored:
+                continue
+            if os.path.lexists(os.path.join(e.path, ".git")):
+                continue
+            stack.append(child)
+
+
+def _untracked_snapshot_scan(repo, gitdir):
+    """Untracked path → mtime_ns via the snapshot file, or None when git
+    failed (the caller then does a plain full listing)."""
+    snap_path = os.path.join(gitdir, _UNTRACKED_SNAPSHOT_BASENAME)
+    try:
+        with open(snap_path, encoding="utf-8") as f:
+            snap = json.load(f)
+        if not isinstance(snap, dict):
+            snap = None
+    except (OSError, ValueError):
+        snap = None
+    now = time.time()
+    sig = _mtime_ns(os.path.join(gitdir, "info", "exclude")) or 0
+    full = (not snap or snap.get("v") != _UNTRACKED_SNAPSHOT_VERSION
+            or snap.get("repo") != repo or snap.get("sig") != sig
+            or now - (snap.get("full_ts") or 0) > _UNTRACKED_FULL_RESCAN_S)
+    if full:
+        prefixes = [""]
+        dirs, ignores, files, full_ts = {}, {}, [], now
+    else:
+        dirs, ignores, files = snap.get("dirs", {}), snap.get("ignores", {}), snap.get("files", [])
+        full_ts = snap["full_ts"]
+        changed = []
+        for d, m in dirs.items():
+            cur = _mtime_ns(os.path.join(repo, d) if d else repo)
+            if cur is None:
+                changed.append(os.path.dirname(d))
+            elif cur != m:
+                changed.append(d)
+        for d, m in ignores.items():
+            if _mtime_ns(os.path.join(repo, d, ".gitignore")) != m:
+                changed.append(d)
+        prefixes = _outermost(changed)
+        if len(prefixes) > _UNTRACKED_MAX_PREFIXES:
+            prefixes = [""]
+            dirs, ignores, files, full_ts = {}, {}, [], now
+
+    if prefixes:
+        walk_ns = time.time_ns()
+        listed = _status_others(repo, prefixes)
+        if listed is None:
+            return None
+        others, ignored = listed
+
+        # Also when the root itself changed: its entries are all re-listed.
+        def _keep(p):
+            return not any(_under(p, pre) for pre in prefixes)
+        dirs = {d: m for d, m in dirs.items() if _keep(d)}
+        ignores = {d: m for d, m in ignores.items() if _keep(d)}
+        files = [p for p in files if _keep(p)]
+
+        def _stamp(path):
+            m = _mtime_ns(path)
+            return -1 if m is None or m >= walk_ns - _UNTRACKED_RACY_NS else m
+
+        # Ancestors above a rescanned prefix keep their own (unchanged)
+        # entry; stamping them now could hide a change made since.
+        for pre in prefixes:
+            if pre in ignored:
+                continue
+            for d in _walk_dirs(repo, pre, ignored):
+                full_d = os.path.join(repo, d) if d else repo
+                dirs[d] = _stamp(full_d)
+                gi = os.path.join(full_d, ".gitignore")
+                if os.path.isfile(gi):
+                    ignores[d] = _stamp(gi)
+        files.extend(others)
+        scope = "worktree" if "" in prefixes else f"{len(prefixes)} subtree(s)"
+        debug_log(f"_list_untracked: rescanned {scope}, {len(others)} untracked")
+
+    out = {}
+    for p in dict.fromkeys(files):
+        out[p] = _mtime_ns(os.path.join(repo, p)) or 0
+    if prefixes:
+        tmp = f"{snap_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"v": _UNTRACKED_SNAPSHOT_VERSION, "repo": repo, "sig": sig,
+                           "full_ts": full_ts, "dirs": dirs, "ignores": ignores,
+                           "files": list(out)}, f)
+            os.replace(tmp, snap_path)
+        except OSError as e:
+            debug_log(f"_list_untracked: snapshot write failed: {e}")
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
+    return out
+
+
+@traced()
 def _list_untracked(cwd):
     """Repo-root-relative untracked (and not-ignored) path → mtime_ns, or {}
     on error. Used at UPS to snapshot the pre-turn untracked set so the Stop
     hook can exclude unchanged pre-existing untracked files from review.
     mtime is captured so an in-place edit during the turn is still reviewed.
 
-    Uses ls-files (not status) for the UPS path: the index diff isn't needed,
-    and ls-files --others only walks the worktree against .gitignore.
+    Incremental through the per-worktree snapshot file (see above); falls
+    back to one full `ls-files --others` — not status: the index diff isn't
+    needed, and ls-files --others only walks the worktree against
+    .gitignore.
 
     Decodes stdout/stderr as UTF-8 with errors="replace" instead of using
     text=True. With core.quotePath=false git emits raw UTF-8 bytes for
@@ -355,34 +909,70 @@ def _list_untracked(cwd):
     the holdouts."""
     try:
         repo = _git_toplevel(cwd) or cwd
+        if UNTRACKED_SNAPSHOT:
+            gitdir = _git_worktree_dir(repo)
+            if gitdir:
+                try:
+                    out = _untracked_snapshot_scan(repo, gitdir)
+                    if out is not None:
+                        return out
+                except (subprocess.TimeoutExpired, OSError, ValueError, KeyError, TypeError) as e:
+                    debug_log(f"_list_untracked: snapshot failed ({e!r}), full listing")
         # core.quotePath=false comes from GIT_CMD globally (see gitutil.py).
-        r = subprocess.run(
-            [*GIT_CMD, "ls-files", "--others", "--exclude-standard", "-z"],
-            cwd=repo, capture_output=True, timeout=15,
-        )
-        if r.returncode != 0:
-            stderr_str = (r.stderr or b"").decode("utf-8", errors="replace")
-            debug_log(f"_list_untracked rc={r.returncode}: {stderr_str[:200]}")
+        paths = _ls_files_z(repo, ["--others", "--exclude-standard"], [""])
+        if paths is None:
             return {}
-        stdout = (r.stdout or b"").decode("utf-8", errors="replace")
-        out = {}
-        for p in stdout.split("\0"):
-            if not p:
-                continue
-            try:
-                out[p] = os.stat(os.path.join(repo, p)).st_mtime_ns
-            except OSError:
-                out[p] = 0
-            if len(out) >= UNTRACKED_BASELINE_CAP:
-                debug_log(f"_list_untracked: capped at {UNTRACKED_BASELINE_CAP}")
-                break
-        return out
+        return {p: _mtime_ns(os.path.join(repo, p)) or 0 for p in paths}
     except (subprocess.TimeoutExpired, FileNotFoundError, OSError, ValueError) as e:
         # ValueError guards against any future strict-decode regression
         # so the helper degrades to {} instead of crashing the hook.
         debug_log(f"_list_untracked error: {e}")
         return {}
 
+
+def _untracked_baseline_file(session_id):
+    return get_state_file(session_id)[:-len(".json")] + ".untracked.json"
+
+
+def set_untracked_baseline(state, session_id, untracked):
+    """Store a `_list_untracked` snapshot as the session's
+    untracked_at_baseline — inline up to UNTRACKED_BASELINE_CAP entries,
+    otherwise in a side file next to the state file. Call under the
+    session lock (inside a with_locked_state callback)."""
+    untracked = untracked or {}
+    if len(untracked) > UNTRACKED_BASELINE_CAP:
+        path = _untracked_baseline_file(session_id)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(untracked, f)
+            os.replace(tmp, path)
+            state["untracked_at_baseline"] = {}
+            state["untracked_baseline_spilled"] = len(untracked)
+            return
+        except OSError as e:
+            debug_log(f"untracked baseline side file write failed ({e}), keeping inline")
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
+    state["untracked_at_baseline"] = untracked
+    state.pop("untracked_baseline_spilled", None)
+
+
+def get_untracked_baseline(state, session_id):
+    """Counterpart of set_untracked_baseline; {} when missing/unreadable."""
+    if state.get("untracked_baseline_spilled"):
+        try:
+            with open(_untracked_baseline_file(session_id), encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError) as e:
+            debug_log(f"untracked baseline side file read failed: {e}")
+            return {}
+    v = state.get("untracked_at_baseline")
+    return dict(v) if isinstance(v, dict) else {}
+
+
+@traced()
 def compute_v2_review_set(cwd, baseline_sha, head_at_capture, untracked_at_baseline=None):
     """v2 diff strategy: derive the review set from git state alone.
 
@@ -412,11 +1002,28 @@ def compute_v2_review_set(cwd, baseline_sha, head_at_capture, untracked_at_basel
     Also returns the untracked subset of review_set so get_git_diff can do
     a targeted `add -N -- <files>` instead of a whole-tree scan.
     """
-    repo = _git_toplevel(cwd) or cwd
     if not isinstance(untracked_at_baseline, dict):
         untracked_at_baseline = {}
 
-    tracked_dirty, untracked = _git_status_porcelain(repo)
+    # The toplevel lookup, the status (which also carries HEAD in its
+    # `# branch.oid` header) and the name-only diff against the stash
+    # baseline don't depend on each other: all three run at once from cwd.
+    # Their paths are repo-root-relative regardless of cwd (see
+    # _git_status_v2 / _git_name_only).
+    # changed_since: tracked files vs the stash baseline (no temp index — the
+    # stash never contained untracked files anyway), then union with
+    # currently-untracked below. The previous `include_untracked=True` arm
+    # cost a full `git add -N .` (slow in large repos) per call to surface
+    # untracked files in the diff output — but `git diff <stash>` already
+    # lists them as "only in worktree" without that, and we have the explicit
+    # set from status regardless.
+    top, status, changed_since = run_concurrently(
+        lambda: _git_toplevel(cwd),
+        lambda: _git_status_v2(cwd),
+        lambda: _git_name_only(cwd, baseline_sha) if baseline_sha else None,
+    )
+    repo = top or cwd
+    tracked_dirty, untracked, current_head = status or (None, None, None)
     if tracked_dirty is None:
         return [], "HEAD", repo, [], {"dirty_now_count": -1, "changed_since_count": -1, "review_set_count": 0}
 
@@ -434,25 +1041,20 @@ def compute_v2_review_set(cwd, baseline_sha, head_at_capture, untracked_at_basel
     dirty_now = tracked_dirty | new_untracked
 
     diff_base = "HEAD"
-    current_head = _git_rev_parse_head(repo)
-    if (head_at_capture and current_head and head_at_capture != current_head
-            and _is_ancestor(repo, head_at_capture, current_head)):
-        dirty_now |= _git_name_only(repo, f"{head_at_capture}..HEAD") or set()
-        diff_base = head_at_capture
+    if head_at_capture and current_head and head_at_capture != current_head:
+        # HEAD moved this turn: the ancestry check and the committed-files
+        # list are independent too. The list is only used when HEAD moved
+        # forward (commit/merge), not sideways (checkout).
+        forward, committed = run_concurrently(
+            lambda: _is_ancestor(repo, head_at_capture, current_head),
+            lambda: _git_name_only(repo, f"{head_at_capture}..{current_head}"),
+        )
+        if forward:
+            dirty_now |= committed or set()
+            diff_base = head_at_capture
 
-    # changed_since: tracked files vs the stash baseline (no temp index — the
-    # stash never contained untracked files anyway), then union with
-    # currently-untracked. The previous `include_untracked=True` arm cost a
-    # full `git add -N .` (slow in large repos) per call to surface
-    # untracked files in the diff output — but `git diff <stash>` already
-    # lists them as "only in worktree" without that, and we have the explicit
-    # set from status regardless.
-    if baseline_sha:
-        changed_since = _git_name_only(repo, baseline_sha)
-        if changed_since is not None:
-            changed_since |= new_untracked
-    else:
-        changed_since = None
+    if changed_since is not None:
+        changed_since |= new_untracked
     # changed_since is None on missing baseline OR on git error (e.g. the
     # dangling stash SHA was pruned). Either way, don't intersect with ∅ —
     # that would silently zero the review set. Fall back to dirty_now.
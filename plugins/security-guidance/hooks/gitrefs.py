@@ -0,0 +1,180 @@
+"""
+Pure-Python repository discovery and HEAD resolution for the hooks.
+
+gitutil's _git_toplevel, _git_dir, _find_git_index and _git_rev_parse_head
+each fork `git rev-parse`, and one hook fire calls them several times
+(~3-5 ms a fork, more on Windows and under antivirus). What they answer is
+a handful of file reads: walk up from cwd to the `.git` dir (or a linked
+worktree's `gitdir:` file), read `commondir`, read `HEAD`, follow a
+symbolic ref through the loose ref file or `packed-refs`.
+
+Every function returns None when it can't answer with certainty, and the
+gitutil callers then run the subprocess as before. That covers:
+  - GIT_DIR / GIT_WORK_TREE / GIT_COMMON_DIR / GIT_CEILING_DIRECTORIES /
+    GIT_DISCOVERY_ACROSS_FILESYSTEM in the environment,
+  - reftable ref storage, core.worktree, bare repos, worktree-specific
+    config, alternates, cwd inside a .git directory,
+  - unborn branches, per-worktree refs (refs/bisect, refs/worktree, ...)
+    and anything unparseable,
+  - Windows (git reports `C:/x/y` paths there; mixing with Python's
+    backslash form isn't worth the risk for a few milliseconds).
+
+Discovery is memoized per process (the warm worker is long-lived, so an
+entry is re-validated with one stat); HEAD is read fresh on every call.
+SG_GIT_FASTPATH=0 turns the module off.
+"""
+import os
+import re
+
+ENABLED = os.environ.get("SG_GIT_FASTPATH", "1").strip().lower() not in ("0", "off", "false", "no")
+
+_UNUSUAL_ENV = ("GIT_DIR", "GIT_WORK_TREE", "GIT_COMMON_DIR",
+                "GIT_CEILING_DIRECTORIES", "GIT_DISCOVERY_ACROSS_FILESYSTEM")
+_SHA_RE = re.compile(r"^(?:[0-9a-f]{40}|[0-9a-f]{64})$")
+# Refs stored under the per-worktree gitdir rather than the common dir.
+_PER_WORKTREE_REF_PREFIXES = ("refs/bisect/", "refs/worktree/", "refs/rewritten/")
+_MAX_SYMREF_DEPTH = 5
+
+# realpath(cwd) → (toplevel, gitdir, commondir), or None for "use git".
+_repos = {}
+
+
+def _usable():
+    return ENABLED and os.name != "nt" and not any(os.environ.get(v) for v in _UNUSUAL_ENV)
+
+
+def _read(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read().decode("utf-8", errors="replace")
+    except OSError:
+        return None
+
+
+def _plain_config(commondir, gitdir):
+    """False when the repo config uses anything that changes where the
+    worktree, refs or objects are (checked by substring — a false positive
+    just means taking the subprocess path)."""
+    cfg = (_read(os.path.join(commondir, "config")) or "").lower()
+    if "refstorage" in cfg or "worktree" in cfg or "bare = true" in cfg:
+        return False
+    if os.path.exists(os.path.join(commondir, "reftable")):
+        return False
+    if os.path.exists(os.path.join(commondir, "objects", "info", "alternates")):
+        return False
+    return gitdir == commondir or not os.path.exists(os.path.join(gitdir, "config.worktree"))
+
+
+def _discover(start):
+    d = start
+    while True:
+        if os.path.basename(d) == ".git":
+            return None  # inside a gitdir: rev-parse says "not a work tree"
+        dotgit = os.path.join(d, ".git")
+        if os.path.isdir(dotgit):
+            gitdir = dotgit
+            break
+        if os.path.isfile(dotgit):
+            text = _read(dotgit) or ""
+            if not text.startswith("gitdir:"):
+                return None
+            gitdir = text[7:].strip()
+            if not os.path.isabs(gitdir):
+                gitdir = os.path.join(d, gitdir)
+            gitdir = os.path.realpath(gitdir)
+            break
+        parent = os.path.dirname(d)
+        if parent == d:
+            return None
+        d = parent
+    if not os.path.isfile(os.path.join(gitdir, "HEAD")):
+        return None
+    # git refuses repos owned by someone else unless safe.directory says
+    # otherwise; let it make that call.
+    if os.stat(d).st_uid != os.geteuid():
+        return None
+    common =_read(os.path.join(gitdir, "commondir"))
+    if common is None:
+        commondir = gitdir
+    else:
+        common = common.strip()
+        commondir = os.path.realpath(common if os.path.isabs(common)
+                                     else os.path.join(gitdir, common))
+    if not _plain_config(commondir, gitdir):
+        return None
+    return d, gitdir, commondir
+
+
+def repo_info(cwd):
+    """(toplevel, gitdir, commondir) for `cwd`, or None to ask git."""
+    if not _usable() or not cwd:
+        return None
+    try:
+        key = os.path.realpath(cwd)
+    except (OSError, ValueError):
+        return None
+    if key in _repos:
+        info = _repos[key]
+        if info is None or os.path.isfile(os.path.join(info[1], "HEAD")):
+            return info
+    try:
+        info = _discover(key)
+    except (OSError, ValueError):
+        info = None
+    _repos[key] = info
+    return info
+
+
+def toplevel(cwd):
+    info = repo_info(cwd)
+    return info[0] if info else None
+
+
+def git_dir(cwd):
+    """The per-worktree gitdir (`rev-parse --git-dir`)."""
+    info = repo_info(cwd)
+    return info[1] if info else None
+
+
+def common_dir(cwd):
+    """The shared gitdir (`rev-parse --git-common-dir`)."""
+    info = repo_info(cwd)
+    return info[2] if info else None
+
+
+def _packed_ref(commondir, ref):
+    text = _read(os.path.join(commondir, "packed-refs"))
+    if not text:
+        return None
+    target = " " + ref
+    for line in text.split("\n"):
+        if line.endswith(target) and not line.startswith(("#", "^")):
+            sha = line[:-len(target)]
+            return sha if _SHA_RE.match(sha) else None
+    return None
+
+
+def head_sha(cwd):
+    """HEAD's commit SHA (`rev-parse HEAD`), or None to ask git — including
+    for an unborn branch, where git's own answer is also "no HEAD"."""
+    info = repo_info(cwd)
+    if not info:
+        return None
+    _top, gitdir, commondir = info
+    content = _read(os.path.join(gitdir, "HEAD"))
+    for _ in range(_MAX_SYMREF_DEPTH):
+        if content is None:
+            return None
+        content = content.strip()
+        if _SHA_RE.match(content):
+            return content
+        if not content.startswith("ref: "):
+            return None
+        ref = content[5:].strip()
+        if not ref.startswith("refs/") or ref.startswith(_PER_WORKTREE_REF_PREFIXES) \
+                or ".." in ref:
+            return None
+        content = _read(os.path.join(commondir, ref))
+        if content is None:
+            return _packed_ref(commondir, ref)
+    return None
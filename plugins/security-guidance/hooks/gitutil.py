@@ -18,8 +18,12 @@ import contextlib
 import os
 import re
 import subprocess
+import threading
+from collections import Counter
 
+import gitrefs
 from _base import debug_log
+from tracing import span, traced
 
 
 GIT_CMD = [
@@ -42,6 +46,9 @@ GIT_CMD = [
 
 def _git_rev_parse_head(cwd):
     """Return the current HEAD SHA, or None if not a git repo / no commits."""
+    sha = gitrefs.head_sha(cwd)
+    if sha:
+        return sha
     try:
         # See #2099: text=True on Windows cp1252 crashes the reader thread on
         # any UTF-8 byte undefined in cp1252 (e.g. via a git error message
@@ -61,12 +68,13 @@ def _git_rev_parse_head(cwd):
 
 
 
-def _find_git_index(cwd):
-    """
-    Find the real index file for a git repo. Handles worktrees where .git
-    is a file pointing to the main repo's gitdir.
-    Returns the absolute path to the index file, or None.
-    """
+def _git_worktree_dir(cwd):
+    """Absolute per-worktree gitdir (`rev-parse --git-dir`) for cwd, or None.
+    In a linked worktree this is `.git/worktrees/<name>/`, which holds that
+    worktree's index and HEAD."""
+    git_dir = gitrefs.git_dir(cwd)
+    if git_dir:
+        return git_dir
     try:
         # See #2099: stdout here is a PATH which can contain non-ASCII bytes
         # (e.g. C:\אבטחה\repo\.git). text=True decodes via cp1252 strict on
@@ -79,14 +87,26 @@ def _find_git_index(cwd):
         if result.returncode != 0:
             return None
         git_dir = result.stdout.decode("utf-8", errors="replace").strip()
-        if not os.path.isabs(git_dir):
-            git_dir = os.path.join(cwd, git_dir)
-        index_path = os.path.join(git_dir, "index")
-        return index_path if os.path.isfile(index_path) else None
+        if not git_dir:
+            return None
+        return git_dir if os.path.isabs(git_dir) else os.path.join(cwd, git_dir)
     except (subprocess.TimeoutExpired, FileNotFoundError, OSError):
         return None
 
 
+def _find_git_index(cwd):
+    """
+    Find the real index file for a git repo. Handles worktrees where .git
+    is a file pointing to the main repo's gitdir.
+    Returns the absolute path to the index file, or None.
+    """
+    git_dir = _git_worktree_dir(cwd)
+    if not git_dir:
+        return None
+    index_path = os.path.join(git_dir, "index")
+    return index_path if os.path.isfile(index_path) else None
+
+
 def _diff_pathspec(cwd, paths):
     """Convert absolute touched-paths to repo-relative pathspec args for
     git diff. Paths outside cwd (e.g. ~/.claude/…) are dropped. Returns the
@@ -167,6 +187,9 @@ def _temp_index(cwd, untracked_paths=None):
 
 def _git_toplevel(cwd):
     """Absolute repo root for `cwd`, or None if not in a work tree."""
+    top = gitrefs.toplevel(cwd)
+    if top:
+        return top
     try:
         # See #2099: stdout is a PATH — `C:\אבטחה\repo` returned as UTF-8
         # bytes by git. text=True would decode via cp1252 strict on Windows
@@ -193,6 +216,9 @@ def _git_dir(repo_root):
     if a different worktree later pushes it. Returns None on failure so
     callers can degrade (push-sweep state is best-effort).
     """
+    d = gitrefs.common_dir(repo_root)
+    if d:
+        return d
     try:
         # See #2099: stdout is a PATH (shared gitdir), may be non-ASCII.
         # Decode bytes manually to avoid cp1252 reader-thread crash.
@@ -208,6 +234,211 @@ def _git_dir(repo_root):
         return None
 
 
+class GitObjectReader:
+    """Long-lived `git cat-file --batch` / `--batch-check` pair for one cwd.
+
+    Every baseline lookup (`git show <sha>:<path>`) and full-SHA resolution
+    (`git rev-parse --verify <abbrev>`) used to be its own fork/exec of git,
+    which in a large monorepo costs far more than the read itself (git
+    re-opens the object store, pack indexes and config every time). This
+    keeps one reader process of each kind open for the life of the hook
+    process — or of the warm worker — and feeds it one object name per line.
+
+    read() serves blob/tree/commit contents through an LRU keyed by object
+    id; resolve() returns (oid, type, size) without reading content. Names
+    that start with a full hex oid (`<baseline_sha>:<path>`) are immutable,
+    so their name → oid mapping is cached too; symbolic names (HEAD, @{u})
+    are always re-resolved by git.
+
+    POSIX only: reads are select()-bounded so a wedged git can't hang the
+    hook. Any protocol error or timeout kills the pair and returns None; the
+    caller then falls back to the one-shot subprocess it used before.
+    """
+
+    LRU_MAX_ENTRIES = 256
+    LRU_MAX_BYTES = 32 * 1024 * 1024
+    TIMEOUT_S = 5.0
+
+    _FULL_OID_RE = re.compile(r"^(?:[0-9a-f]{40}|[0-9a-f]{64})(?::|$)")
+
+    def __init__(self, cwd):
+        import collections
+        import threading
+        self.cwd = cwd
+        self._procs = {}
+        self._bufs = {}
+        self._lock = threading.Lock()
+        self._blobs = collections.OrderedDict()  # oid -> (type, bytes)
+        self._blob_bytes = 0
+        self._names = {}  # immutable name -> (oid, type, size)
+        self.broken = False
+
+    # ── process plumbing ──
+
+    def _proc(self, mode):
+        p = self._procs.get(mode)
+        if p is not None and p.poll() is None:
+            return p
+        with span(f"git cat-file {mode} spawn", "subprocess"):
+            p = subprocess.Popen(
+                [*GIT_CMD, "cat-file", mode],
+                cwd=self.cwd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL, bufsize=0,
+            )
+        self._procs[mode] = p
+        self._bufs[mode] = bytearray()
+        return p
+
+    def _fill(self, mode, p, deadline):
+        import select
+        import time as _time
+        remaining = deadline - _time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("cat-file read timed out")
+        fd = p.stdout.fileno()
+        ready, _, _ = select.select([fd], [], [], remaining)
+        if not ready:
+            raise TimeoutError("cat-file read timed out")
+        chunk = os.read(fd, 1 << 16)
+        if not chunk:
+            raise EOFError("cat-file exited")
+        self._bufs[mode] += chunk
+
+    def _readline(self, mode, p, deadline):
+        buf = self._bufs[mode]
+        while True:
+            i = buf.find(b"\n")
+            if i >= 0:
+                line = bytes(buf[:i])
+                del buf[:i + 1]
+                return line
+            self._fill(mode, p, deadline)
+
+    def _readexact(self, mode, p, n, deadline):
+        buf = self._bufs[mode]
+        while len(buf) < n:
+            self._fill(mode, p, deadline)
+        data = bytes(buf[:n])
+        del buf[:n]
+        return data
+
+    def _request(self, mode, name):
+        """One round-trip. Returns (oid, type, size, content-or-None) or None
+        for missing/ambiguous. Raises on transport failure."""
+        import time as _time
+        deadline = _time.monotonic() + self.TIMEOUT_S
+        p = self._proc(mode)
+        p.stdin.write(name.encode("utf-8") + b"\n")
+        p.stdin.flush()
+        header = self._readline(mode, p, deadline).decode("utf-8", errors="replace")
+        parts = header.split(" ")
+        # `<name> missing` / `<name> ambiguous` — name may itself contain
+        # spaces, so check the trailing word rather than the field count.
+        if len(parts) < 3 or parts[-1] in ("missing", "ambiguous"):
+            return None
+        oid, otype, size = parts[0], parts[1], int(parts[2])
+        content = None
+        if mode == "--batch":
+            content = self._readexact(mode, p, size + 1, deadline)[:-1]
+        return oid, otype, size, content
+
+    def close(self):
+        for p in self._procs.values():
+            try:
+                p.kill()
+                p.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        self._procs.clear()
+
+    def _guarded(self, mode, name):
+        if self.broken:
+            raise OSError("GitObjectReader is closed")
+        if not name or "\n" in name:
+            return None
+        try:
+            with span(f"git cat-file {mode}", "subprocess", rev=name):
+                return self._request(mode, name)
+        except (OSError, ValueError, EOFError) as e:
+            debug_log(f"GitObjectReader({self.cwd}): cat-file {mode} failed: {e}")
+            self.broken = True
+            self.close()
+            raise OSError(str(e)) from e
+
+    # ── public API ──
+
+    def resolve(self, name):
+        """(oid, type, size) for `name`, or None if git can't resolve it.
+        Raises OSError on transport failure (caller falls back)."""
+        with self._lock:
+            hit = self._names.get(name)
+            if hit is not None:
+                return hit
+            r = self._guarded("--batch-check", name)
+            if r is None:
+                return None
+            out = r[:3]
+            if self._FULL_OID_RE.match(name):
+                self._names[name] = out
+            return out
+
+    def read(self, name):
+        """(oid, type, content_bytes) for `name`, or None if missing.
+        Raises OSError on transport failure (caller falls back)."""
+        with self._lock:
+            known = self._names.get(name)
+            if known is not None and known[0] in self._blobs:
+                self._blobs.move_to_end(known[0])
+                otype, data = self._blobs[known[0]]
+                return known[0], otype, data
+            r = self._guarded("--batch", name)
+            if r is None:
+                return None
+            oid, otype, size, data = r
+            if self._FULL_OID_RE.match(name):
+                self._names[name] = (oid, otype, size)
+            if size <= self.LRU_MAX_BYTES // 4:
+                if oid not in self._blobs:
+                    self._blob_bytes += size
+                self._blobs[oid] = (otype, data)
+                self._blobs.move_to_end(oid)
+                while (len(self._blobs) > self.LRU_MAX_ENTRIES
+                       or self._blob_bytes > self.LRU_MAX_BYTES):
+                    _, (_, old) = self._blobs.popitem(last=False)
+                    self._blob_bytes -= len(old)
+            return oid, otype, data
+
+
+_OBJECT_READERS = {}
+_OBJECT_READERS_MAX = 8
+_object_readers_atexit = False
+
+
+def git_object_reader(cwd):
+    """Shared GitObjectReader for `cwd`, or None where unsupported (no
+    select() on pipes) or after the reader for this cwd has failed."""
+    if os.name != "posix" or not cwd:
+        return None
+    global _object_readers_atexit
+    key = os.path.abspath(cwd)
+    r = _OBJECT_READERS.get(key)
+    if r is None:
+        if len(_OBJECT_READERS) >= _OBJECT_READERS_MAX:
+            _OBJECT_READERS.pop(next(iter(_OBJECT_READERS))).close()
+        if not _object_readers_atexit:
+            import atexit
+            atexit.register(_close_object_readers)
+            _object_readers_atexit = True
+        r = _OBJECT_READERS[key] = GitObjectReader(key)
+    return None if r.broken else r
+
+
+def _close_object_readers():
+    for r in list(_OBJECT_READERS.values()):
+        r.close()
+    _OBJECT_READERS.clear()
+
+
 def _git_rev_list_range(repo_root, base, head="HEAD"):
     """Shas in `base..head`, oldest→newest. Empty list on error."""
     try:
@@ -248,6 +479,44 @@ def _git_diff_range(repo_root, base, head="HEAD"):
         return None
 
 
+def _git_diff_range_files(repo_root, base, head="HEAD", cap=None, hard_cap=None,
+                          plan_out=None):
+    """_git_diff_range planned from numstat and parsed while streaming (see
+    planned_diff_files): (path, content) tuples for the chosen reviewable
+    files, None on error."""
+    return planned_diff_files(
+        [*GIT_CMD, "diff", "--numstat", "-z", "--no-ext-diff", base, head],
+        [*GIT_CMD, "diff", "-p", "--no-color", "--no-ext-diff", base, head],
+        repo_root, cap=cap, hard_cap=hard_cap, plan_out=plan_out)
+
+
+def git_commit_paths(repo_root, base, head="HEAD", timeout=30):
+    """[(sha, [path, ...]), ...] for every commit in `base..head`,
+    oldest→newest, from one `git log --name-only`. Renames are split into
+    delete + add so both paths are listed; merges list no paths (log shows
+    no diff for them). None on error."""
+    try:
+        r = subprocess.run(
+            [*GIT_CMD, "log", "--reverse", "--no-renames", "--name-only", "-z",
+             "--format=%x01%H", f"{base}..{head}"],
+            cwd=repo_root, capture_output=True, timeout=timeout,
+        )
+    except (subprocess.TimeoutExpired, FileNotFoundError, OSError):
+        return None
+    if r.returncode != 0:
+        return None
+    out = []
+    # "\x01<sha>\0\n<path>\0<path>\0\x01<sha>\0..." — the newline only
+    # follows a commit line that has paths after it.
+    for tok in r.stdout.decode("utf-8", errors="replace").split("\0"):
+        tok = tok.lstrip("\n")
+        if tok.startswith("\x01"):
+            out.append((tok[1:], []))
+        elif tok and out:
+            out[-1][1].append(tok)
+    return out
+
+
 def _detect_main_branch(repo_root):
     for ref in ("origin/HEAD", "origin/main", "origin/master", "main", "master"):
         try:
@@ -364,8 +633,10 @@ def _git_name_only(cwd, base, include_untracked=False):
     # Same fix shape as diffstate._list_untracked. See #2056.
     def _run(env):
         # core.quotePath=false comes from GIT_CMD globally (see definition).
+        # diff.relative=false: output stays repo-root-relative when run
+        # from a subdirectory (compute_v2_review_set runs it from cwd).
         result = subprocess.run(
-            [*GIT_CMD, "diff", "--name-only", "-z", base],
+            [*GIT_CMD, "-c", "diff.relative=false", "diff", "--name-only", "-z", base],
             cwd=cwd, capture_output=True, timeout=30,
             env=env,
         )
@@ -438,6 +709,73 @@ def _git_status_porcelain(cwd):
         debug_log(f"_git_status_porcelain error: {e}")
         return None, None
 
+def _git_status_v2(cwd):
+    """One `git status --porcelain=v2 --branch -uall -z` → (tracked_dirty,
+    untracked, head) with repo-root-relative path sets and the HEAD SHA
+    from the `# branch.oid` header (None on an unborn branch), or
+    (None, None, None) on error. Same sets as _git_status_porcelain, plus
+    HEAD without a separate `git rev-parse HEAD`.
+
+    status.relativePaths=false keeps paths root-relative when run from a
+    subdirectory — porcelain output honors that setting."""
+    try:
+        r = subprocess.run(
+            [*GIT_CMD, "-c", "status.relativePaths=false",
+             "status", "--porcelain=v2", "--branch", "-uall", "-z"],
+            cwd=cwd, capture_output=True, timeout=30,
+        )
+        if r.returncode != 0:
+            stderr_str = (r.stderr or b"").decode("utf-8", errors="replace")
+            debug_log(f"_git_status_v2 rc={r.returncode}: {stderr_str[:200]}")
+            return None, None, None
+        tracked, untracked, head = set(), set(), None
+        entries = (r.stdout or b"").decode("utf-8", errors="replace").split("\0")
+        i = 0
+        while i < len(entries):
+            e = entries[i]
+            i += 1
+            kind = e[:1]
+            if kind == "?":
+                untracked.add(e[2:])
+            elif kind == "1":
+                # 1 XY sub mH mI mW hH hI path
+                tracked.add(e.split(" ", 8)[8])
+            elif kind == "2":
+                # 2 XY sub mH mI mW hH hI Xscore path\0origPath — keep the
+                # new path and consume the origin, as the v1 parser does.
+                tracked.add(e.split(" ", 9)[9])
+                i += 1
+            elif kind == "u":
+                # u XY sub m1 m2 m3 mW h1 h2 h3 path
+                tracked.add(e.split(" ", 10)[10])
+            elif e.startswith("# branch.oid "):
+                oid = e[13:]
+                head = oid if oid != "(initial)" else None
+        return tracked, untracked, head
+    except (subprocess.TimeoutExpired, FileNotFoundError, OSError, ValueError, IndexError) as e:
+        debug_log(f"_git_status_v2 error: {e}")
+        return None, None, None
+
+
+def run_concurrently(*calls):
+    """Call each zero-argument callable on its own thread (the first on the
+    calling thread) and return their results in order. Meant for
+    independent git subprocess helpers, which catch their own errors — an
+    exception escaping a worker thread leaves None in its slot."""
+    results = [None] * len(calls)
+
+    def _run(i, fn):
+        results[i] = fn()
+
+    threads = [threading.Thread(target=_run, args=(i, fn), daemon=True)
+               for i, fn in enumerate(calls) if i]
+    for t in threads:
+        t.start()
+    if calls:
+        results[0] = calls[0]()
+    for t in threads:
+        t.join()
+    return results
 
 
 def _is_ancestor(cwd, maybe_ancestor, descendant):
@@ -457,6 +795,7 @@ def _is_ancestor(cwd, maybe_ancestor, descendant):
 
 
 
+@traced()
 def get_git_diff(cwd, baseline_sha, full_context=False, paths=None, untracked_paths=None):
     """
     Get the git diff between the baseline SHA and the current working tree,
@@ -497,6 +836,36 @@ def get_git_diff(cwd, baseline_sha, full_context=False, paths=None, untracked_pa
         return None
 
 
+@traced()
+def get_git_diff_files(cwd, baseline_sha, paths=None, untracked_paths=None,
+                       cap=None, hard_cap=None, max_tokens=None, plan_out=None):
+    """
+    get_git_diff + parse_diff_into_files, numstat first: the same diff (temp
+    index, untracked intent-to-add, `paths` restriction) is planned from
+    `git diff --numstat -z` and patch text is streamed only for the files
+    plan_diff_paths keeps under `cap` / `hard_cap` / `max_tokens`. Both
+    commands share one temp index. Returns (path, content) tuples, [] when
+    `paths` has nothing in this repo or nothing is kept, or None on
+    failure; `plan_out` gets the plan (plan_out["files"] == 0 means the
+    diff was empty).
+    """
+    pathspec = _diff_pathspec(cwd, paths)
+    if paths and not pathspec:
+        if plan_out is not None:
+            plan_out.update(files=0, reviewable=0, pathological=False, dropped=0)
+        return []
+    try:
+        with _temp_index(cwd, untracked_paths) as env:
+            return planned_diff_files(
+                [*GIT_CMD, "diff", "--numstat", "-z", "--no-ext-diff", baseline_sha] + pathspec,
+                [*GIT_CMD, "diff", "--no-color", "--no-ext-diff", baseline_sha],
+                cwd, env=env, cap=cap, hard_cap=hard_cap, max_tokens=max_tokens,
+                plan_out=plan_out)
+    except OSError as e:
+        debug_log(f"git diff error: {e}")
+        return None
+
+
 # Source file extensions worth reviewing for security
 SOURCE_CODE_EXTENSIONS = {
     '.py', '.js', '.ts', '.jsx', '.tsx', '.go', '.java', '.rb', '.php',
@@ -523,7 +892,7 @@ SOURCE_CODE_BASENAMES = {
 # extensionless executables (bin/deploy, scripts/run-canary) were the largest
 # remaining false-negative class — they carry shell-injection surface but
 # `splitext` gives '' so they were filtered out. _cap_files_for_prompt bounds
-# the byte cost downstream, and the reviewer ignores prose, so opting
+# the token cost downstream, and the reviewer ignores prose, so opting
 # extensionless IN with this small deny-list is the better default than
 # opting OUT.
 NON_SOURCE_EXTENSIONLESS_BASENAMES = {
@@ -579,41 +948,52 @@ _LOW_PRIORITY_PATH_TOKENS = (
 )
 
 
+def diff_file_priority(item):
+    """Security-relevance sort key for one (path, diff) item, higher first:
+    (risk_tokens_in_path, not_low_priority, added_lines). Shared by
+    _prioritize_diff_files and review_api's prompt packer."""
+    fp, content = item
+    # added_lines: count('\n+') over-counts by including '+++' header and
+    # any literal '+' at line start in context, but it's a consistent
+    # ordinal across files in the same diff which is all we need.
+    return _path_priority(fp, content.count("\n+"))
+
+
+def _path_priority(fp, added):
+    """diff_file_priority from a path and an added-line count, so the
+    numstat planner (plan_diff_paths) ranks files before any patch text
+    exists exactly as the content-based ranking would."""
+    low = fp.lower()
+    # Prepend "/" so leading-slash patterns in _LOW_PRIORITY_PATH_TOKENS
+    # match top-level dirs (git diff paths are repo-root-relative, e.g.
+    # `migrations/001.py` not `/migrations/001.py`). Same trick as
+    # _is_reviewable_source.
+    low_slashed = "/" + low
+    risk = sum(1 for t in _SECURITY_RISK_PATH_TOKENS if t in low)
+    low_prio = (
+        fp.endswith(_LOW_PRIORITY_SUFFIXES)
+        or any(t in low_slashed for t in _LOW_PRIORITY_PATH_TOKENS)
+    )
+    return (risk, not low_prio, added)
+
+
 def _prioritize_diff_files(diff_files, cap):
     """When `diff_files` exceeds `cap`, return the top-`cap` by security
     relevance plus the count dropped. Otherwise return (diff_files, 0).
 
-    Score = (risk_tokens_in_path, not_low_priority, added_lines). The
-    added-lines proxy is `content.count('\\n+')` which counts diff additions
-    cheaply without re-parsing hunks. This is a heuristic, not a guarantee —
-    the goal is to review the likely-dangerous subset of an over-cap diff
-    instead of reviewing nothing. Diffs that exceed the cap are typically
-    large multi-file scaffolds, and the cross-file source→sink vulnerabilities
-    in them concentrate in a handful of api/client/route files.
+    Score = diff_file_priority: (risk_tokens_in_path, not_low_priority,
+    added_lines). The added-lines proxy is `content.count('\\n+')` which
+    counts diff additions cheaply without re-parsing hunks. This is a
+    heuristic, not a guarantee — the goal is to review the likely-dangerous
+    subset of an over-cap diff instead of reviewing nothing. Diffs that
+    exceed the cap are typically large multi-file scaffolds, and the
+    cross-file source→sink vulnerabilities in them concentrate in a handful
+    of api/client/route files.
     """
     if len(diff_files) <= cap:
         return diff_files, 0
 
-    def _score(item):
-        fp, content = item
-        low = fp.lower()
-        # Prepend "/" so leading-slash patterns in _LOW_PRIORITY_PATH_TOKENS
-        # match top-level dirs (git diff paths are repo-root-relative, e.g.
-        # `migrations/001.py` not `/migrations/001.py`). Same trick as
-        # _is_reviewable_source.
-        low_slashed = "/" + low
-        risk = sum(1 for t in _SECURITY_RISK_PATH_TOKENS if t in low)
-        low_prio = (
-            fp.endswith(_LOW_PRIORITY_SUFFIXES)
-            or any(t in low_slashed for t in _LOW_PRIORITY_PATH_TOKENS)
-        )
-        # added_lines: count('\n+') over-counts by including '+++' header and
-        # any literal '+' at line start in context, but it's a consistent
-        # ordinal across files in the same diff which is all we need.
-        added = content.count("\n+")
-        return (risk, not low_prio, added)
-
-    ranked = sorted(diff_files, key=_score, reverse=True)
+    ranked = sorted(diff_files, key=diff_file_priority, reverse=True)
     return ranked[:cap], len(diff_files) - cap
 
 
@@ -654,6 +1034,178 @@ def _is_reviewable_source(file_path):
     return False
 
 
+_DIFF_HEADER_RE = re.compile(r'^a/(.+?) b/(.+)$')
+_HUNK_HEADER_RE = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+
+class DiffHunk:
+    """One `@@` hunk of a DiffFile. `offset` is the character offset of its
+    `@@` line within DiffFile.content (0 when content was not buffered)."""
+    __slots__ = ("old_start", "old_count", "new_start", "new_count",
+                 "added", "removed", "offset")
+
+    def __init__(self, old_start, old_count, new_start, new_count, offset):
+        self.old_start = old_start
+        self.old_count = old_count
+        self.new_start = new_start
+        self.new_count = new_count
+        self.added = 0
+        self.removed = 0
+        self.offset = offset
+
+    def __repr__(self):
+        return (f"DiffHunk(-{self.old_start},{self.old_count} "
+                f"+{self.new_start},{self.new_count} +{self.added}/-{self.removed})")
+
+
+class DiffFile:
+    """One file section of a unified diff. `status` is git's letter (A, D,
+    R, C or M); `old_path` is the rename/copy source, else the a/ path.
+    `content` is the section from its first `@@` line on — the same string
+    parse_diff_into_files has always returned — or None when the parser ran
+    with with_content=False."""
+    __slots__ = ("path", "old_path", "status", "hunks", "content")
+
+    def __init__(self, path, old_path):
+        self.path = path
+        self.old_path = old_path
+        self.status = "M"
+        self.hunks = []
+        self.content = None
+
+    @property
+    def added(self):
+        return sum(h.added for h in self.hunks)
+
+    @property
+    def removed(self):
+        return sum(h.removed for h in self.hunks)
+
+    def __repr__(self):
+        return f"DiffFile({self.status} {self.path!r}, {len(self.hunks)} hunks)"
+
+
+def _split_lines(data, nl):
+    """Lines of `data` (str or bytes) with their newline kept, split on
+    '\n' only (not str.splitlines' \r / \x0b / \u2028 set) and without
+    copying the whole buffer."""
+    i, n = 0, len(data)
+    while i < n:
+        j = data.find(nl, i)
+        if j < 0:
+            yield data[i:]
+            return
+        yield data[i:j + 1]
+        i = j + 1
+
+
+def _diff_lines(source):
+    """Decoded lines of a diff given as str, bytes or a binary stream
+    (a subprocess stdout). Bytes are decoded per line with
+    errors='replace' — '\n' never occurs inside a UTF-8 sequence, so this
+    matches decoding the whole output at once."""
+    if isinstance(source, str):
+        yield from _split_lines(source, "\n")
+        return
+    if isinstance(source, (bytes, bytearray)):
+        source = _split_lines(source, b"\n")
+    for raw in source:
+        yield raw.decode("utf-8", errors="replace")
+
+
+def iter_diff_files(source, reviewable_only=True, with_content=True, stats=None):
+    """
+    Incrementally parse `git diff` / `git show -p` output into DiffFile
+    records, one file section at a time.
+
+    `source` is the diff as str or bytes, or a binary stream read line by
+    line — pass a subprocess's stdout and the full diff is never held in
+    memory. Sections whose path fails _is_reviewable_source are skipped
+    without buffering their lines when `reviewable_only` (a 50 MB vendored
+    bump costs a header match per file, not a copy); with_content=False
+    also skips buffering reviewable files and yields every file section,
+    hunks counted, for callers that only need paths and sizes. With
+    content, sections without a hunk (binary, mode-only) are not yielded —
+    parse_diff_into_files' long-standing contract.
+
+    The consumer can stop iterating at any point (a file cap reached);
+    nothing past the current section has been read. `stats`, if given, is
+    a dict updated with `files` (all file sections seen, reviewable or
+    not) and `bytes` (characters consumed).
+
+    Sections split only at a line *starting* with `diff --git `, so diff
+    content that mentions that string no longer splits a file in two.
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault("files", 0)
+    stats.setdefault("bytes", 0)
+    cur = None      # DiffFile being parsed, None while skipping a section
+    buf = None      # its content lines from the first @@, when buffering
+    size = 0        # characters in buf so far (hunk offsets)
+    hunk = None
+
+    def _finish():
+        if cur is None:
+            return None
+        if with_content:
+            if not buf:
+                return None
+            cur.content = "".join(buf)
+        return cur
+
+    for line in _diff_lines(source):
+        stats["bytes"] += len(line)
+        if line.startswith("diff --git "):
+            done = _finish()
+            if done is not None:
+                yield done
+            stats["files"] += 1
+            cur, buf, size, hunk = None, None, 0, None
+            m = _DIFF_HEADER_RE.match(line[11:].rstrip("\n"))
+            if not m:
+                continue
+            path = m.group(2) or m.group(1) or ''
+            if reviewable_only and not _is_reviewable_source(path):
+                continue
+            cur = DiffFile(path, m.group(1))
+            continue
+        if cur is None:
+            continue
+        if hunk is None and not line.startswith("@@"):
+            # Extended header lines between `diff --git` and the first hunk.
+            if line.startswith("new file mode"):
+                cur.status = "A"
+            elif line.startswith("deleted file mode"):
+                cur.status = "D"
+            elif line.startswith("rename from "):
+                cur.status, cur.old_path = "R", line[12:].rstrip("\n")
+            elif line.startswith("copy from "):
+                cur.status, cur.old_path = "C", line[10:].rstrip("\n")
+            continue
+        if line.startswith("@@"):
+            m = _HUNK_HEADER_RE.match(line)
+            if m:
+                hunk = DiffHunk(int(m.group(1)), int(m.group(2) or 1),
+                                int(m.group(3)), int(m.group(4) or 1), size)
+            elif hunk is None:
+                hunk = DiffHunk(0, 0, 0, 0, size)
+            cur.hunks.append(hunk)
+        elif line.startswith("+"):
+            hunk.added += 1
+        elif line.startswith("-"):
+            hunk.removed += 1
+        if with_content:
+            if buf is None:
+                buf = []
+            buf.append(line)
+            size += len(line)
+
+    done = _finish()
+    if done is not None:
+        yield done
+
+
 def extract_file_paths_from_diff(diff_output):
     """
     Extract file paths from unified diff output (without content).
@@ -662,132 +1214,347 @@ def extract_file_paths_from_diff(diff_output):
     """
     if not diff_output or not diff_output.strip():
         return []
-
-    paths = []
-    file_diffs = diff_output.split("diff --git ")
-
-    for file_diff in file_diffs:
-        if not file_diff.strip():
-            continue
-        lines = file_diff.split('\n')
-        header_match = re.match(r'^a/(.+?) b/(.+)$', lines[0])
-        if not header_match:
-            continue
-        file_path = header_match.group(2) or header_match.group(1) or ''
-        if not _is_reviewable_source(file_path):
-            continue
-        paths.append(file_path)
-
-    return paths
+    return [f.path for f in iter_diff_files(diff_output, with_content=False)]
 
 
-
-def parse_diff_into_files(diff_output):
+def parse_diff_into_files(diff_output, limit=None):
     """
     Parse unified diff output into a list of (file_path, diff_content) tuples.
-    Only includes files with source code extensions.
+    Only includes files with source code extensions. `diff_output` may be
+    str, bytes or a binary stream (see iter_diff_files); `limit` stops the
+    parse after that many files.
     """
-    if not diff_output or not diff_output.strip():
+    if not diff_output:
         return []
+    files = []
+    for f in iter_diff_files(diff_output):
+        files.append((f.path, f.content))
+        if limit is not None and len(files) >= limit:
+            break
+    return files
+
+
+def stream_diff_files(cmd, cwd, env=None, timeout=30, limit=None, stats=None):
+    """
+    Run a diff-producing git command and parse its stdout while it is being
+    written, so the raw diff is never held in memory — only the reviewable
+    files' sections are. Returns parse_diff_into_files-style
+    (path, content) tuples, or None on failure (non-zero exit, timeout,
+    git missing). With `limit`, stops reading once that many files are
+    parsed and kills git; `stats["truncated"]` is then set.
+    """
+    if stats is None:
+        stats = {}
+    timed_out = []
+
+    def _kill():
+        timed_out.append(True)
+        proc.kill()
 
     files = []
-    file_diffs = diff_output.split("diff --git ")
+    early = False
+    sub = cmd[len(GIT_CMD)] if cmd[:len(GIT_CMD)] == GIT_CMD else cmd[0]
+    import tempfile
+    try:
+        with tempfile.TemporaryFile() as err, span(f"git {sub} (stream)") as sp:
+            # stderr to a file, not a pipe: many CRLF/permission warnings
+            # would otherwise fill the pipe while we block on stdout.
+            proc = subprocess.Popen(cmd, cwd=cwd, env=env,
+                                    stdout=subprocess.PIPE, stderr=err)
+            timer = threading.Timer(timeout, _kill)
+            timer.daemon = True
+            timer.start()
+            try:
+                for f in iter_diff_files(proc.stdout, stats=stats):
+                    files.append((f.path, f.content))
+                    if limit is not None and len(files) >= limit:
+                        early = True
+                        break
+            finally:
+                timer.cancel()
+                if early:
+                    proc.kill()
+                proc.stdout.close()
+                rc = proc.wait()
+                sp.set(rc=rc, files=len(files), bytes=stats["bytes"])
+            if timed_out:
+                debug_log(f"git diff stream: timed out after {timeout}s")
+                return None
+            if rc != 0 and not early:
+                err.seek(0)
+                debug_log(f"git diff stream failed rc={rc}: "
+                          f"{err.read(200).decode('utf-8', errors='replace')}")
+                return None
+    except (FileNotFoundError, OSError, ValueError) as e:
+        debug_log(f"git diff stream error: {e}")
+        return None
+    stats["truncated"] = early
+    return files
 
-    for file_diff in file_diffs:
-        if not file_diff.strip():
-            continue
 
-        # Extract filename from first line: "a/path/to/file b/path/to/file"
-        lines = file_diff.split('\n')
-        header_match = re.match(r'^a/(.+?) b/(.+)$', lines[0])
-        if not header_match:
+# Rough prompt tokens per changed line for numstat-based budgeting: ~40
+# bytes of code per line at ~4 bytes/token, plus a share of the hunk context
+# lines numstat doesn't count.
+_NUMSTAT_TOKENS_PER_LINE = 12
+
+
+def _parse_numstat_z(data):
+    """[(path, old_path, added, removed)] from `--numstat -z` output bytes.
+    added/removed are None for binary files. Renames and copies come as
+    `A\tD\t\0old\0new\0`; old_path is None otherwise."""
+    out = []
+    parts = data.split(b"\0")
+    i, n = 0, len(parts)
+    while i < n:
+        rec = parts[i].lstrip(b"\n")  # `git show --format=` leads with a newline
+        i += 1
+        cols = rec.split(b"\t", 2)
+        if len(cols) != 3:
+            continue
+        a, d, path = cols
+        old = None
+        if not path:
+            if i + 1 >= n:
+                break
+            old, path = parts[i], parts[i + 1]
+            i += 2
+        try:
+            added = None if a == b"-" else int(a)
+            removed = None if d == b"-" else int(d)
+        except ValueError:
             continue
+        out.append((path.decode("utf-8", errors="replace"),
+                    old.decode("utf-8", errors="replace") if old is not None else None,
+                    added, removed))
+    return out
 
-        file_path = header_match.group(2) or header_match.group(1) or ''
 
-        # Filter to source code files only
-        if not _is_reviewable_source(file_path):
-            continue
+def git_numstat(cmd, cwd, env=None, timeout=30):
+    """Run a `--numstat -z` git command; parsed entries, or None on error."""
+    try:
+        r = subprocess.run(cmd, cwd=cwd, env=env, capture_output=True, timeout=timeout)
+    except (subprocess.TimeoutExpired, FileNotFoundError, OSError) as e:
+        debug_log(f"git numstat error: {e}")
+        return None
+    if r.returncode != 0:
+        debug_log(f"git numstat failed: {r.stderr[:200].decode('utf-8', errors='replace')}")
+        return None
+    return _parse_numstat_z(r.stdout)
 
-        # Extract the diff content (from first @@ onwards)
-        diff_lines = []
-        in_hunks = False
-        for line in lines[1:]:
-            if line.startswith('@@'):
-                in_hunks = True
-            if in_hunks:
-                diff_lines.append(line)
 
-        if diff_lines:
-            files.append((file_path, '\n'.join(diff_lines)))
+# full commit sha → `git patch-id --stable` of its diff, per process. A
+# commit's patch-id never changes, so lookups and appends in one hook run
+# share one pipeline.
+_PATCH_IDS = {}
+_PATCH_ID_RE = re.compile(rb"^([0-9a-f]{40,64}) ([0-9a-f]{40,64})$", re.MULTILINE)
 
-    return files
+
+def git_patch_ids(cwd, revs, timeout=30):
+    """
+    {full commit sha: stable patch-id} for `revs` (full or abbreviated
+    commit names), from one `git log -p | git patch-id --stable` pipeline
+    for all of them. The same change rebased, cherry-picked or amended
+    without touching content keeps its patch-id. Commits without a diff
+    (merges, empty commits) are absent. None when git fails.
+
+    The log side pins every diff option that changes patch text
+    (renames, textconv, external diff, color), so the id of a commit does
+    not depend on the user's diff config.
+    """
+    revs = [r for r in dict.fromkeys(revs) if r]
+    out = {r: _PATCH_IDS[r] for r in revs if r in _PATCH_IDS}
+    todo = [r for r in revs if r not in _PATCH_IDS]
+    if not todo:
+        return out
+    log_cmd = [*GIT_CMD, "log", "--no-walk=unsorted", "-p", "--format=commit %H",
+               "--no-color", "--no-ext-diff", "--no-textconv", "--no-renames",
+               *todo, "--"]
+    import tempfile
+    try:
+        with tempfile.TemporaryFile() as err, span("git log | patch-id", revs=len(todo)) as sp:
+            log = subprocess.Popen(log_cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=err)
+            try:
+                pid = subprocess.Popen([*GIT_CMD, "patch-id", "--stable"], cwd=cwd,
+                                       stdin=log.stdout, stdout=subprocess.PIPE,
+                                       stderr=subprocess.DEVNULL)
+            except OSError:
+                log.kill()
+                log.wait()
+                raise
+            log.stdout.close()  # patch-id owns the read end now
+            try:
+                data, _ = pid.communicate(timeout=timeout)
+                log_rc = log.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                log.kill()
+                pid.kill()
+                log.wait()
+                pid.wait()
+                debug_log(f"git patch-id: timed out after {timeout}s")
+                return None
+            sp.set(rc=log_rc)
+            if log_rc != 0 or pid.returncode != 0:
+                err.seek(0)
+                debug_log(f"git patch-id failed rc={log_rc}/{pid.returncode}: "
+                          f"{err.read(200).decode('utf-8', errors='replace')}")
+                return None
+    except (FileNotFoundError, OSError) as e:
+        debug_log(f"git patch-id error: {e}")
+        return None
+    for m in _PATCH_ID_RE.finditer(data):
+        patch_id, sha = m.group(1).decode(), m.group(2).decode()
+        _PATCH_IDS[sha] = patch_id
+        out[sha] = patch_id
+    return out
+
+
+def plan_diff_paths(entries, cap=None, hard_cap=None, max_tokens=None):
+    """
+    Decide which files of a diff to fetch patch text for, from numstat
+    entries alone. Returns a plan dict:
+
+      files        every file in the diff, reviewable or not
+      reviewable   text files passing _is_reviewable_source
+      pathological reviewable > hard_cap — callers bail, fetching nothing
+      entries      the (path, old_path, added, removed) entries to fetch
+      dropped      reviewable files left out by `cap` / `max_tokens`
+      est_tokens   rough prompt tokens of the chosen files
+
+    Binary files and hunk-less entries (mode-only changes, empty new
+    files) are left out, as the patch parser drops them anyway.
+    Files are taken in _path_priority order (the ranking
+    _prioritize_diff_files applies to patch text) up to `cap` files and,
+    with `max_tokens`, while the running estimate stays within it — the
+    highest-priority file is always kept.
+    """
+    plan = {"files": len(entries), "reviewable": 0, "pathological": False,
+            "entries": [], "dropped": 0, "est_tokens": 0}
+    keep = [e for e in entries
+            if e[2] is not None and e[2] + e[3] and _is_reviewable_source(e[0])]
+    plan["reviewable"] = len(keep)
+    if hard_cap is not None and len(keep) > hard_cap:
+        plan["pathological"] = True
+        return plan
+    if (cap is not None and len(keep) > cap) or max_tokens is not None:
+        keep = sorted(keep, key=lambda e: _path_priority(e[0], e[2]), reverse=True)
+    chosen, est = [], 0
+    for e in keep:
+        t = (e[2] + e[3]) * _NUMSTAT_TOKENS_PER_LINE
+        if cap is not None and len(chosen) >= cap:
+            break
+        if max_tokens is not None and chosen and est + t > max_tokens:
+            continue
+        chosen.append(e)
+        est += t
+    plan["entries"] = chosen
+    plan["dropped"] = len(keep) - len(chosen)
+    plan["est_tokens"] = est
+    return plan
+
+
+def _literal_pathspec(entries):
+    """`-- :(top,literal)path ...` for planned entries (root-relative, as
+    numstat prints them, whatever the cwd). A rename's old path goes in too
+    so git still pairs it instead of showing the new path as all-added."""
+    spec = ["--"]
+    for path, old, _a, _d in entries:
+        spec.append(":(top,literal)" + path)
+        if old:
+            spec.append(":(top,literal)" + old)
+    return spec
+
+
+def planned_diff_files(numstat_cmd, patch_cmd, cwd, env=None, timeout=30,
+                       cap=None, hard_cap=None, max_tokens=None, plan_out=None):
+    """
+    Numstat-first diff: run `numstat_cmd` (a `--numstat -z` variant of the
+    diff), plan with plan_diff_paths, then stream patch text via
+    `patch_cmd` (no pathspec — the planned paths are appended) for the
+    chosen files only. An over-cap or pathological diff therefore never
+    materializes its full patch: git only generates hunks for the files
+    that will be reviewed.
+
+    Returns (path, content) tuples like parse_diff_into_files, [] when
+    nothing is reviewable or the diff is pathological, None on git failure.
+    `plan_out`, if given, receives the plan dict.
+    """
+    entries = git_numstat(numstat_cmd, cwd, env=env, timeout=timeout)
+    if entries is None:
+        return None
+    plan = plan_diff_paths(entries, cap=cap, hard_cap=hard_cap, max_tokens=max_tokens)
+    if plan_out is not None:
+        plan_out.update(plan)
+    if plan["pathological"] or not plan["entries"]:
+        return []
+    return stream_diff_files(patch_cmd + _literal_pathspec(plan["entries"]),
+                             cwd, env=env, timeout=timeout)
+
+
+def _filter_rewrite(diff_content):
+    """filter_preexisting_from_diff for one file's diff text: the rebuilt
+    text, or `diff_content` itself when nothing was re-added."""
+    lines = diff_content.split('\n')
+    # Tag and normalized text of every line, counted as (tag, text) pairs.
+    # Stripping context lines too is wasted work, but keeps both lists and
+    # the Counter in C loops, which is what makes this faster than testing
+    # each line's prefix first. ---/+++ lines get no tag, as before.
+    tags = [l[:1] for l in lines]
+    keys = [l[1:].strip() for l in lines]
+    if '\n---' in diff_content or '\n+++' in diff_content \
+            or diff_content.startswith(('---', '+++')):
+        for i, l in enumerate(lines):
+            if l.startswith(('---', '+++')):
+                tags[i] = ''
+    counts = Counter(zip(tags, keys))
+    # Each text is matched min(removed, added) times — a removed line masks
+    # exactly one re-added copy of itself, not every copy.
+    to_context = {}
+    for (tag, k), n in counts.items():
+        if tag == '-':
+            m = counts.get(('+', k))
+            if m:
+                to_context[k] = min(n, m)
+    if not to_context:
+        # New file, pure deletion, or nothing re-added.
+        return diff_content
+    to_drop = dict(to_context)
+    new_lines = []
+    append = new_lines.append
+    for line, tag, k in zip(lines, tags, keys):
+        if tag == '+':
+            if to_context.get(k):
+                # Pre-existing line re-added: becomes context.
+                to_context[k] -= 1
+                append(' ' + line[1:])
+                continue
+        elif tag == '-':
+            if to_drop.get(k):
+                # The removed copy it matched: dropped (it's context now).
+                to_drop[k] -= 1
+                continue
+        append(line)
+    return '\n'.join(new_lines)
 
 
+@traced()
 def filter_preexisting_from_diff(diff_files, cwd, baseline_sha):
     """
     Filter out pre-existing content from diff files.
     When a file is fully rewritten (Write tool replaces entire content),
     git shows all lines as removed (-) then re-added (+). This function
-    detects such rewrites and strips lines from the + section that also
-    appeared in the - section, so the LLM reviewer only sees truly new code.
+    detects such rewrites and turns each re-added line that matches a
+    removed one back into context, dropping the removed copy, so the LLM
+    reviewer only sees truly new code.
+
+    Matching is a counted multiset of normalized (stripped) lines, one
+    linear pass to count and one to rebuild per file: a removed line
+    cancels exactly one identical added line, so a rewrite that adds a
+    third copy of a line that existed twice still shows that copy as new.
+    The .strip() normalization stays — reindented code is treated as
+    unchanged, which is what the full-file Write rewrite case needs; the
+    diff-review prompt's previous-findings recheck is the backstop.
+    `diff_files` may be any iterable of (path, content).
     """
     if not baseline_sha:
         return diff_files
-
-    filtered = []
-    for file_path, diff_content in diff_files:
-        lines = diff_content.split('\n')
-
-        # Collect removed and added lines (stripping the +/- prefix)
-        removed_lines = set()
-        added_lines = []
-        for line in lines:
-            if line.startswith('-') and not line.startswith('---'):
-                removed_lines.add(line[1:].strip())
-            elif line.startswith('+') and not line.startswith('+++'):
-                added_lines.append(line[1:].strip())
-
-        if not removed_lines:
-            # New file, no pre-existing content to filter
-            filtered.append((file_path, diff_content))
-            continue
-
-        # Check what fraction of added lines were pre-existing
-        preexisting_count = sum(1 for l in added_lines if l in removed_lines)
-        if preexisting_count == 0:
-            filtered.append((file_path, diff_content))
-            continue
-
-        added_lines_set = set(added_lines)
-
-        # Rebuild diff with pre-existing lines converted to context (space prefix).
-        # Known imprecision: .strip() matches across indentation (so reindented
-        # code is treated as unchanged) and the set lets one removal mask N
-        # additions of the same stripped text. Accepted trade-off — this filter
-        # exists for the full-file Write rewrite case where exact-match would
-        # miss everything; the diff-review prompt's previous-findings recheck
-        # is the backstop.
-        new_lines = []
-        for line in lines:
-            if line.startswith('+') and not line.startswith('+++'):
-                content = line[1:].strip()
-                if content in removed_lines:
-                    # Convert to context line (pre-existing, not new)
-                    new_lines.append(' ' + line[1:])
-                else:
-                    new_lines.append(line)
-            elif line.startswith('-') and not line.startswith('---'):
-                content = line[1:].strip()
-                if content in added_lines_set:
-                    # Skip removed lines that were re-added (they become context)
-                    continue
-                else:
-                    new_lines.append(line)
-            else:
-                new_lines.append(line)
-
-        filtered.append((file_path, '\n'.join(new_lines)))
-
-    return filtered
-
+    return [(fp, _filter_rewrite(c)) for fp, c in diff_files]
@@ -0,0 +1,240 @@
+"""
+Latency-adaptive hedged requests for the review calls.
+
+A review call that is slower than usual is more likely stuck (an
+overloaded backend, a wedged SDK child) than about to finish. Waiting a
+fixed time before starting a backup either wastes the tail (180s for the
+agentic race) or doubles spend on calls that were about to return.
+Instead, each kind of call records how long it took in a small latency
+histogram per key ("call:<model>:t<log2 input tokens>", "agentic:<model>"),
+so calls are only compared with others of similar size, and race() starts
+the backup only once the primary has run longer than the key's observed
+SG_HEDGE_PERCENTILE (default p90). About one call in ten pays for a
+backup; the rest finish alone.
+
+Histograms use geometric buckets (x1.25 from 0.25s) and halve their counts
+whenever they pass _WINDOW samples, so old latencies fade out. A key with
+fewer than _MIN_SAMPLES samples has no percentile yet and the caller's
+default applies. A primary abandoned for its backup while still running
+is recorded at the time it was abandoned, a lower bound, so slow calls
+still pull the percentile up; one that had already failed is not.
+
+One JSON file under the state dir, shared across sessions, replaced
+atomically. Concurrent writers can drop each other's samples; that only
+delays adaptation. SG_HEDGE=0 turns adaptation off: callers fall back to
+their fixed delays.
+"""
+import json
+import math
+import os
+import queue
+import tempfile
+import threading
+import time
+
+from _base import debug_log, state_dir as _state_dir
+
+
+ENABLED = os.environ.get("SG_HEDGE", "1").strip().lower() not in ("0", "off", "false", "no")
+PERCENTILE = float(os.environ.get("SG_HEDGE_PERCENTILE", "90"))
+
+LATENCY_HIST_BASENAME = "latency_hist.json"
+_BUCKET_BASE_S = 0.25
+_BUCKET_GROWTH = 1.25
+_N_BUCKETS = 48
+_WINDOW = 200
+_MIN_SAMPLES = 8
+_MAX_KEYS = 64
+
+
+def get_hist_file():
+    return os.path.join(_state_dir(), LATENCY_HIST_BASENAME)
+
+
+def _bucket(seconds):
+    if seconds <= _BUCKET_BASE_S:
+        return 0
+    i = int(math.log(seconds / _BUCKET_BASE_S, _BUCKET_GROWTH))
+    return min(max(i, 0), _N_BUCKETS - 1)
+
+
+def _upper_edge(i):
+    return _BUCKET_BASE_S * _BUCKET_GROWTH ** (i + 1)
+
+
+def _load():
+    try:
+        with open(get_hist_file(), "r") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(hists):
+    path = get_hist_file()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".latency_hist_", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(hists, f)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+    except OSError as e:
+        debug_log(f"hedging: save failed: {e}")
+
+
+def _counts(entry):
+    b = entry.get("b") if isinstance(entry, dict) else None
+    if not isinstance(b, list) or len(b) != _N_BUCKETS:
+        return [0.0] * _N_BUCKETS
+    return [float(x) if isinstance(x, (int, float)) else 0.0 for x in b]
+
+
+def record(key, seconds):
+    """Add one latency sample for `key`."""
+    if not ENABLED or not key or seconds is None or seconds < 0:
+        return
+    hists = _load()
+    counts = _counts(hists.pop(key, None))
+    counts[_bucket(seconds)] += 1
+    if sum(counts) > _WINDOW:
+        counts = [c / 2 for c in counts]
+    hists[key] = {"b": [round(c, 3) for c in counts], "t": time.time()}
+    # Least recently updated keys go first (insertion order = update order).
+    _save(dict(list(hists.items())[-_MAX_KEYS:]))
+
+
+def quantile(key, pct=None):
+    """`pct`-th percentile latency (seconds) for `key`, or None with too
+    few samples. Resolution is one bucket (the bucket's upper edge)."""
+    counts = _counts(_load().get(key))
+    total = sum(counts)
+    if total < _MIN_SAMPLES:
+        return None
+    target = total * (PERCENTILE if pct is None else pct) / 100.0
+    acc = 0.0
+    for i, c in enumerate(counts):
+        acc += c
+        if acc >= target:
+            return _upper_edge(i)
+    return _upper_edge(_N_BUCKETS - 1)
+
+
+def hedge_delay(key, default=None, floor=2.0):
+    """Seconds to give the primary before starting a backup: the key's
+    observed percentile, at least `floor` and at most `default`. `default`
+    (None = no backup until the primary fails) while there is no
+    percentile yet or adaptation is off."""
+    q = quantile(key) if ENABLED else None
+    if q is None:
+        return default
+    q = max(floor, q)
+    return q if default is None else min(q, default)
+
+
+def race(primary, backup, delay_s, key=None, accept=None, grace_s=0.0,
+         cancel=None):
+    """Run `primary`, hedged by `backup` after `delay_s` seconds.
+
+    Both are called with a threading.Event that is set once the other one
+    has won; a leg should stop (cancel its request, close its subprocess)
+    when it sees it. `accept(result)` decides whether a result ends the
+    race (default: not None). A rejected primary result starts the backup
+    at once, as a plain fallback would; `delay_s=None` means only that.
+    With both legs rejected, the last result is returned.
+
+    Legs run on daemon threads, so a loser that ignores its event never
+    holds up the hook's exit; `grace_s` is how long to wait for it to
+    wind down. Primary latencies are recorded under `key`.
+
+    `cancel` is the caller's own event, for a race that is itself a leg of
+    an outer race: once it is set both legs are cancelled, no backup
+    starts, and race() returns as soon as the running legs do.
+
+    Returns (winner, result, backup_started) — winner 1 = primary,
+    2 = backup.
+    """
+    accept = accept or (lambda r: r is not None)
+    results = queue.Queue()
+    cancels = (threading.Event(), threading.Event())
+    threads = []
+
+    def _leg(i, fn):
+        try:
+            r = fn(cancels[i])
+        except Exception as e:  # a leg crash loses the race, not the hook
+            debug_log(f"hedging: leg {i + 1} raised {type(e).__name__}: {e}")
+            r = None
+        results.put((i, r))
+
+    def _start(i, fn):
+        t = threading.Thread(target=_leg, args=(i, fn), daemon=True)
+        t.start()
+        threads.append(t)
+
+    def _stopped():
+        return cancel is not None and cancel.is_set()
+
+    finished = threading.Event()
+    if cancel is not None:
+        def _follow():
+            while not cancel.wait(0.2):
+                if finished.is_set():
+                    return
+            for c in cancels:
+                c.set()
+        threading.Thread(target=_follow, daemon=True).start()
+
+    t0 = time.time()
+    _start(0, primary)
+    pending = 1
+    backup_started = False
+    primary_done = False
+    try:
+        while True:
+            wait = None
+            if (not backup_started and backup is not None and delay_s is not None
+                    and not _stopped()):
+                wait = max(0.0, delay_s - (time.time() - t0))
+            try:
+                i, r = results.get(timeout=wait)
+            except queue.Empty:
+                if not _stopped():
+                    _start(1, backup)
+                    backup_started = True
+                    pending += 1
+                continue
+            pending -= 1
+            primary_done = primary_done or i == 0
+            ok = accept(r)
+            if i == 0 and ok:
+                record(key, time.time() - t0)
+            if ok:
+                other = 1 - i
+                cancels[other].set()
+                if other == 0 and not primary_done:
+                    # Abandoned while still running: a lower bound on its
+                    # latency. A primary that already failed says nothing
+                    # about how long a success takes, so it isn't recorded.
+                    record(key, time.time() - t0)
+                if pending and grace_s > 0:
+                    for t in threads:
+                        t.join(grace_s)
+                return i + 1, r, backup_started
+            if (i == 0 and not backup_started and backup is not None
+                    and not _stopped()):
+                _start(1, backup)
+                backup_started = True
+                pending += 1
+                continue
+            if not pending:
+                return i + 1, r, backup_started
+    finally:
+        finished.set()
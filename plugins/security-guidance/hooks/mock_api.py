@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Anthropic Messages API, for benchmarking the hooks.
+
+Serves ``POST /v1/messages`` the way llm._call_claude uses it: the request's
+``output_config.format.schema`` is answered with a schema-shaped JSON object
+in a single text block, with a ``usage`` dict so _record_usage runs. Point
+the hooks at it through the normal gateway path:
+
+    python3 mock_api.py --port 8765 --latency-ms 1500 &
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=bench ...
+
+Knobs (all optional):
+  --latency-ms / --jitter-ms   fixed + uniform random delay per response
+  --ms-per-ktok                extra delay per 1000 estimated input tokens
+  --rate-429 / --rate-529      probability of answering 429 / 529 instead
+  --vuln-marker                + lines containing this string in a
+                               ``=== DIFF: path ===`` section come back as a
+                               high-severity finding for that path
+                               (default SG_BENCH_VULN)
+  --findings FILE              JSON list of findings returned on every call
+                               instead
+
+Cache accounting mimics prompt caching: a ``cache_control`` block whose text
+was already seen is reported as cache_read_input_tokens, else as
+cache_creation_input_tokens.
+
+``GET /__stats`` returns counters (requests, request bytes, injected errors,
+per-path counts); ``POST /__reset`` zeroes them. bench_hooks.py runs this
+in-process and reads the counters directly.
+"""
+import argparse
+import hashlib
+import http.server
+import json
+import random
+import re
+import sys
+import threading
+import time
+
+_SECTION_RE = re.compile(r"^=== (?:DIFF|FILE): (.+?) ===$", re.M)
+
+
+def _estimate_tokens(text):
+    # Same ~4 bytes/token rule of thumb the hooks fall back to; the mock
+    # only needs plausible usage numbers.
+    return len(text) // 4 + 1
+
+
+def _prompt_text(content):
+    if isinstance(content, str):
+        return content
+    return "\n".join(b.get("text", "") for b in content if isinstance(b, dict))
+
+
+def _marker_findings(text, marker):
+    """One finding per + line carrying `marker`, attributed to the file
+    section it sits in."""
+    out = []
+    sections = list(_SECTION_RE.finditer(text))
+    for k, m in enumerate(sections):
+        end = sections[k + 1].start() if k + 1 < len(sections) else len(text)
+        for line in text[m.end():end].split("\n"):
+            if line.startswith("+") and marker in line:
+                out.append({
+                    "filePath": m.group(1),
+                    "category": "command_injection",
+                    "vulnerableCode": line[1:].strip()[:200],
+                    "explanation": "Benchmark finding: marked line reaches a shell sink.",
+                    "fix": "Pass arguments as a list and avoid the shell.",
+                    "severity": "high",
+                    "confidence": 0.9,
+                })
+    return out
+
+
+def _instance(schema, findings):
+    """Smallest JSON value satisfying `schema`, with `findings` placed in the
+    first array-of-objects property and every boolean sibling of it set to
+    whether there are any."""
+    t = schema.get("type")
+    if "enum" in schema:
+        return schema["enum"][0]
+    if t == "object":
+        props = schema.get("properties") or {}
+        out = {}
+        list_key = next((k for k, p in props.items()
+                         if p.get("type") == "array"
+                         and (p.get("items") or {}).get("type") == "object"), None)
+        for k, p in props.items():
+            if k == list_key:
+                item = p.get("items") or {}
+                out[k] = [_shape(item, f) for f in findings]
+            elif p.get("type") == "boolean" and list_key is not None:
+                out[k] = bool(findings)
+            else:
+                out[k] = _instance(p, [])
+        return out
+    if t == "array":
+        return []
+    if t == "boolean":
+        return False
+    if t in ("number", "integer"):
+        return 0
+    return ""
+
+
+def _shape(item_schema, finding):
+    """`finding` trimmed/padded to `item_schema`'s properties."""
+    props = item_schema.get("properties") or {}
+    out = {}
+    for k, p in props.items():
+        v = finding.get(k)
+        if v is None or ("enum" in p and v not in p["enum"]):
+            v = _instance(p, [])
+        out[k] = v
+    return out
+
+
+class MockAnthropic:
+    """ThreadingHTTPServer on 127.0.0.1 plus the behaviour knobs. start()
+    serves on a daemon thread; base_url is what ANTHROPIC_BASE_URL takes."""
+
+    def __init__(self, port=0, latency_ms=0, jitter_ms=0, ms_per_ktok=0.0,
+                 rate_429=0.0, rate_529=0.0, vuln_marker="SG_BENCH_VULN",
+                 findings=None, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.ms_per_ktok = ms_per_ktok
+        self.rate_429 = rate_429
+        self.rate_529 = rate_529
+        self.vuln_marker = vuln_marker
+        self.findings = findings
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._seen_prefixes = set()
+        self.reset()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def reset(self):
+        with self._lock:
+            self.stats = {"requests": 0, "request_bytes": 0, "responses_200": 0,
+                          "injected_429": 0, "injected_529": 0, "findings": 0,
+                          "input_tokens": 0, "cache_read_tokens": 0, "paths": {}}
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self.stats))
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _usage(self, req):
+        """(input, cache_read, cache_creation) token counts for `req`."""
+        fresh = _estimate_tokens(str(req.get("system", "")))
+        cache_read = cache_write = 0
+        for msg in req.get("messages") or []:
+            content = msg.get("content")
+            blocks = [{"text": content}] if isinstance(content, str) else content or []
+            for b in blocks:
+                if not isinstance(b, dict):
+                    continue
+                n = _estimate_tokens(b.get("text", ""))
+                if b.get("cache_control"):
+                    h = hashlib.sha256(b.get("text", "").encode("utf-8", "replace")).digest()
+                    with self._lock:
+                        hit = h in self._seen_prefixes
+                        self._seen_prefixes.add(h)
+                    if hit:
+                        cache_read += n
+                    else:
+                        cache_write += n
+                else:
+                    fresh += n
+        return fresh, cache_read, cache_write
+
+    def respond(self, raw):
+        """(status, body dict) for one /v1/messages request body."""
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["request_bytes"] += len(raw)
+        try:
+            req = json.loads(raw.decode("utf-8"))
+        except ValueError:
+            return 400, {"type": "error", "error": {"type": "invalid_request_error",
+                                                   "message": "body is not JSON"}}
+        fresh, cache_read, cache_write = self._usage(req)
+        delay = self.latency_ms + self._rng.uniform(0, self.jitter_ms)
+        delay += self.ms_per_ktok * (fresh + cache_read + cache_write) / 1000.0
+        time.sleep(delay / 1000.0)
+        roll = self._rng.random()
+        if roll < self.rate_429:
+            with self._lock:
+                self.stats["injected_429"] += 1
+            return 429, {"type": "error", "error": {"type": "rate_limit_error",
+                                                   "message": "injected by mock_api"}}
+        if roll < self.rate_429 + self.rate_529:
+            with self._lock:
+                self.stats["injected_529"] += 1
+            return 529, {"type": "error", "error": {"type": "overloaded_error",
+                                                   "message": "injected by mock_api"}}
+        text = "".join(_prompt_text(m.get("content")) for m in req.get("messages") or [])
+        findings = (self.findings if self.findings is not None
+                    else _marker_findings(text, self.vuln_marker))
+        schema = ((req.get("output_config") or {}).get("format") or {}).get("schema")
+        answer = _instance(schema, findings) if schema else {}
+        with self._lock:
+            self.stats["responses_200"] += 1
+            self.stats["findings"] += len(findings)
+            self.stats["input_tokens"] += fresh + cache_read + cache_write
+            self.stats["cache_read_tokens"] += cache_read
+        return 200, {
+            "id": "msg_mock", "type": "message", "role": "assistant",
+            "model": req.get("model", ""), "stop_reason": "end_turn",
+            "content": [{"type": "text", "text": json.dumps(answer)}],
+            "usage": {"input_tokens": fresh, "output_tokens": 50 + 80 * len(findings),
+                      "cache_read_input_tokens": cache_read,
+                      "cache_creation_input_tokens": cache_write},
+        }
+
+    def _handler(self):
+        mock = self
+
+        class _Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this the
+            # server stalls keep-alive clients on Nagle + delayed ACK.
+            disable_nagle_algorithm = True
+
+            def _send(self, status, obj=None):
+                body = json.dumps(obj).encode() if obj is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                if status == 429:
+                    self.send_header("retry-after", "1")
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def _count_path(self):
+                with mock._lock:
+                    paths = mock.stats["paths"]
+                    key = f"{self.command} {self.path}"
+                    paths[key] = paths.get(key, 0) + 1
+
+            def do_HEAD(self):
+                self._count_path()
+                self._send(200)
+
+            def do_GET(self):
+                if self.path == "/__stats":
+                    self._send(200, mock.snapshot())
+                    return
+                self._count_path()
+                self._send(404, {"type": "error", "error": {"type": "not_found_error"}})
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.path == "/__reset":
+                    mock.reset()
+                    self._send(200, {})
+                    return
+                self._count_path()
+                if self.path.split("?")[0] != "/v1/messages":
+                    self._send(404, {"type": "error", "error": {"type": "not_found_error"}})
+                    return
+                self._send(*mock.respond(raw))
+
+            def log_message(self, *a):
+                pass
+
+        return _Handler
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=0)
+    ap.add_argument("--jitter-ms", type=float, default=0)
+    ap.add_argument("--ms-per-ktok", type=float, default=0)
+    ap.add_argument("--rate-429", type=float, default=0)
+    ap.add_argument("--rate-529", type=float, default=0)
+    ap.add_argument("--vuln-marker", default="SG_BENCH_VULN")
+    ap.add_argument("--findings", help="JSON file with a list of findings to return on every call")
+    ap.add_argument("--seed", type=int)
+    a = ap.parse_args(argv)
+    findings = None
+    if a.findings:
+        with open(a.findings) as f:
+            findings = json.load(f)
+    mock = MockAnthropic(a.port, a.latency_ms, a.jitter_ms, a.ms_per_ktok, a.rate_429,
+                         a.rate_529, a.vuln_marker, findings, a.seed)
+    print(f"mock Anthropic API on {mock.base_url}  (ANTHROPIC_BASE_URL={mock.base_url})",
+          flush=True)
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
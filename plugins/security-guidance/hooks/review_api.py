@@ -16,7 +16,8 @@ from __future__ import annotations
 
 import json
 import os
-from typing import Any
+import re
+from typing import Any, Callable
 
 import extensibility
 
@@ -24,44 +25,191 @@ import extensibility
 # Diff capping
 # ---------------------------------------------------------------------------
 
+# Legacy byte caps. The prompt budget is in tokens now; these still seed the
+# token defaults (so an existing DIFF_*_BYTES override keeps its meaning at
+# ~4 bytes/token) and size shards in llm.plan_review_shards.
 DIFF_PER_FILE_BYTES = int(os.environ.get("DIFF_PER_FILE_BYTES", "80000"))
 DIFF_TOTAL_BYTES = int(os.environ.get("DIFF_TOTAL_BYTES", "400000"))
+DIFF_PER_FILE_TOKENS = int(os.environ.get("DIFF_PER_FILE_TOKENS", str(DIFF_PER_FILE_BYTES // 4)))
+DIFF_TOTAL_TOKENS = int(os.environ.get("DIFF_TOTAL_TOKENS", str(DIFF_TOTAL_BYTES // 4)))
+
+# One piece ≈ one BPE token: a capitalised or lowercase word part (so
+# camelCase splits), a 1-3 digit run, an indentation run, a newline, or a
+# single punctuation character. Within ~10% of the real tokenizer on source
+# diffs, where a flat bytes/4 is off by 2x either way on minified or
+# whitespace-heavy files.
+_TOKEN_PIECE_RE = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d{1,3}|[ \t]{2,}|\n|[^\sA-Za-z\d]")
+# Below this many tokens left, a partial cut isn't worth its marker.
+_MIN_PARTIAL_TOKENS = 200
+
+_OMITTED_MARKER = "[omitted by security-guidance: diff token budget reached]"
+_TRUNCATED_MARKER = "... [truncated by security-guidance: diff token budget reached]"
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast local approximation of the model's input-token count for `text`."""
+    return len(_TOKEN_PIECE_RE.findall(text))
+
+
+def _split_hunks(content: str) -> tuple[list[str], list[list[str]]]:
+    """(header lines, hunks); each hunk starts with its ``@@`` line. Content
+    without hunks (full files, rename-only diffs) is all header."""
+    header: list[str] = []
+    hunks: list[list[str]] = []
+    for line in content.split("\n"):
+        if line.startswith("@@"):
+            hunks.append([line])
+        elif hunks:
+            hunks[-1].append(line)
+        else:
+            header.append(line)
+    return header, hunks
+
+
+def _is_change(line: str) -> bool:
+    return line[:1] in ("+", "-", "\\")
+
+
+def _trim_context(hunk: list[str], ctx: int) -> list[str]:
+    """Keep changed lines and up to `ctx` context lines either side of them;
+    runs of 2+ dropped context lines collapse into one marker line."""
+    body = hunk[1:]
+    keep = [False] * len(body)
+    for i, line in enumerate(body):
+        if _is_change(line):
+            for j in range(max(0, i - ctx), min(len(body), i + ctx + 1)):
+                keep[j] = True
+    out = [hunk[0]]
+    i = 0
+    while i < len(body):
+        if keep[i]:
+            out.append(body[i])
+            i += 1
+            continue
+        j = i
+        while j < len(body) and not keep[j]:
+            j += 1
+        if j - i == 1:
+            out.append(body[i])
+        else:
+            out.append(f"... [{j - i} context lines elided by security-guidance]")
+        i = j
+    return out
+
+
+def _hunk_priority(hunk: list[str]) -> tuple[int, int]:
+    added = sum(1 for line in hunk if line.startswith("+"))
+    removed = sum(1 for line in hunk if line.startswith("-"))
+    return added, removed
+
+
+def _lines_cost(lines: list[str]) -> int:
+    return sum(estimate_tokens(line) + 1 for line in lines)
+
+
+def _fit_file(content: str, budget: int, partial: bool = True) -> str | None:
+    """Shrink one file's diff to `budget` tokens, least-signal first:
+    context lines down to 1 then 0 around each change, then whole hunks
+    with the fewest added/removed lines, then (only if `partial`) a tail
+    cut of what remains. Returns None when it can't fit without a partial
+    cut and `partial` is False."""
+    if estimate_tokens(content) <= budget:
+        return content
+    header, hunks = _split_hunks(content)
+    lines = header
+    if hunks:
+        for ctx in (1, 0):
+            trimmed = [_trim_context(h, ctx) for h in hunks]
+            cost = _lines_cost(header) + sum(_lines_cost(h) for h in trimmed)
+            if cost <= budget:
+                return "\n".join(header + [l for h in trimmed for l in h])
+        # Drop whole hunks, fewest changed lines first, keeping the top one.
+        # One summary line stands in for all of them.
+        shown = list(trimmed)
+        costs = [_lines_cost(h) for h in trimmed]
+        cost = _lines_cost(header) + sum(costs) + 20
+        n_omitted = added_omitted = 0
+        for i in sorted(range(len(trimmed)), key=lambda i: _hunk_priority(trimmed[i]))[:-1]:
+            shown[i] = []
+            n_omitted += 1
+            added_omitted += _hunk_priority(trimmed[i])[0]
+            cost -= costs[i]
+            if cost <= budget:
+                break
+        lines = header + [l for h in shown for l in h]
+        if n_omitted:
+            lines.append(f"... [{n_omitted} lower-signal hunks ({added_omitted} added "
+                         "lines) omitted by security-guidance: diff token budget reached]")
+        if cost <= budget:
+            return "\n".join(lines)
+    if not partial:
+        return None
+    room = budget - estimate_tokens(_TRUNCATED_MARKER) - 1
+    out: list[str] = []
+    for line in lines:
+        c = estimate_tokens(line) + 1
+        if c > room:
+            break
+        room -= c
+        out.append(line)
+    return "\n".join(out + [_TRUNCATED_MARKER])
 
 
 def cap_diff_for_prompt(
     files: list[tuple[str, str]],
+    priority: Callable[[tuple[str, str]], Any] | None = None,
 ) -> tuple[list[tuple[str, str]], int]:
-    """Cap per-file and total diff bytes; return (capped_files, bytes_dropped).
-
-    Truncation markers are written inside the content so the reviewer
-    knows the file is incomplete.
+    """Pack files into the prompt token budget; return (packed_files,
+    tokens_dropped). Output keeps the input order.
+
+    Each file is first held to DIFF_PER_FILE_TOKENS with _fit_file. Then,
+    highest `priority` first (default: gitutil.diff_file_priority), a file
+    goes in whole if it fits what's left, else with context trimmed and
+    low-signal hunks dropped if that fits; otherwise it waits. Lower-priority
+    files that fit whole still go in after it, and the waiting files get a
+    partial cut of whatever budget remains. One huge generated file no
+    longer starves everything after it. Truncation markers are written
+    inside the content so the reviewer knows the file is incomplete.
     """
-    out: list[tuple[str, str]] = []
+    if priority is None:
+        from gitutil import diff_file_priority as priority
     dropped = 0
-    total = 0
-    for fp, content in files:
-        if len(content) > DIFF_PER_FILE_BYTES:
-            dropped += len(content) - DIFF_PER_FILE_BYTES
-            content = (
-                content[:DIFF_PER_FILE_BYTES]
-                + "\n... [truncated by security-guidance: file exceeds per-file byte cap]"
-            )
-        room = DIFF_TOTAL_BYTES - total
-        if room <= 0:
-            dropped += len(content)
-            out.append(
-                (fp, "[omitted by security-guidance: total diff byte cap reached]")
-            )
+    fitted: list[str] = []
+    costs: list[int] = []
+    for _fp, content in files:
+        full = estimate_tokens(content)
+        c = _fit_file(content, DIFF_PER_FILE_TOKENS)
+        n = estimate_tokens(c) if c is not content else full
+        dropped += max(0, full - n)
+        fitted.append(c)
+        costs.append(n)
+    out: list[str | None] = [None] * len(files)
+    room = DIFF_TOTAL_TOKENS
+    waiting: list[int] = []
+    for i in sorted(range(len(files)), key=lambda i: priority(files[i]), reverse=True):
+        if costs[i] <= room:
+            out[i] = fitted[i]
+            room -= costs[i]
             continue
-        if len(content) > room:
-            dropped += len(content) - room
-            content = (
-                content[:room]
-                + "\n... [truncated by security-guidance: total diff byte cap reached]"
-            )
-        total += len(content)
-        out.append((fp, content))
-    return out, dropped
+        c = _fit_file(fitted[i], room, partial=False) if room > 0 else None
+        if c is None:
+            waiting.append(i)
+            continue
+        n = estimate_tokens(c)
+        out[i] = c
+        room -= n
+        dropped += costs[i] - n
+    for i in waiting:
+        if room >= _MIN_PARTIAL_TOKENS:
+            c = _fit_file(fitted[i], room)
+            n = estimate_tokens(c)
+            out[i] = c
+            room -= n
+            dropped += max(0, costs[i] - n)
+        else:
+            out[i] = _OMITTED_MARKER
+            dropped += costs[i]
+    return [(fp, c) for (fp, _), c in zip(files, out)], dropped
 
 
 # ---------------------------------------------------------------------------
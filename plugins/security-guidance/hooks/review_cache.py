@@ -0,0 +1,186 @@
+"""
+Content-addressed review cache for the security-guidance plugin.
+
+The Stop hook re-reviews the whole diff since the baseline on every fire
+(up to MAX_STOP_HOOK_FIRINGS), and commit/push reviews often cover hunks a
+Stop fire already looked at. Most of that input is byte-identical between
+calls: a fix to one file leaves every other file's hunks unchanged.
+
+The cache unit is one file's diff. Its key hashes:
+  - the reviewer kind and model env (single-shot vs agentic, dual_or),
+  - the prompt version (llm.py / review_api.py source plus the project's
+    claude-security-guidance.md block),
+  - the file path and the previous_findings categories already reported for
+    it (the prompt tells the model not to re-flag those, so they shape the
+    verdict),
+  - the hunks with line numbers stripped from the ``@@`` headers, so an edit
+    elsewhere in the file that only shifts offsets still hits.
+The value is that file's findings, or [] for a clean verdict. Verdicts are
+only stored when the review actually completed (no API failure, nothing
+truncated), so a failed call is never remembered as "clean".
+
+Trade-off: a hit removes the file from the prompt, so a cross-file flow
+between an unchanged file and a changed one is only seen if the changed
+file's own hunks show it. ``SG_REVIEW_CACHE=0`` turns the cache off.
+
+One JSON file under the state dir, shared across sessions, replaced
+atomically. Concurrent writers can drop each other's new entries; that only
+costs a future miss.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+
+import extensibility
+from _base import debug_log, state_dir as _state_dir
+from tracing import traced
+
+
+REVIEW_CACHE_BASENAME = "review_cache.json"
+REVIEW_CACHE_MAX_ENTRIES = 2000
+REVIEW_CACHE_TTL_SEC = 7 * 24 * 3600
+
+_HUNK_HEADER_RE = re.compile(r"^@@ -\d+(?:,\d+)? \+\d+(?:,\d+)? @@")
+_PROMPT_SOURCES = ("llm.py", "review_api.py")
+_prompt_digest = None
+
+
+def enabled():
+    return os.environ.get("SG_REVIEW_CACHE", "1").strip().lower() not in ("0", "off", "false", "no")
+
+
+def get_cache_file():
+    return os.path.join(_state_dir(), REVIEW_CACHE_BASENAME)
+
+
+def _prompt_source_digest():
+    """Hash of the modules that build the review prompts, once per process."""
+    global _prompt_digest
+    if _prompt_digest is None:
+        h = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in _PROMPT_SOURCES:
+            try:
+                with open(os.path.join(here, name), "rb") as f:
+                    h.update(f.read())
+            except OSError:
+                h.update(name.encode())
+        _prompt_digest = h.hexdigest()
+    return _prompt_digest
+
+
+def reviewer_tag(kind):
+    """Everything besides the prompt source that changes what a `kind`
+    ("single" or "agentic") reviewer answers."""
+    if kind == "agentic":
+        model = os.environ.get("SG_AGENTIC_MODEL", "")
+    else:
+        model = "{}|{}".format(os.environ.get("SECURITY_REVIEW_MODEL", "").strip(),
+                               os.environ.get("SG_DUAL_OR", "").strip().lower())
+    guidance = hashlib.sha256(extensibility.guidance_block().encode("utf-8")).hexdigest()
+    return f"{kind}|{model}|{_prompt_source_digest()}|{guidance}"
+
+
+def normalize_hunks(diff_content):
+    """Per-file diff with hunk-header line numbers dropped (the function
+    context after the second @@ is kept)."""
+    return "\n".join(_HUNK_HEADER_RE.sub("@@", line) if line.startswith("@@") else line
+                     for line in diff_content.split("\n"))
+
+
+def unit_key(tag, file_path, diff_content, previous_findings=None):
+    prev = sorted({
+        str(f.get("category", ""))
+        for f in (previous_findings or [])
+        if isinstance(f, dict) and f.get("filePath", "") == file_path
+    })
+    h = hashlib.sha256()
+    for part in (tag, file_path, "\x1f".join(prev), normalize_hunks(diff_content)):
+        h.update(part.encode("utf-8", errors="replace"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def _load():
+    try:
+        with open(get_cache_file(), "r") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(entries):
+    path = get_cache_file()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".review_cache_", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+    except OSError as e:
+        debug_log(f"review_cache: save failed: {e}")
+
+
+@traced()
+def lookup(diff_files, kind, previous_findings=None):
+    """Split `diff_files` into cache misses and cached findings.
+
+    Returns (misses, cached_vulns, keys, hits). `misses` keeps the input
+    order. `keys` maps file path to unit key for every input file; pass it
+    back to store()."""
+    if not enabled() or not diff_files:
+        return list(diff_files), [], {}, 0
+    tag = reviewer_tag(kind)
+    keys = {fp: unit_key(tag, fp, content, previous_findings) for fp, content in diff_files}
+    entries = _load()
+    now = time.time()
+    misses, cached, hits = [], [], 0
+    for fp, content in diff_files:
+        e = entries.get(keys[fp])
+        if (isinstance(e, dict) and isinstance(e.get("v"), list)
+                and now - e.get("t", 0) <= REVIEW_CACHE_TTL_SEC):
+            hits += 1
+            cached.extend(v for v in e["v"] if isinstance(v, dict))
+        else:
+            misses.append((fp, content))
+    if hits:
+        debug_log(f"review_cache[{kind}]: {hits} hit(s), {len(misses)} miss(es)")
+    return misses, cached, keys, hits
+
+
+@traced()
+def store(keys, reviewed_files, vulns):
+    """Record one completed review of `reviewed_files`. Each file's entry is
+    the findings whose filePath names it; files with none are stored clean.
+    If any finding's path doesn't name a reviewed file nothing is stored —
+    it can't be attributed, and caching its real file as clean would lose
+    it."""
+    if not keys or not reviewed_files:
+        return
+    by_path = {fp: [] for fp, _ in reviewed_files}
+    for v in vulns or []:
+        if not isinstance(v, dict) or v.get("filePath", "") not in by_path:
+            debug_log("review_cache: unattributable finding; not caching this review")
+            return
+        by_path[v["filePath"]].append(v)
+    entries = _load()
+    now = time.time()
+    for fp, found in by_path.items():
+        k = keys.get(fp)
+        if k:
+            entries.pop(k, None)
+            entries[k] = {"t": now, "v": found}
+    live = [(k, e) for k, e in entries.items()
+            if isinstance(e, dict) and now - e.get("t", 0) <= REVIEW_CACHE_TTL_SEC]
+    _save(dict(live[-REVIEW_CACHE_MAX_ENTRIES:]))
@@ -57,7 +57,6 @@ try:
 except ImportError:
     fcntl = None
 import contextlib
-import glob
 import json
 import os
 import random
@@ -65,18 +64,11 @@ import re
 import subprocess
 import sys
 import threading
-import urllib.request
 from datetime import datetime
 from enum import IntEnum
-from typing import Optional, Tuple, Dict, Any, List
+from typing import TYPE_CHECKING, Optional, Tuple, Dict, Any, List
 
-# review_api is the importable surface for the agentic-review prompts,
-# schemas, and pure filters.  External callers (e.g. agentic review harnesses)
-# import review_api directly so they run the same eval-covered prompts
-# without going through the CC hook protocol.  The underscored names below
-# alias into it so this script stays the single CC-hook entrypoint.
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-import review_api  # noqa: E402
 from _base import (  # noqa: E402,F401
     DEBUG_LOG_FILE, DEBUG_LOG_MAX_BYTES, debug_log,
     PROVENANCE_TAG, PROVENANCE_BANNER,
@@ -85,11 +77,13 @@ from _base import (  # noqa: E402,F401
     state_dir as _resolve_state_dir,
 )
 import extensibility  # noqa: E402
+import tracing  # noqa: E402
+from tracing import span, traced  # noqa: E402
 from patterns import (  # noqa: E402,F401
     _JS_EXTS, _PY_EXTS, _DOC_EXTS,
     _UNSAFE_DESERIALIZATION_REMINDER, _UNSAFE_YAML_LOAD_REMINDER,
     _UNSAFE_TORCH_LOAD_REMINDER, SECURITY_PATTERNS, RuleId,
-    _RULE_NAME_TO_ID, rule_names_to_mask,
+    _RULE_NAME_TO_ID, rule_names_to_mask, CompiledRules, compiled_rules,
 )
 from session_state import (  # noqa: E402,F401
     _state_key, get_state_file, get_lock_file, cleanup_old_state_files,
@@ -99,40 +93,116 @@ from gitutil import (  # noqa: E402,F401
     GIT_CMD,
     _git_rev_parse_head, _find_git_index, _diff_pathspec, _temp_index,
     _git_toplevel, _git_dir, _git_rev_list_range, _git_diff_range,
+    _git_diff_range_files, git_commit_paths,
     _detect_main_branch, _git_reflog_recent_commits, _git_name_only,
-    _git_status_porcelain, _is_ancestor, get_git_diff,
+    _git_status_porcelain, _git_status_v2, run_concurrently, _is_ancestor, get_git_diff, get_git_diff_files,
     SOURCE_CODE_EXTENSIONS, SOURCE_CODE_BASENAMES,
     NON_SOURCE_EXTENSIONLESS_BASENAMES, SKIP_PATH_PATTERNS,
     SKIP_FILE_SUFFIXES, _SECURITY_RISK_PATH_TOKENS,
     _LOW_PRIORITY_SUFFIXES, _LOW_PRIORITY_PATH_TOKENS,
     _prioritize_diff_files, _is_reviewable_source,
     extract_file_paths_from_diff, parse_diff_into_files,
+    iter_diff_files, stream_diff_files, git_numstat, plan_diff_paths,
+    git_patch_ids,
+    planned_diff_files, _literal_pathspec,
     filter_preexisting_from_diff,
+    GitObjectReader, git_object_reader,
 )
 from diffstate import (  # noqa: E402,F401
     STOP_LOOP_STATE_TTL_SEC, PREVIOUS_FINDINGS_TTL_SEC,
     save_baseline_sha, load_baseline_sha, record_touched_path,
     consume_stop_state, restore_unreviewed_stop_state,
-    get_baseline_file_content, capture_git_baseline,
+    get_baseline_file_content, get_baseline_blob_oid,
+    load_baseline_verdict, save_baseline_verdict, capture_git_baseline,
     _REVIEWED_SHAS_BASENAME, _REVIEWED_SHAS_CAP,
     _reviewed_shas_path, _load_reviewed_shas, _append_reviewed_shas,
     UNTRACKED_BASELINE_CAP, _list_untracked, compute_v2_review_set,
+    ASYNC_BASELINE, land_deferred_baseline, await_baseline_capture,
+    set_untracked_baseline, get_untracked_baseline,
 )
-import llm  # noqa: E402  module ref for reassignable globals (_last_call_claude_http_error etc.)
-from llm import (  # noqa: E402,F401
-    ANTHROPIC_API_KEY, ANTHROPIC_AUTH_TOKEN, HAS_API_CREDENTIALS,
-    SECURITY_REVIEW_MODEL, CLAUDE_CODE_SYSTEM_PROMPT,
-    _last_call_claude_http_error,
-    ensure_anthropic_reachable,
-    _last_review_truncated_bytes, _auth_prefer_token,
-    DIFF_PER_FILE_BYTES, DIFF_TOTAL_BYTES, _AGENTIC_INVESTIGATE_SYSTEM,
-    _FINDINGS_SCHEMA, _SURVIVED_SCHEMA, _REWAKE_SUMMARY_BUDGET,
-    _cap_files_for_prompt, _build_auth_headers, _call_claude, _call_claude_dual_or,
-    _format_vulns_guidance, _format_vulns_summary, _finding_keys, _dedup_against_state,
-    analyze_code_security, _agentic_commit_review_enabled, agentic_review,
-    analyze_security_concerns,
+# review_api is the importable surface for the agentic-review prompts,
+# schemas, and pure filters.  External callers (e.g. agentic review harnesses)
+# import review_api directly so they run the same eval-covered prompts
+# without going through the CC hook protocol.  The underscored names below
+# alias into it (via llm) so this script stays the single CC-hook entrypoint.
+#
+# llm and review_api are imported lazily. llm pulls in urllib.request →
+# http.client → email/ssl, which was over half of this module's ~85ms cold
+# import, and only the Stop and PostToolUse[Bash] handlers use it. The
+# per-edit path (check_patterns → atomic_check_and_mark_warning) and
+# UserPromptSubmit never do. Handlers that need it call _ensure_llm() first;
+# external `hook.X` access goes through the module __getattr__ below, so
+# tests that monkeypatch hook.analyze_code_security etc. keep working.
+# Module-level helpers that use these names as bare globals must call
+# _ensure_llm() themselves too, since they can run before any handler has.
+#
+# The TYPE_CHECKING import below never runs; it tells linters and type
+# checkers where the lazily bound names come from. Keep it in step with
+# _LLM_REEXPORTS.
+if TYPE_CHECKING:  # pragma: no cover
+    import llm
+    import review_api
+    from llm import (  # noqa: F401
+        ANTHROPIC_API_KEY, ANTHROPIC_AUTH_TOKEN, HAS_API_CREDENTIALS,
+        SECURITY_REVIEW_MODEL, CLAUDE_CODE_SYSTEM_PROMPT,
+        _last_call_claude_http_error,
+        ensure_anthropic_reachable,
+        _last_review_truncated_tokens, _auth_prefer_token,
+        DIFF_PER_FILE_BYTES, DIFF_TOTAL_BYTES, DIFF_PER_FILE_TOKENS, DIFF_TOTAL_TOKENS,
+        _AGENTIC_INVESTIGATE_SYSTEM, _FINDINGS_SCHEMA, _SURVIVED_SCHEMA,
+        _REWAKE_SUMMARY_BUDGET,
+        _cap_files_for_prompt, _build_auth_headers, _call_claude, _call_claude_dual_or,
+        _format_vulns_guidance, _format_vulns_summary, _finding_keys, _dedup_against_state,
+        analyze_code_security, _agentic_commit_review_enabled, agentic_review,
+        analyze_security_concerns, sharded_review_enabled, plan_review_shards,
+        analyze_code_security_sharded, sharded_diff_token_budget,
+    )
+
+_LLM_REEXPORTS = (
+    "ANTHROPIC_API_KEY", "ANTHROPIC_AUTH_TOKEN", "HAS_API_CREDENTIALS",
+    "SECURITY_REVIEW_MODEL", "CLAUDE_CODE_SYSTEM_PROMPT",
+    "_last_call_claude_http_error",
+    "ensure_anthropic_reachable",
+    "_last_review_truncated_tokens", "_auth_prefer_token",
+    "DIFF_PER_FILE_BYTES", "DIFF_TOTAL_BYTES", "DIFF_PER_FILE_TOKENS", "DIFF_TOTAL_TOKENS", "_AGENTIC_INVESTIGATE_SYSTEM",
+    "_FINDINGS_SCHEMA", "_SURVIVED_SCHEMA", "_REWAKE_SUMMARY_BUDGET",
+    "_cap_files_for_prompt", "_build_auth_headers", "_call_claude", "_call_claude_dual_or",
+    "_format_vulns_guidance", "_format_vulns_summary", "_finding_keys", "_dedup_against_state",
+    "analyze_code_security", "_agentic_commit_review_enabled", "agentic_review",
+    "analyze_security_concerns", "sharded_review_enabled", "plan_review_shards",
+    "analyze_code_security_sharded", "sharded_diff_token_budget",
 )
 
+
+_llm_loaded = False
+
+
+@traced()
+def _ensure_llm():
+    """Import llm/review_api and bind the re-exported names as module globals.
+
+    setdefault, not assignment: a name a test already monkeypatched onto this
+    module must win over the real one. `llm` itself stays a module ref for
+    the reassignable globals (_last_call_claude_http_error etc.)."""
+    global _llm_loaded
+    if _llm_loaded:
+        return
+    import review_api as _review_api
+    import llm as _llm
+    g = globals()
+    g.setdefault("review_api", _review_api)
+    g.setdefault("llm", _llm)
+    for name in _LLM_REEXPORTS:
+        g.setdefault(name, getattr(_llm, name))
+    _llm_loaded = True
+
+
+def __getattr__(name):
+    if name in _LLM_REEXPORTS or name in ("llm", "review_api"):
+        _ensure_llm()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 # LLM-based code security review (enabled by default when API key is available)
 # Empty string or unset = enabled (default); "0" = disabled
 _enable_code_review_str = os.environ.get("ENABLE_CODE_SECURITY_REVIEW", "1")
@@ -449,12 +519,16 @@ def sweep_pending_warnings(session_id):
 # Pattern matching
 # =====================================================================
 
-def check_patterns(file_path, content):
-    """Check if file path or content matches any security patterns. Returns ALL matches."""
+def _pattern_gates(file_path):
+    """(rules, path_matched, content_candidates) for `file_path`: the active
+    rule list, indices that match on path alone, and indices whose content
+    half still needs checking."""
     normalized_path = file_path.lstrip("/")
-    matches = []
+    rules = list(SECURITY_PATTERNS) + extensibility.user_patterns()
+    path_matched = set()
+    content_candidates = []
 
-    for pattern in list(SECURITY_PATTERNS) + extensibility.user_patterns():
+    for i, pattern in enumerate(rules):
         # path_filter is a gate: when present, the rule only applies to
         # matching paths. Distinct from path_check, which is itself a
         # positive match condition (e.g. .github/workflows/).
@@ -465,32 +539,67 @@ def check_patterns(file_path, content):
             except Exception:
                 continue
 
-        matched = False
-
         if "path_check" in pattern:
             try:
                 if pattern["path_check"](normalized_path):
-                    matched = True
+                    path_matched.add(i)
+                    continue
             except Exception:
                 pass
 
-        if not matched and "substrings" in pattern and content:
-            for substring in pattern["substrings"]:
-                if substring in content:
-                    matched = True
-                    break
+        content_candidates.append(i)
+    return rules, path_matched, content_candidates
 
-        if not matched and "regex" in pattern and content:
-            try:
-                if re.search(pattern["regex"], content):
-                    matched = True
-            except Exception:
-                pass
 
-        if matched:
-            matches.append((pattern["ruleName"], pattern["reminder"]))
+@traced()
+def check_patterns(file_path, content):
+    """Check if file path or content matches any security patterns. Returns ALL matches."""
+    rules, path_matched, content_candidates = _pattern_gates(file_path)
+    # Substrings + regexes for every surviving rule in one factor-prefiltered
+    # pass; see patterns.CompiledRules. Same verdicts as per-rule
+    # `substring in content` / re.search, in rule order.
+    content_matched = (
+        compiled_rules(rules).matching(content, content_candidates)
+        if content and content_candidates else set()
+    )
+    return [
+        (pattern["ruleName"], pattern["reminder"])
+        for i, pattern in enumerate(rules)
+        if i in path_matched or i in content_matched
+    ]
 
-    return matches
+@traced()
+def baseline_pattern_rule_names(session_id, file_path, cwd):
+    """Rule names the baseline version of `file_path` matches, or None when
+    there is no baseline content (new file, no baseline, git unavailable).
+
+    The content verdict is memoized in session state under the baseline
+    blob id plus the rule-set version, so repeated Writes to one file pay
+    for the baseline scan once. The memo holds content matches over every
+    rule; path gates are re-applied per call since they depend only on
+    `file_path`."""
+    rules, path_matched, content_candidates = _pattern_gates(file_path)
+    cr = compiled_rules(rules)
+    oid = get_baseline_blob_oid(session_id, file_path, cwd)
+    key = f"{cr.version}:{oid}" if oid else None
+    content_names = load_baseline_verdict(session_id, key) if key else None
+    if content_names is None:
+        baseline_content = get_baseline_file_content(session_id, file_path, cwd)
+        if baseline_content is None:
+            return None
+        hits = cr.matching(baseline_content, range(len(rules))) if baseline_content else set()
+        content_names = [cr.names[i] for i in sorted(hits)]
+        if key:
+            save_baseline_verdict(session_id, key, content_names)
+    else:
+        debug_log(f"Baseline verdict cache hit for {file_path}")
+    content_names = set(content_names)
+    return {
+        pattern["ruleName"]
+        for i, pattern in enumerate(rules)
+        if i in path_matched
+        or (i in content_candidates and pattern["ruleName"] in content_names)
+    }
 
 def extract_content_from_input(tool_name, tool_input):
     """Extract content to check from tool input based on tool type."""
@@ -509,6 +618,7 @@ def extract_content_from_input(tool_name, tool_input):
 # Hook handlers
 # =====================================================================
 
+@traced()
 def handle_user_prompt_submit(input_data):
     """
     Handle UserPromptSubmit — capture git baseline SHA.
@@ -527,6 +637,8 @@ def handle_user_prompt_submit(input_data):
         sys.exit(0)
 
     session_id = input_data.get("session_id", "default")
+    if ASYNC_BASELINE and _defer_baseline_capture(session_id, cwd):
+        sys.exit(0)
     # stash-create and ls-files both walk the worktree (~2-5s each in a very
     # large repo). Run them concurrently so UPS latency stays ≈ max(both).
     import concurrent.futures as _cf
@@ -565,7 +677,7 @@ def handle_user_prompt_submit(input_data):
         # untracked_at_baseline is independent of whether the stash produced
         # a SHA — write it unconditionally so compute_v2_review_set's
         # preexisting-untracked exclusion works in untracked-only trees.
-        state["untracked_at_baseline"] = untracked_now
+        set_untracked_baseline(state, session_id, untracked_now)
     with_locked_state(session_id, _save)
 
     if preserved["value"]:
@@ -584,6 +696,87 @@ def handle_user_prompt_submit(input_data):
 
     sys.exit(0)
 
+
+def _defer_baseline_capture(session_id, cwd):
+    """SG_ASYNC_BASELINE UPS: record HEAD as the baseline with a
+    `baseline_pending` marker and hand the stash + untracked snapshot to a
+    detached process (see land_deferred_baseline). Returns False when the
+    synchronous capture should run instead — no HEAD (not a repo, or no
+    commits: nothing to stash, and the untracked snapshot is all there is)
+    or the spawn failed."""
+    import time as _time
+    head = _git_rev_parse_head(cwd)
+    if not head:
+        return False
+    token = f"{os.getpid()}-{_time.time_ns()}"
+    outcome = {"value": "pending"}
+
+    def _mark(state):
+        # Same preservation rule as the synchronous path: an unconsumed
+        # touched_paths means the previous turn's edits are still unreviewed.
+        if state.get("touched_paths") and state.get("baseline_sha"):
+            outcome["value"] = "preserved"
+            return
+        state["baseline_sha"] = head
+        state["head_at_capture"] = head
+        state["baseline_pending"] = {"token": token, "ts": _time.time(), "head": head}
+    with_locked_state(session_id, _mark)
+    if outcome["value"] == "preserved":
+        debug_log("UPS: preserving prior baseline — previous Stop hook never "
+                  "consumed touched_paths (likely user interrupt / aborted turn)")
+        return True
+    try:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--capture-baseline",
+             session_id, cwd, token],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            stdin=subprocess.DEVNULL, start_new_session=True,
+        )
+    except OSError as e:
+        debug_log(f"UPS: deferred baseline spawn failed ({e}), capturing inline")
+
+        # Nothing will land this token; a leftover marker would make the
+        # next Stop wait out SG_ASYNC_BASELINE_WAIT_S and report degraded.
+        def _unmark(state):
+            if (state.get("baseline_pending") or {}).get("token") == token:
+                state.pop("baseline_pending", None)
+        with_locked_state(session_id, _unmark)
+        return False
+    debug_log(f"UPS: baseline deferred at HEAD {head[:12]}")
+    return True
+
+def _full_commit_shas(repo_root, shas, known=()):
+    """Full 40-hex shas for the commit names in `shas` (abbreviated ones
+    from `[branch sha]` included); names that don't resolve are dropped.
+    A name that prefixes exactly one of the `known` full shas (the keys of
+    a git_patch_ids map) resolves to it without asking git."""
+    full_shas = []
+    # One persistent `cat-file --batch-check` answers every sha without a
+    # fork each; per-sha rev-parse stays as the fallback.
+    reader = git_object_reader(repo_root)
+    for s in shas:
+        hit = [k for k in known if k.startswith(s)]
+        if len(hit) == 1:
+            full_shas.append(hit[0])
+            continue
+        if reader is not None:
+            try:
+                obj = reader.resolve(s)
+            except OSError:
+                reader = None
+            else:
+                if obj is not None and obj[1] == "commit":
+                    full_shas.append(obj[0])
+                continue
+        # See #2099: drop text=True; decode manually for cp1252 safety.
+        r = subprocess.run(
+            [*GIT_CMD, "rev-parse", "--verify", "-q", s],
+            cwd=repo_root, capture_output=True, timeout=5,
+        )
+        if r.returncode == 0:
+            full_shas.append(r.stdout.decode("utf-8", errors="replace").strip())
+    return full_shas
+
 def _resolve_amend_pre_sha(repo_root, expected_post_sha=None):
     """For a `git commit --amend` we just ran, return the pre-amend SHA via
     reflog, or None if it can't be safely determined.
@@ -699,6 +892,11 @@ MAX_COMMIT_REVIEWS_PER_HOUR = int(
 COMMIT_REVIEW_RATE_WINDOW_S = int(
     os.environ.get("COMMIT_REVIEW_RATE_WINDOW_S", "3600")
 )
+# Commits with more changed lines (numstat added + removed) than this are
+# not patch-id matched against the reviewed-shas store: the id needs the
+# commit's full patch, and a commit that large is reviewed from its plan
+# rather than hashed. Sha matches still apply.
+_PATCH_ID_MAX_LINES = int(os.environ.get("SG_PATCH_ID_MAX_LINES", "5000"))
 
 # ─── push-sweep ─────────────────────────────────────────────────────────────
 #
@@ -739,6 +937,37 @@ MAX_PUSH_SWEEP_FILES = int(os.environ.get("SG_PUSH_SWEEP_MAX_FILES", "30"))
 MAX_PUSH_SWEEP_RANGE = int(os.environ.get("SG_PUSH_SWEEP_MAX_RANGE", "50"))
 PUSH_SWEEP_REPORT_CAP = int(os.environ.get("SG_PUSH_SWEEP_REPORT_CAP", "3"))
 
+# Batched sweep (SG_PUSH_SWEEP_BATCHED=1). A stacked branch pushed after a
+# long offline session overflows the net-diff sweep: more than
+# MAX_PUSH_SWEEP_RANGE commits is skipped outright (43), more than
+# MAX_PUSH_SWEEP_FILES files is cut to the riskiest ones. In batched mode
+# such a range is instead split into batches of commits that touch
+# overlapping files, each batch is reviewed as the net diff of its own
+# files (batches share no file, so that diff is exactly their change), and
+# up to SG_PUSH_SWEEP_WORKERS batches run at once. Each batch's commits are
+# marked reviewed as soon as it completes. A sweep that is killed, stops at
+# the SG_PUSH_SWEEP_MAX_COST_USD spend cap (checked before each batch
+# starts; 0 = no cap) or has batches fail leaves a resume record in the
+# common gitdir, keyed by the pushed branch and the sweep's end (the head
+# it pushed). The next push of that branch whose previous upstream
+# descends from that end widens its range back to the sweep's base —
+# already-reviewed commits are skipped one by one, so only the unfinished
+# batches are reviewed again. A widened range over
+# SG_PUSH_SWEEP_BATCH_MAX_RANGE drops the record and sweeps the push's
+# own range instead.
+PUSH_SWEEP_BATCHED = os.environ.get("SG_PUSH_SWEEP_BATCHED", "").strip().lower() in ("1", "on", "true", "yes")
+PUSH_SWEEP_BATCH_MAX_RANGE = int(os.environ.get("SG_PUSH_SWEEP_BATCH_MAX_RANGE", "500"))
+PUSH_SWEEP_WORKERS = int(os.environ.get("SG_PUSH_SWEEP_WORKERS", "4"))
+PUSH_SWEEP_MAX_COST_USD = float(os.environ.get("SG_PUSH_SWEEP_MAX_COST_USD", "5"))
+_PUSH_SWEEP_RESUME_BASENAME = "sg-push-sweep-resume.json"
+_PUSH_SWEEP_RESUME_TTL_S = 7 * 86400
+_PUSH_SWEEP_RESUME_CAP = 16
+# sweep_flags metric bits. Folded into one key because the batched sweep's
+# emit is already at CC's 20-key cap without them.
+_SWEEP_FLAG_RESUMED = 1        # range widened back to an unfinished sweep
+_SWEEP_FLAG_SPEND_CAPPED = 2   # stopped at SG_PUSH_SWEEP_MAX_COST_USD
+_SWEEP_FLAG_FILES_DROPPED = 4  # a batch was cut to MAX_PUSH_SWEEP_FILES
+
 def _claim_bash_hook_once(input_data):
     """De-dupe across hooks.json `if` matchers firing for the same Bash call.
 
@@ -915,6 +1144,250 @@ def _detect_prev_upstream(repo_root, bash_output):
             pass
     return None
 
+def _push_sweep_batches(entries, commit_paths, unreviewed, max_files):
+    """Group `unreviewed` commits into review batches (see PUSH_SWEEP_BATCHED).
+
+    `entries` are the reviewable numstat entries of the sweep's net diff,
+    `commit_paths` is git_commit_paths over the same range. Commits that
+    touch a common file land in the same group; groups are packed, in
+    commit order, into batches of at most `max_files` files, and a single
+    group over that is cut to its `max_files` riskiest files, as the
+    net-diff sweep would. Returns (batches, free): each batch is
+    (shas, entries, dropped); `free` are commits touching no reviewable
+    file of the net diff (docs, config, changes reverted later in the
+    range), which have nothing left to review.
+    """
+    by_path = {}
+    for i, (path, old, _a, _d) in enumerate(entries):
+        by_path[path] = i
+        if old:
+            by_path[old] = i
+    parent = list(range(len(entries)))
+
+    def _find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    wanted = set(unreviewed)
+    touched, free = [], []
+    for sha, paths in commit_paths:
+        if sha not in wanted:
+            continue
+        hit = sorted({by_path[p] for p in paths if p in by_path})
+        if not hit:
+            free.append(sha)
+            continue
+        for j in hit[1:]:
+            ra, rb = _find(hit[0]), _find(j)
+            if ra != rb:
+                parent[rb] = ra
+        touched.append((sha, hit[0]))
+    groups, order = {}, []
+    for sha, i in touched:
+        r = _find(i)
+        if r not in groups:
+            groups[r] = ([], [])
+            order.append(r)
+        groups[r][0].append(sha)
+    for i in range(len(entries)):
+        r = _find(i)
+        if r in groups:
+            groups[r][1].append(i)
+    packed, shas, ids = [], [], []
+    for r in order:
+        g_shas, g_ids = groups[r]
+        if ids and len(ids) + len(g_ids) > max_files:
+            packed.append((shas, ids))
+            shas, ids = [], []
+        shas, ids = shas + g_shas, ids + g_ids
+    if ids:
+        packed.append((shas, ids))
+    batches = []
+    for shas, ids in packed:
+        plan = plan_diff_paths([entries[i] for i in sorted(ids)], cap=max_files)
+        batches.append((shas, plan["entries"], plan["dropped"]))
+    return batches, free
+
+def _push_sweep_resume_path(repo_root):
+    gd = _git_dir(repo_root)
+    return os.path.join(gd, _PUSH_SWEEP_RESUME_BASENAME) if gd else None
+
+def _push_sweep_ref(repo_root):
+    """Full name of the checked-out branch, which the push sweep has
+    already checked is the pushed ref; None when detached."""
+    try:
+        r = subprocess.run([*GIT_CMD, "symbolic-ref", "-q", "HEAD"],
+                           cwd=repo_root, capture_output=True, timeout=5)
+    except (subprocess.TimeoutExpired, FileNotFoundError, OSError):
+        return None
+    if r.returncode != 0:
+        return None
+    return r.stdout.decode("utf-8", errors="replace").strip() or None
+
+def _load_push_sweep_resume(repo_root):
+    """{"<ref> <end sha>": {"base": sha, "ts": ts}} of batched sweeps that
+    did not finish, oldest first."""
+    path = _push_sweep_resume_path(repo_root)
+    if not path:
+        return {}
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    import time as _time
+    now = _time.time()
+    return {k: v for k, v in data.items()
+            if isinstance(k, str) and " " in k and isinstance(v, dict)
+            and isinstance(v.get("base"), str) and isinstance(v.get("ts"), (int, float))
+            and now - v["ts"] <= _PUSH_SWEEP_RESUME_TTL_S}
+
+def _save_push_sweep_resume(repo_root, ref, end, base=None):
+    """Add the resume record for an unfinished sweep of `ref` over
+    base..end, or drop the one for (`ref`, `end`) when `base` is None.
+    Best effort: without the record the next sweep just starts from its own
+    push's base, as the net-diff sweep does.
+
+    The file is shared by every session in the clone, so the
+    read-modify-write runs under an flock on a sidecar lock file (the data
+    file itself is replaced, which would leave a waiter locking the old
+    inode). Without fcntl (Windows) it runs unlocked."""
+    path = _push_sweep_resume_path(repo_root)
+    if not path:
+        return
+    lock_fd = None
+    if fcntl is not None:
+        try:
+            lock_fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT)
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        except OSError as e:
+            debug_log(f"Push sweep: resume lock failed ({e}), writing unlocked")
+            if lock_fd is not None:
+                os.close(lock_fd)
+                lock_fd = None
+    try:
+        _update_push_sweep_resume(path, repo_root, f"{ref} {end}", base)
+    finally:
+        if lock_fd is not None:
+            os.close(lock_fd)  # releases the flock
+
+def _update_push_sweep_resume(path, repo_root, key, base):
+    import tempfile as _tempfile
+    import time as _time
+    records = _load_push_sweep_resume(repo_root)
+    if base is not None:
+        records.pop(key, None)
+        records[key] = {"base": base, "ts": _time.time()}
+    elif key not in records:
+        return
+    else:
+        del records[key]
+    try:
+        fd, tmp = _tempfile.mkstemp(prefix=".sg-push-sweep-", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(dict(list(records.items())[-_PUSH_SWEEP_RESUME_CAP:]), f)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+    except OSError as e:
+        debug_log(f"Push sweep: could not save resume record: {e}")
+
+def _push_sweep_resume_base(repo_root, ref, prev_upstream):
+    """(end, base) of the newest unfinished batched sweep of `ref` whose
+    end `prev_upstream` is or descends from, or None. Only `ref`'s own
+    records are considered: another branch's sweep can share history with
+    this push without having pushed to it."""
+    for key, rec in reversed(list(_load_push_sweep_resume(repo_root).items())):
+        rec_ref, _, end = key.rpartition(" ")
+        if rec_ref != ref:
+            continue
+        if (end.startswith(prev_upstream) or prev_upstream.startswith(end)
+                or _is_ancestor(repo_root, end, prev_upstream)):
+            return end, rec["base"]
+    return None
+
+def _run_push_sweep_batches(repo_root, base, batches, previous_findings, use_agentic):
+    """Review push-sweep `batches` (from _push_sweep_batches) concurrently,
+    marking each batch's commits reviewed as it completes. A batch whose
+    diff or review fails is left unmarked. Returns (vulns, files_reviewed,
+    metrics)."""
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    _ensure_llm()
+    kind = "agentic" if use_agentic else "single"
+    patch_cmd = [*GIT_CMD, "diff", "-p", "--no-color", "--no-ext-diff", base, "HEAD"]
+
+    def _one(shas, entries, _dropped):
+        # analyze_code_security reports completion through llm module
+        # globals that concurrent batches would overwrite; the reviewer
+        # here goes through _review_code_security, which writes none.
+        failed = []
+
+        def _review(files):
+            if use_agentic:
+                g, v, m = _agentic_review_with_race(
+                    repo_root, files, [fp for fp, _ in files], previous_findings)
+                if not m.get("agentic_fallback"):
+                    return g, v, m.get("race_winner", 1) == 1
+            v, truncated = llm._review_code_security(files, True, previous_findings)
+            if v is None:
+                failed.append(True)
+            return (_format_vulns_guidance(v) if v else None), v or [], \
+                v is not None and not truncated
+
+        try:
+            files = stream_diff_files(patch_cmd + _literal_pathspec(entries), repo_root)
+            if files is None:
+                return None, 0, {}
+            vulns, cm = [], {}
+            if files:
+                _g, vulns, cm = _cached_review(files, previous_findings, kind, _review)
+            if failed:
+                return None, len(files), cm
+        except Exception as e:
+            debug_log(f"Push sweep: batch failed: {type(e).__name__}: {e}")
+            return None, 0, {}
+        _append_reviewed_shas(repo_root, shas, vulns_found=len(vulns or []))
+        return list(vulns or []), len(files), cm
+
+    def _spent():
+        with _USAGE_LOCK:
+            return _USAGE["cost"]
+
+    workers = max(1, min(PUSH_SWEEP_WORKERS, len(batches)))
+    queue, running, results = list(batches), set(), []
+    capped = False
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        while queue or running:
+            while queue and len(running) < workers:
+                if PUSH_SWEEP_MAX_COST_USD > 0 and _spent() >= PUSH_SWEEP_MAX_COST_USD:
+                    capped = True
+                    break
+                running.add(ex.submit(_one, *queue.pop(0)))
+            if not running:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            results.extend(f.result() for f in done)
+    done_ok = [r for r in results if r[0] is not None]
+    debug_log(f"Push sweep: {len(done_ok)}/{len(batches)} batches reviewed"
+              f"{' (spend cap reached)' if capped else ''}")
+    # No review_cache_hits/misses here: the push emit has no room for them
+    # next to the batch counters (see _push_metrics).
+    metrics = {"sweep_batches": len(batches), "sweep_batches_done": len(done_ok)}
+    if capped:
+        metrics["sweep_flags"] = _SWEEP_FLAG_SPEND_CAPPED
+    return (llm._merge_findings([r[0] for r in done_ok]),
+            sum(r[1] for r in done_ok), metrics)
+
 def is_commit_review_enabled():
     """Gate for the commit-review PostToolUse[Bash] hook.
 
@@ -932,75 +1405,142 @@ def is_commit_review_enabled():
 
 COMMIT_REVIEW_ENABLED = is_commit_review_enabled()
 
+@traced()
+def _cached_review(diff_files, previous_findings, kind, review):
+    """Run `review` over only the files review_cache hasn't seen.
+
+    `review(files)` returns (guidance, vulns, completed); `completed` is
+    False when the reviewer failed or truncated its input, in which case
+    nothing is cached. Cached findings for hit files are merged back in and
+    the guidance is re-rendered over the union. Returns (guidance, vulns,
+    cache_metrics); cache_metrics is {"review_cache_hits": n} when any file
+    hit and {} otherwise — misses are files_reviewed minus hits, so they
+    take no key of their own."""
+    _ensure_llm()
+    # Only Stop/commit/push review here; the Edit path never pays for it.
+    import review_cache
+    misses, cached_vulns, keys, hits = review_cache.lookup(
+        diff_files, kind, previous_findings)
+    if misses:
+        guidance, vulns, completed = review(misses)
+        if completed:
+            review_cache.store(keys, misses, vulns)
+    else:
+        guidance, vulns = None, []
+    if cached_vulns:
+        vulns = list(vulns or []) + cached_vulns
+        guidance = _format_vulns_guidance(vulns)
+    return guidance, vulns, ({"review_cache_hits": hits} if hits else {})
+
+
+def _single_shot_review(files, previous_findings, max_files):
+    """Single-shot review of `files`, returning (guidance, vulns, completed).
+
+    With SG_SHARDED_REVIEW on, the whole diff is split into shards reviewed
+    concurrently; callers then skip their own _prioritize_diff_files cut.
+    A diff whose shards would exceed SG_SHARD_MAX_INPUT_TOKENS falls back to
+    the top `max_files` by priority in one call, as without sharding."""
+    _ensure_llm()
+    if sharded_review_enabled():
+        shards = plan_review_shards(files)
+        if shards is None:
+            files, _dropped = _prioritize_diff_files(files, max_files)
+            debug_log(f"sharded review over token ceiling: prioritized to "
+                      f"{len(files)} files (dropped {_dropped})")
+        else:
+            g, v = analyze_code_security_sharded(
+                shards, is_diff=True, previous_findings=previous_findings)
+            return g, v, (llm._last_review_completed
+                          and not llm._last_review_truncated_tokens)
+    g, v = analyze_code_security(
+        files, is_diff=True, previous_findings=previous_findings
+    )
+    return g, v, (llm._last_review_completed
+                  and not llm._last_review_truncated_tokens)
+
+
+@traced()
 def _agentic_review_with_race(
     repo_root: str,
     diff_files: List[Tuple[str, str]],
     rel_touched: List[str],
     previous_findings: List[Dict[str, Any]],
 ) -> Tuple[Optional[str], List[Dict[str, Any]], Dict[str, Any]]:
-    """Race the agentic reviewer against a delayed single-shot fallback.
+    """Race the agentic reviewer against a hedged single-shot fallback.
 
-    Agentic starts at t=0. After SG_AGENTIC_RACE_DELAY_S (default 180s), the
-    single-shot diff reviewer also starts. Whichever finishes first wins. If
+    Agentic starts at t=0. Once it has run longer than its observed p90
+    latency (hedging.hedge_delay on "agentic:<model>", capped at 180s; 180s
+    until enough runs are recorded), the single-shot diff reviewer also
+    starts. Whichever finishes first wins and the other is cancelled — a
+    losing agentic run has its SDK queries and CLI children closed. If
     agentic finishes before the delay elapses, the fallback never runs.
+    SG_AGENTIC_RACE_DELAY_S pins a fixed delay instead.
 
     Metrics added:
       race_winner    : 1 = agentic won, 2 = fallback won (CC accepts only
                        bool/finite-number metric values — strings would discard the dict)
-      race_delay_s   : the configured delay
+      race_delay_s   : the delay used
       race_started   : 1 if the fallback was actually launched, else 0
 
     Only the commit-review handler calls this — external harnesses invoke
     agentic_review() directly and are unaffected. SG_AGENTIC_NO_RACE=1
     disables the race for any other caller that wants pure agentic.
     """
-    import queue as _queue
-    import threading as _th
     import time as _t
 
+    import hedging
+
+    _ensure_llm()
     if os.environ.get("SG_AGENTIC_NO_RACE") == "1":
         return agentic_review(repo_root, diff_files, rel_touched)
 
-    delay_s = int(os.environ.get("SG_AGENTIC_RACE_DELAY_S", "180"))
-    q: "_queue.Queue[Tuple[str, Any]]" = _queue.Queue(maxsize=1)
-    fallback_started = _th.Event()
+    key = "agentic:" + (os.environ.get("SG_AGENTIC_MODEL") or "default")
+    fixed = os.environ.get("SG_AGENTIC_RACE_DELAY_S", "").strip()
+    delay_s = int(fixed) if fixed else hedging.hedge_delay(key, default=180)
 
-    def _agentic() -> None:
+    def _agentic(cancel):
+        t0 = _t.time()
         try:
-            r = agentic_review(repo_root, diff_files, rel_touched)
+            r = agentic_review(repo_root, diff_files, rel_touched, cancel=cancel)
         except Exception as e:  # pragma: no cover — crash → let fallback win
-            r = (None, [], {"agentic_fallback": f"race_crash:{type(e).__name__}"})
-        try:
-            q.put_nowait(("agentic", r))
-        except _queue.Full:
-            pass
-
-    def _fallback() -> None:
-        _t.sleep(delay_s)
-        if not q.empty():
-            return  # agentic finished within the delay — never start fallback
-        fallback_started.set()
-        try:
-            g, v = analyze_code_security(
-                diff_files, is_diff=True, previous_findings=previous_findings
-            )
-        except Exception as e:  # pragma: no cover
-            g, v = None, []
+            return (None, [], {"agentic_fallback": f"race_crash:{type(e).__name__}"})
+        # Only real reviews feed the histogram: an SDK-unavailable fallback
+        # returns in milliseconds and would drag the percentile to zero.
+        if not r[2].get("agentic_fallback"):
+            hedging.record(key, _t.time() - t0)
+        return r
+
+    def _fallback(cancel):
+        # _review_code_security, not analyze_code_security: a losing leg
+        # must not overwrite the llm._last_review_* globals the caller reads
+        # after the race, and `cancel` stops its calls, retries and sonnet
+        # fallback as soon as agentic wins.
         try:
-            q.put_nowait(("fallback", (g, v, {"agentic": False})))
-        except _queue.Full:
-            pass
-
-    _th.Thread(target=_agentic, daemon=True).start()
-    _th.Thread(target=_fallback, daemon=True).start()
-
-    winner, (g, v, m) = q.get()
+            v, _truncated = llm._review_code_security(
+                diff_files, True, previous_findings, cancel=cancel)
+        except Exception:  # pragma: no cover
+            v = None
+        return (_format_vulns_guidance(v) if v else None, v or [], {"agentic": False})
+
+    # Any agentic result ends the race, as before — an agentic_fallback
+    # result goes back to the caller, which runs its own single-shot review.
+    t0 = _t.time()
+    http_error = llm._last_call_claude_http_error
+    winner, (g, v, m), started = hedging.race(
+        _agentic, _fallback, delay_s, accept=lambda r: True, grace_s=5.0)
+    if winner == 2:
+        hedging.record(key, _t.time() - t0)  # abandoned agentic: lower bound
+    elif started:
+        # An error the cancelled fallback hit before losing isn't this
+        # review's: agentic answered.
+        llm._last_call_claude_http_error = http_error
     m = dict(m)  # don't mutate the callee's metrics dict
-    m["race_winner"] = 1 if winner == "agentic" else 2
-    m["race_delay_s"] = delay_s
-    m["race_started"] = 1 if fallback_started.is_set() else 0
+    m["race_winner"] = winner
+    m["race_delay_s"] = int(delay_s)
+    m["race_started"] = 1 if started else 0
     return g, v, m
 
+@traced()
 def handle_commit_review_posttooluse(input_data):
     """PostToolUse handler for Bash — reviews git commits for security issues.
 
@@ -1011,6 +1551,7 @@ def handle_commit_review_posttooluse(input_data):
     the model. Deduplicates against the shared previous_findings state so
     the Stop hook won't re-flag the same (filePath, vulnerableCode) pair.
     """
+    _ensure_llm()
     session_id = input_data.get("session_id", "default")
     tool_input = input_data.get("tool_input", {})
     tool_response = input_data.get("tool_response", {})
@@ -1071,7 +1612,9 @@ def handle_commit_review_posttooluse(input_data):
         _root = _git_toplevel(cwd)
         _fresh, _stale = _git_reflog_recent_commits(_root)
         if _fresh:
-            _already = _load_reviewed_shas(_root)
+            # Sha match only: patch-id matches are the commit path's dedup
+            # (skip 36), after it has sized the commits from numstat.
+            _already = _load_reviewed_shas(_root, _fresh, patch_ids={})
             _reflog_shas = [s for s in _fresh if s not in _already]
             if _reflog_shas:
                 commit_succeeded = True
@@ -1213,56 +1756,58 @@ def handle_commit_review_posttooluse(input_data):
             f"{pre_amend_sha[:12]}..{shas[-1][:12]}"
         )
 
+    # Numstat first: each SHA's file list and line counts come from
+    # `--numstat -z`, the skip/prioritize decisions below are made on those,
+    # and patch text is then generated only for the files that will be
+    # reviewed (plan_diff_paths / stream_diff_files). A commit that vendors
+    # a large dependency or a pathological scaffold never materializes its
+    # full patch.
+    #
+    # core.quotePath=false: emit raw UTF-8 in `diff --git a/... b/...`
+    # headers so non-ASCII paths aren't C-quoted past the downstream
+    # parse_diff_into_files regex (sibling of #2056 / #2075). See #2082.
+    # core.quotePath=false comes from GIT_CMD globally (see gitutil.py).
     # --no-color: `color.ui=always` would emit ANSI escapes that corrupt
-    # parse_diff_into_files' header match. Bytes + errors='replace': commits
-    # can contain non-UTF8 source (latin-1, cp1252) and text=True would raise
-    # UnicodeDecodeError outside the except clause.
-    diff_files = []
-    resolved = 0
-    for sha in shas:
-        try:
-            # core.quotePath=false: emit raw UTF-8 in `diff --git a/... b/...`
-            # headers so non-ASCII paths aren't C-quoted past the downstream
-            # parse_diff_into_files regex (sibling of #2056 / #2075). See #2082.
-            # core.quotePath=false comes from GIT_CMD globally (see gitutil.py).
-            if pre_amend_sha:
-                # Delta review: pre-amend → post-amend. `git diff` (not show)
-                # so the output is a pure unified diff with no commit header.
-                result = subprocess.run(
-                    [*GIT_CMD, "diff", "--no-color", "--no-ext-diff",
+    # parse_diff_into_files' header match.
+    def _commit_cmds(sha):
+        if pre_amend_sha:
+            # Delta review: pre-amend → post-amend. `git diff` (not show)
+            # so the output is a pure unified diff with no commit header.
+            return ([*GIT_CMD, "diff", "--numstat", "-z", "--no-ext-diff",
                      pre_amend_sha, sha, "--"],
-                    cwd=repo_root, capture_output=True, timeout=15
-                )
-            else:
-                result = subprocess.run(
-                    [*GIT_CMD, "show", "-p", "--no-color", "--no-ext-diff", sha, "--"],
-                    cwd=repo_root, capture_output=True, timeout=15
-                )
-        except (subprocess.TimeoutExpired, FileNotFoundError, OSError) as e:
-            _cmd = "git diff" if pre_amend_sha else "git show"
-            debug_log(f"Commit review: {_cmd} {sha} error: {e}")
-            continue
-        if result.returncode != 0:
+                    [*GIT_CMD, "diff", "--no-color", "--no-ext-diff",
+                     pre_amend_sha, sha])
+        return ([*GIT_CMD, "show", "--numstat", "-z", "--format=", "--no-ext-diff",
+                 sha, "--"],
+                [*GIT_CMD, "show", "-p", "--no-color", "--no-ext-diff", sha])
+
+    _cmd = "git diff" if pre_amend_sha else "git show"
+    numstat_by_sha = {}
+    for sha in shas:
+        sha_entries = git_numstat(_commit_cmds(sha)[0], repo_root, timeout=15)
+        if sha_entries is None:
             # SHA not in this repo (cross-repo commit) or already gc'd. Better
             # to skip than to fall back to HEAD and review the wrong commit.
-            _cmd = "git diff" if pre_amend_sha else "git show"
-            debug_log(f"Commit review: {_cmd} {sha} rc={result.returncode}")
+            debug_log(f"Commit review: {_cmd} --numstat {sha} failed")
             continue
-        resolved += 1
-        diff_files.extend(parse_diff_into_files(
-            result.stdout.decode("utf-8", errors="replace")))
-
-    # Dedup by path. The widened reflog scan can return >1 SHA (e.g.
-    # `git commit && git commit --amend` within 120s); a path that appears in
-    # both diffs would consume two MAX_DIFF_FILES slots and be re-analyzed.
-    # `shas` is newest-first so the first occurrence is the most recent
-    # version of the file — keep it.
-    if len(shas) > 1:
-        _seen = set()
-        diff_files = [
-            (fp, c) for fp, c in diff_files
-            if not (fp in _seen or _seen.add(fp))
-        ]
+        numstat_by_sha[sha] = sha_entries
+    resolved = len(numstat_by_sha)
+
+    def _merge_entries():
+        # Dedup by path. The widened reflog scan can return >1 SHA (e.g.
+        # `git commit && git commit --amend` within 120s); a path that
+        # appears in both diffs would consume two MAX_DIFF_FILES slots and
+        # be re-analyzed. `shas` is newest-first so the first occurrence is
+        # the most recent version of the file — keep it.
+        merged, owner = [], {}
+        for sha in shas:
+            for e in numstat_by_sha.get(sha, ()):
+                if e[0] not in owner:
+                    owner[e[0]] = sha
+                    merged.append(e)
+        return merged, owner
+
+    entries, entry_sha = _merge_entries()
 
     if resolved == 0:
         debug_log("Commit review: no parsed SHA resolved in cwd repo")
@@ -1270,44 +1815,114 @@ def handle_commit_review_posttooluse(input_data):
                       "shas_found": len(shas)})
         sys.exit(0)
 
+    # Large commits (initial scaffolds, big refactors) used to bail with
+    # skip_reason=31. Large multi-file changes are exactly where
+    # cross-file source→sink vulns hide. Reviewing nothing is
+    # worse than reviewing the riskiest 30 — _cap_files_for_prompt already
+    # bounds total tokens downstream so this can't blow context.
+    # `diff_files_dropped` lets telemetry measure how often the prioritizer engages
+    # and how much it drops; skip_reason=31 is now reserved for the truly
+    # pathological case (e.g. >300 source files — almost certainly a bad
+    # baseline, not a real commit). Sharded single-shot review covers the
+    # whole diff itself (see _single_shot_review), trimmed by priority to
+    # what fits the shard token ceiling; the agentic reviewer still gets
+    # the top files.
+    use_agentic = _agentic_commit_review_enabled()
+    _sharded = not use_agentic and sharded_review_enabled()
+
+    def _plan():
+        return plan_diff_paths(
+            entries, cap=None if _sharded else MAX_DIFF_FILES,
+            hard_cap=10 * MAX_DIFF_FILES,
+            max_tokens=sharded_diff_token_budget(10 * MAX_DIFF_FILES) if _sharded else None)
+
+    plan = _plan()
+
     # Empty amend delta = message-only amend (or whitespace-only that the
     # diff already collapses). No code to review; skip cleanly. skip_reason=35.
     # Gated on resolved > 0 so subprocess failures (caught with `continue`
     # above) don't get mislabeled as message-only — they fall through to
     # skip_reason=28 correctly.
-    if pre_amend_sha and not diff_files:
+    if pre_amend_sha and not plan["reviewable"]:
         debug_log("Commit review: --amend produced empty delta (message-only?), skipping")
         emit_metrics({"skipped": True, "skip_reason": 35, **_base,
                       "files_reviewed": 0})
         sys.exit(0)
 
     debug_log(f"Commit review: {resolved}/{len(shas)} sha(s) resolved, "
-              f"{len(diff_files)} files")
-    if not diff_files:
+              f"{plan['reviewable']} files")
+    if not plan["reviewable"]:
         debug_log("Commit review: no reviewable source files in commit")
         emit_metrics({"skipped": True, "skip_reason": 30, **_base})
         sys.exit(0)
 
-    # Large commits (initial scaffolds, big refactors) used to bail here with
-    # skip_reason=31. Large multi-file changes are exactly where
-    # cross-file source→sink vulns hide. Reviewing nothing is
-    # worse than reviewing the riskiest 30 — _cap_files_for_prompt already
-    # bounds total bytes downstream so this can't blow context.
-    # `diff_files_dropped` lets telemetry measure how often the prioritizer engages
-    # and how much it drops; skip_reason=31 is now reserved for the truly
-    # pathological case (e.g. >300 source files — almost certainly a bad
-    # baseline, not a real commit).
-    if len(diff_files) > 10 * MAX_DIFF_FILES:
-        debug_log(f"Commit review: pathological diff ({len(diff_files)} files), skipping")
+    if plan["pathological"]:
+        debug_log(f"Commit review: pathological diff ({plan['reviewable']} files), skipping")
         emit_metrics({"skipped": True, "skip_reason": 31, **_base,
-                      "diff_files_count": len(diff_files)})
+                      "diff_files_count": plan["reviewable"]})
         sys.exit(0)
-    diff_files, _dropped = _prioritize_diff_files(diff_files, MAX_DIFF_FILES)
+
+    # The same change may already be reviewed under another sha: a
+    # cherry-pick or rebase of a reviewed commit, an amend that only
+    # touched the message but missed the delta path, a Bash retry.
+    # _load_reviewed_shas matches those on patch-id; record the new
+    # shas as reviewed too (so the push-sweep matches them by sha) and
+    # review only what's left. skip_reason=36 when nothing is.
+    # A patch-id costs the commit's full patch, so the ids are computed
+    # only here — once the plan says there is something worth reviewing —
+    # and only for commits of at most _PATCH_ID_MAX_LINES changed lines.
+    # The same map is recorded with the review below. The amend delta path
+    # reviews pre→post, not the commits themselves, and is not deduped.
+    _pids = None
+    if not pre_amend_sha:
+        _small = [s for s, es in numstat_by_sha.items()
+                  if sum((e[2] or 0) + (e[3] or 0) for e in es) <= _PATCH_ID_MAX_LINES]
+        _pids = (git_patch_ids(repo_root, _small) if _small else None) or {}
+        try:
+            _dup = _load_reviewed_shas(repo_root, shas, patch_ids=_pids)
+        except Exception:
+            _dup = set()
+        if _dup:
+            debug_log(f"Commit review: {len(_dup)} of {len(shas)} commit(s) "
+                      f"already reviewed (same sha or patch-id)")
+            _append_reviewed_shas(repo_root, _full_commit_shas(repo_root, list(_dup), _pids),
+                                  patch_ids=_pids)
+            _base = {**_base, "shas_deduped": len(_dup)}
+            shas = [s for s in shas if s not in _dup]
+            if not any(s in numstat_by_sha for s in shas):
+                emit_metrics({"skipped": True, "skip_reason": 36, **_base})
+                sys.exit(0)
+            entries, entry_sha = _merge_entries()
+            plan = _plan()
+            if not plan["reviewable"]:
+                debug_log("Commit review: no reviewable source files left after dedup")
+                emit_metrics({"skipped": True, "skip_reason": 30, **_base})
+                sys.exit(0)
+
+    _dropped = plan["dropped"]
     if _dropped:
-        debug_log(f"Commit review: prioritized to {len(diff_files)} files "
+        debug_log(f"Commit review: prioritized to {len(plan['entries'])} files "
                   f"(dropped {_dropped} lower-risk)")
         _base = {**_base, "diff_files_dropped": _dropped}
 
+    # Patch text for the planned files only, one git call per SHA that
+    # contributed any.
+    diff_files = []
+    for sha in shas:
+        sha_entries = [e for e in plan["entries"] if entry_sha[e[0]] == sha]
+        if not sha_entries:
+            continue
+        sha_files = stream_diff_files(
+            _commit_cmds(sha)[1] + _literal_pathspec(sha_entries), repo_root, timeout=15)
+        if sha_files is None:
+            debug_log(f"Commit review: {_cmd} {sha} failed")
+            continue
+        diff_files.extend(sha_files)
+    if not diff_files:
+        debug_log("Commit review: planned files produced no patch text")
+        emit_metrics({"skipped": True, "skip_reason": 30, **_base})
+        sys.exit(0)
+
     # Rolling-hour rate limit on LLM spend, so only burn a slot once we know
     # we'll actually call analyze_code_security — skip 28/30/31/33 above are
     # free. `rate_count` is emitted on every fire (not just rejections) so
@@ -1336,22 +1951,28 @@ def handle_commit_review_posttooluse(input_data):
     review_start = _time.time()
 
     agentic_metrics: Dict[str, Any] = {}
-    if _agentic_commit_review_enabled():
-        rel_touched = [fp for fp, _ in diff_files]
-        concrete_guidance, vulns, _am = _agentic_review_with_race(
-            repo_root, diff_files, rel_touched, previous_findings
-        )
-        agentic_metrics.update(_am)
-        # Fall back to single-shot only on agentic FAILURE (SDK/investigate
-        # crash). If agentic completed and returned 0 findings, trust that.
-        if agentic_metrics.get("agentic_fallback"):
-            concrete_guidance, vulns = analyze_code_security(
-                diff_files, is_diff=True, previous_findings=previous_findings
+
+    def _commit_review(files):
+        if use_agentic:
+            rel_touched = [fp for fp, _ in files]
+            g, v, _am = _agentic_review_with_race(
+                repo_root, files, rel_touched, previous_findings
             )
-    else:
-        concrete_guidance, vulns = analyze_code_security(
-            diff_files, is_diff=True, previous_findings=previous_findings
-        )
+            agentic_metrics.update(_am)
+            # Fall back to single-shot only on agentic FAILURE (SDK/investigate
+            # crash). If agentic completed and returned 0 findings, trust that.
+            if agentic_metrics.get("agentic_fallback"):
+                g, v = analyze_code_security(
+                    files, is_diff=True, previous_findings=previous_findings
+                )
+                return g, v, False
+            # Only an agentic verdict is cached under the agentic key.
+            return g, v, agentic_metrics.get("race_winner", 1) == 1
+        return _single_shot_review(files, previous_findings, MAX_DIFF_FILES)
+
+    concrete_guidance, vulns, cache_metrics = _cached_review(
+        diff_files, previous_findings,
+        "agentic" if use_agentic else "single", _commit_review)
 
     # push-sweep state: record this commit as reviewed (full 40-hex sha) so a
     # later `git push` can advance its diff base past it. Recorded here — after
@@ -1360,16 +1981,8 @@ def handle_commit_review_posttooluse(input_data):
     # `[branch sha]`; resolve to full so set-membership in the push-sweep is
     # exact. Best-effort; failures here never block the review result.
     try:
-        full_shas = []
-        for s in shas:
-            # See #2099: drop text=True; decode manually for cp1252 safety.
-            r = subprocess.run(
-                [*GIT_CMD, "rev-parse", "--verify", "-q", s],
-                cwd=repo_root, capture_output=True, timeout=5,
-            )
-            if r.returncode == 0:
-                full_shas.append(r.stdout.decode("utf-8", errors="replace").strip())
-        _append_reviewed_shas(repo_root, full_shas, vulns_found=len(vulns or []))
+        _append_reviewed_shas(repo_root, _full_commit_shas(repo_root, shas, _pids or ()),
+                              vulns_found=len(vulns or []), patch_ids=_pids)
     except Exception:
         pass
 
@@ -1422,6 +2035,7 @@ def handle_commit_review_posttooluse(input_data):
             **({
                 "api_error": llm._last_call_claude_http_error
             } if llm._last_call_claude_http_error is not None else {}),
+            **cache_metrics,
         })
         sys.exit(0)
 
@@ -1437,6 +2051,7 @@ def handle_commit_review_posttooluse(input_data):
         emit_metrics({
             "vulns_found": 0, **_base, **_agentic_m, "deduped": n_deduped,
             "files_reviewed": len(diff_files), "review_ms": review_ms,
+            **cache_metrics,
         })
         sys.exit(0)
 
@@ -1482,6 +2097,7 @@ def handle_commit_review_posttooluse(input_data):
         "critical_count": sev["critical"], "high_count": sev["high"],
         "files_reviewed": len(diff_files), "review_ms": review_ms,
         **({"deduped": n_deduped} if n_deduped else {}),
+        **cache_metrics,
     }, rewake_summary=_format_vulns_summary(new_vulns, prefix="Commit security review found"),
        additional_context=_commit_guidance,
        hook_event_name="PostToolUse")
@@ -1492,6 +2108,7 @@ def handle_commit_review_posttooluse(input_data):
     # the same text via the modern JSON channel. See #1358/#1375/#1783.
     sys.exit(2)
 
+@traced()
 def handle_push_sweep_posttooluse(input_data):
     """Review the just-pushed range as one diff, advancing the base past the
     contiguous prefix of already-per-commit-reviewed shas.
@@ -1507,10 +2124,14 @@ def handle_push_sweep_posttooluse(input_data):
     in the diff; their findings are dropped by `_dedup_against_state` against
     `previous_findings` the per-commit hook already recorded.
 
+    With SG_PUSH_SWEEP_BATCHED on, a range too long or too wide for one
+    review is reviewed in concurrent batches instead (_push_sweep_batches).
+
     Metrics: `push_sweep: True` is the telemetry splitter; `pushed`/`unreviewed`/
     `prefix_advanced` give the funnel; skip_reasons 40-49 are reserved for
     this surface.
     """
+    _ensure_llm()
     tool_input = input_data.get("tool_input", {}) or {}
     tool_response = input_data.get("tool_response", {}) or {}
     command = tool_input.get("command", "") or ""
@@ -1568,14 +2189,7 @@ def handle_push_sweep_posttooluse(input_data):
     # and rejected pushes (no range line, no `interrupted` signal → reviews
     # unpushed local commits and marks them reviewed). skip_reason=46 covers
     # both.
-    head = None
-    try:
-        # See #2099: drop text=True; decode manually for cp1252 safety.
-        r = subprocess.run([*GIT_CMD, "rev-parse", "HEAD"], cwd=repo_root,
-                           capture_output=True, timeout=5)
-        head = r.stdout.decode("utf-8", errors="replace").strip() if r.returncode == 0 else None
-    except (subprocess.TimeoutExpired, FileNotFoundError, OSError):
-        pass
+    head = _git_rev_parse_head(repo_root)
     push_section = _push_section(bash_output or "")
     range_matches = list(_PUSH_RANGE_RE.finditer(push_section))
     if range_matches and head:
@@ -1644,21 +2258,49 @@ def handle_push_sweep_posttooluse(input_data):
         emit_metrics({"skipped": True, "skip_reason": 41, **_base})
         sys.exit(0)
 
-    push_range = _git_rev_list_range(repo_root, prev_upstream, "HEAD")
+    # Batched mode: pick up where an unfinished sweep of an older push on
+    # this branch stopped (see PUSH_SWEEP_BATCHED). `resumed` is that
+    # sweep's (end, base).
+    sweep_ref = resumed = None
+    if PUSH_SWEEP_BATCHED:
+        sweep_ref = _push_sweep_ref(repo_root)
+        if sweep_ref:
+            resumed = _push_sweep_resume_base(repo_root, sweep_ref, prev_upstream)
+
+    def _drop_resumed():
+        if resumed:
+            _save_push_sweep_resume(repo_root, sweep_ref, resumed[0])
+
+    push_range = _git_rev_list_range(repo_root, resumed[1] if resumed else prev_upstream, "HEAD")
+    if resumed and len(push_range or ()) > PUSH_SWEEP_BATCH_MAX_RANGE:
+        # Widening must not turn a sweepable push into skip 43. The old
+        # sweep's leftovers are as out of reach as any oversized push (the
+        # Stop hook is the backstop): drop its record and sweep this push.
+        debug_log(f"Push sweep: resumed range from {resumed[1][:12]} exceeds "
+                  f"{PUSH_SWEEP_BATCH_MAX_RANGE} commits, sweeping this push only")
+        _drop_resumed()
+        resumed = None
+        push_range = _git_rev_list_range(repo_root, prev_upstream, "HEAD")
+    if resumed:
+        debug_log(f"Push sweep: resuming unfinished sweep from {resumed[1][:12]}")
+        prev_upstream = resumed[1]
+        _base = {**_base, "sweep_flags": _SWEEP_FLAG_RESUMED}
     if not push_range:
         emit_metrics({"skipped": True, "skip_reason": 42, **_base, "pushed": 0})
         sys.exit(0)
-    if len(push_range) > MAX_PUSH_SWEEP_RANGE:
+    if len(push_range) > (PUSH_SWEEP_BATCH_MAX_RANGE if PUSH_SWEEP_BATCHED
+                          else MAX_PUSH_SWEEP_RANGE):
         # Huge first-push of a long-lived branch — Stop hook is the backstop.
         emit_metrics({"skipped": True, "skip_reason": 43, **_base,
                       "pushed": len(push_range)})
         sys.exit(0)
 
-    reviewed = _load_reviewed_shas(repo_root)
+    reviewed = _load_reviewed_shas(repo_root, push_range)
     base, tail = _compute_push_sweep_base(prev_upstream, push_range, reviewed)
     prefix_advanced = len(push_range) - len(tail)
     if base is None:
         debug_log("Push sweep: every pushed commit already reviewed")
+        _drop_resumed()
         emit_metrics({**_base, "pushed": len(push_range), "unreviewed": 0,
                       "prefix_advanced": prefix_advanced})
         sys.exit(0)
@@ -1666,8 +2308,54 @@ def handle_push_sweep_posttooluse(input_data):
     debug_log(f"Push sweep: range={len(push_range)} prefix_advanced="
               f"{prefix_advanced} base={base[:12]} tail={len(tail)}")
 
-    diff_text = _git_diff_range(repo_root, base, "HEAD")
-    if diff_text is None:
+    # Batched mode replaces the net-diff review only for ranges it would
+    # skip (more than MAX_PUSH_SWEEP_RANGE commits) or cut (more than
+    # MAX_PUSH_SWEEP_FILES reviewable files); anything smaller is one call
+    # either way. Commits in the tail that are already reviewed are left
+    # out of the batches rather than re-reviewed. If numstat or the
+    # per-commit file lists fail, the net-diff path below decides as usual.
+    batches = None
+    if PUSH_SWEEP_BATCHED:
+        entries = git_numstat(
+            [*GIT_CMD, "diff", "--numstat", "-z", "--no-ext-diff", base, "HEAD"],
+            repo_root)
+        full = plan_diff_paths(entries) if entries is not None else None
+        if full is not None and (len(tail) > MAX_PUSH_SWEEP_RANGE
+                                 or full["reviewable"] > MAX_PUSH_SWEEP_FILES):
+            commit_paths = git_commit_paths(repo_root, base, "HEAD")
+            if commit_paths is not None:
+                batches, free = _push_sweep_batches(
+                    full["entries"], commit_paths,
+                    [c for c in tail if c not in reviewed], MAX_PUSH_SWEEP_FILES)
+    if batches is None and len(tail) > MAX_PUSH_SWEEP_RANGE:
+        emit_metrics({"skipped": True, "skip_reason": 43, **_base,
+                      "pushed": len(push_range)})
+        sys.exit(0)
+
+    # Same prioritize-don't-bail logic as commit-review (see comment there),
+    # decided from `git diff --numstat` before any patch text is generated
+    # (_git_diff_range_files). push-sweep ranges are net diffs over many
+    # commits so they hit the cap more often; reviewing the riskiest
+    # MAX_PUSH_SWEEP_FILES is strictly better than reviewing none. We still
+    # mark `tail` reviewed afterward — the dropped files are by construction
+    # the low-risk ones (config, .gen, tests, migrations), and NOT advancing
+    # the base would make the next push re-hit the same overflow with an
+    # even larger range. Per-commit review remains the primary surface for
+    # those files. The 10× pathological guard stays so a 500-file
+    # vendored-dir push doesn't burn a counter slot.
+    plan = {}
+    if batches is not None:
+        if free:
+            _append_reviewed_shas(repo_root, free, vulns_found=0)
+        # Stand-in so the empty-diff exit below covers "no batch left".
+        diff_files = [f for b in batches for f in b[1]]
+        plan["dropped"] = sum(b[2] for b in batches)
+    else:
+        diff_files = _git_diff_range_files(repo_root, base, "HEAD",
+                                           cap=MAX_PUSH_SWEEP_FILES,
+                                           hard_cap=10 * MAX_PUSH_SWEEP_FILES,
+                                           plan_out=plan)
+    if diff_files is None:
         # Diff failed (non-zero exit / 30s timeout / git missing). Do NOT
         # mark `tail` reviewed — we did not actually review it. Marking
         # them would silently advance the prefix past unreviewed commits
@@ -1679,30 +2367,23 @@ def handle_push_sweep_posttooluse(input_data):
         emit_metrics({**_base, "pushed": len(push_range),
                       "unreviewed": len(tail), "skip_reason": 45})
         sys.exit(0)
-    diff_files = parse_diff_into_files(diff_text)
+    if plan.get("pathological"):
+        emit_metrics({**_base, "pushed": len(push_range),
+                      "unreviewed": len(tail), "skip_reason": 31,
+                      "diff_files_count": plan["reviewable"]})
+        sys.exit(0)
     if not diff_files:
         emit_metrics({**_base, "pushed": len(push_range),
                       "unreviewed": len(tail), "skip_reason": 30})
         # Still mark tail reviewed — there's nothing to review.
         _append_reviewed_shas(repo_root, tail, vulns_found=0)
+        _drop_resumed()
         sys.exit(0)
-    # Same prioritize-don't-bail logic as commit-review (see comment there).
-    # push-sweep ranges are net diffs over many commits so they hit the cap
-    # more often; reviewing the riskiest MAX_PUSH_SWEEP_FILES is strictly
-    # better than reviewing none. We still mark `tail` reviewed afterward —
-    # the dropped files are by construction the low-risk ones (config, .gen,
-    # tests, migrations), and NOT advancing the base would make the next
-    # push re-hit the same overflow with an even larger range. Per-commit
-    # review remains the primary surface for those files. The 10×
-    # pathological guard stays so a 500-file vendored-dir push doesn't burn
-    # a counter slot.
-    if len(diff_files) > 10 * MAX_PUSH_SWEEP_FILES:
-        emit_metrics({**_base, "pushed": len(push_range),
-                      "unreviewed": len(tail), "skip_reason": 31,
-                      "diff_files_count": len(diff_files)})
-        sys.exit(0)
-    diff_files, _dropped = _prioritize_diff_files(diff_files, MAX_PUSH_SWEEP_FILES)
-    if _dropped:
+    _dropped = plan.get("dropped", 0)
+    if _dropped and batches is not None:
+        _base = {**_base, "sweep_flags":
+                 _base.get("sweep_flags", 0) | _SWEEP_FLAG_FILES_DROPPED}
+    elif _dropped:
         _base = {**_base, "diff_files_dropped": _dropped}
 
     _allowed, _rate_n = atomic_check_rate_limit(
@@ -1723,42 +2404,76 @@ def handle_push_sweep_posttooluse(input_data):
     ) or []
 
     review_start = _time.time()
-    rel_touched = [fp for fp, _ in diff_files]
-    if _agentic_commit_review_enabled():
-        concrete_guidance, vulns, agentic_metrics = _agentic_review_with_race(
-            repo_root, diff_files, rel_touched, previous_findings
-        )
-        if agentic_metrics.get("agentic_fallback"):
-            concrete_guidance, vulns = analyze_code_security(
-                diff_files, is_diff=True, previous_findings=previous_findings
+    use_agentic = _agentic_commit_review_enabled()
+
+    def _push_review(files):
+        if use_agentic:
+            rel_touched = [fp for fp, _ in files]
+            g, v, agentic_metrics = _agentic_review_with_race(
+                repo_root, files, rel_touched, previous_findings
             )
-    else:
-        concrete_guidance, vulns = analyze_code_security(
-            diff_files, is_diff=True, previous_findings=previous_findings
+            if agentic_metrics.get("agentic_fallback"):
+                g, v = analyze_code_security(
+                    files, is_diff=True, previous_findings=previous_findings
+                )
+                return g, v, False
+            return g, v, agentic_metrics.get("race_winner", 1) == 1
+        g, v = analyze_code_security(
+            files, is_diff=True, previous_findings=previous_findings
         )
-        agentic_metrics = {}
+        return g, v, (llm._last_review_completed
+                      and not llm._last_review_truncated_tokens)
+
+    if batches is not None:
+        # Recorded before the first batch starts so a sweep killed midway
+        # still resumes; cleared once every batch is reviewed. It covers the
+        # resumed sweep's range too, so that record is superseded.
+        if sweep_ref and head:
+            _save_push_sweep_resume(repo_root, sweep_ref, head, prev_upstream)
+            if resumed and resumed[0] != head:
+                _drop_resumed()
+        vulns, files_reviewed, cache_metrics = _run_push_sweep_batches(
+            repo_root, base, batches, previous_findings, use_agentic)
+        concrete_guidance = None
+        if sweep_ref and head and cache_metrics["sweep_batches_done"] == len(batches):
+            _save_push_sweep_resume(repo_root, sweep_ref, head)
+    else:
+        # Hunks the per-commit reviews already judged come from review_cache.
+        concrete_guidance, vulns, cache_metrics = _cached_review(
+            diff_files, previous_findings,
+            "agentic" if use_agentic else "single", _push_review)
+        files_reviewed = len(diff_files)
+        # The tail is now covered by this net-diff review.
+        _append_reviewed_shas(repo_root, tail, vulns_found=len(vulns or []))
+        _drop_resumed()
     review_ms = int((_time.time() - review_start) * 1000)
 
-    # The tail is now covered by this net-diff review.
-    _append_reviewed_shas(repo_root, tail, vulns_found=len(vulns or []))
-
     new_vulns, n_deduped = _dedup_against_state(
         session_id, vulns or [], prompted=_finding_keys(previous_findings)
     )
 
-    # Metrics — keep within the 10-key cap; agentic sub-metrics are dropped
-    # here in favour of the push-sweep funnel keys (telemetry can join on session_id
-    # to the per-commit fires for agentic detail). rewake_summary must ride
+    # Metrics — CC keeps only the first 20 keys, and emit_metrics prepends
+    # pv and the 6 usage keys. The worst case on either path is exactly 20:
+    # push_sweep/push_sweep_on/rate_count, sweep_flags, the 6 funnel keys and
+    # deduped, plus diff_files_dropped and review_cache_hits (net diff) or
+    # sweep_batches/sweep_batches_done (batched). Agentic
+    # sub-metrics are dropped here in favour of the push-sweep funnel keys
+    # (telemetry can join on session_id to the per-commit fires for agentic
+    # detail). rewake_summary must ride
     # this line (CC reads only the first {-prefixed stdout line); the emit
     # is deferred to the two exit points below so the with-vulns path can
     # also pass additional_context in the same JSON line (#1375/#1783) —
     # the by-design "CC keeps only the first JSON line" constraint means
     # we can't emit twice. Builds the shared metrics dict here; vulns path
     # adds additional_context, no-vulns path emits as-is.
+    _flags = _base.get("sweep_flags", 0) | cache_metrics.pop("sweep_flags", 0)
+    if _flags:
+        _base = {**_base, "sweep_flags": _flags}
     _push_metrics = {
         **_base, "pushed": len(push_range), "unreviewed": len(tail),
         "prefix_advanced": prefix_advanced, "vulns_found": len(new_vulns),
-        "files_reviewed": len(diff_files), "review_ms": review_ms,
+        "files_reviewed": files_reviewed, "review_ms": review_ms,
+        **cache_metrics,
         **({"deduped": n_deduped} if n_deduped else {}),
     }
     _push_rewake_summary = _format_vulns_summary(new_vulns, prefix="Push security review found")
@@ -1828,6 +2543,7 @@ def handle_push_sweep_posttooluse(input_data):
                  hook_event_name="PostToolUse")
     sys.exit(2)
 
+@traced()
 def handle_stop_hook(input_data):
     """
     Handle the Stop hook — final security check using git diff.
@@ -1839,6 +2555,7 @@ def handle_stop_hook(input_data):
     fixed/unresolved tally; the sweep needs no LLM and measures
     pattern-rule efficacy.
     """
+    _ensure_llm()
     session_id = input_data.get("session_id", "default")
     stop_hook_active = input_data.get("stop_hook_active", False)
     cwd = input_data.get("cwd", "")
@@ -1856,6 +2573,9 @@ def handle_stop_hook(input_data):
     # git, network). asyncRewake Stop runs in the background; the next turn's
     # UPS/PostToolUse can fire while we're still here. The snapshot is immune
     # to those writes — they affect the NEXT Stop fire's snapshot.
+    # SG_ASYNC_BASELINE: let a still-running deferred capture land first so
+    # the snapshot below holds the real turn-start baseline, not HEAD.
+    baseline_wait_ms, baseline_degraded = await_baseline_capture(session_id)
     snap = consume_stop_state(session_id)
     fire_count = snap["fire_count"]
     touched_paths = snap["touched_paths"]
@@ -1882,8 +2602,9 @@ def handle_stop_hook(input_data):
         if restore:
             restore_unreviewed_stop_state(session_id, touched_paths, snap_baseline)
         # CC truncates metrics to 10 keys by
-        # insertion order. v2_metrics (3) must precede sweep (3) so the v2
-        # diagnostics survive when extra adds touched_paths_count + ip_* keys.
+        # insertion order. v2_metrics (3, plus the baseline key) must precede
+        # sweep (3) so the v2 diagnostics survive when extra adds
+        # touched_paths_count + ip_* keys.
         emit_metrics({
             "skipped": True, "skip_reason": reason, "fire_index": fire_count + 1,
             "diff_strategy_v2": True,
@@ -1923,6 +2644,14 @@ def handle_stop_hook(input_data):
     review_paths, diff_base, repo_root, untracked, v2_metrics = compute_v2_review_set(
         cwd, baseline_sha, head_at_capture, untracked_at_baseline
     )
+    # One key, first in v2_metrics: baseline_degraded when the deferred
+    # capture timed out (the wait is then SG_ASYNC_BASELINE_WAIT_S anyway),
+    # else how long Stop waited for it. Leading the dict keeps it inside the
+    # 20-key cap on the slow/error emits it exists to explain.
+    if baseline_wait_ms is not None:
+        v2_metrics = {**({"baseline_degraded": True} if baseline_degraded
+                         else {"baseline_wait_ms": baseline_wait_ms}),
+                      **v2_metrics}
     if not review_paths:
         debug_log("Stop hook: empty review set")
         _skip(9, touched_paths_count=len(touched_paths))
@@ -1935,42 +2664,52 @@ def handle_stop_hook(input_data):
     # from git state (compute_v2_review_set), so Bash/subagent edits are
     # caught either way. Fall back to diff_base (HEAD/head_at_capture)
     # when the stash is missing or pruned.
+    #
+    # Numstat first (get_git_diff_files): the pathological bail and the
+    # MAX_DIFF_FILES prioritization below are decided from `git diff
+    # --numstat`, and patch text is generated only for the files that will
+    # be reviewed — an oversized diff never materializes in full. Stop is
+    # the only surface for uncommitted edits; the old hard-skip at >30
+    # files dropped the 31-300 bucket entirely, which is where cross-file
+    # source→sink vulns hide, so only >300 (usually a bad baseline) bails.
+    # Sharded review takes every file, trimmed by priority to what fits
+    # the shard token ceiling.
     content_base = baseline_sha or diff_base
-    diff_output = get_git_diff(repo_root, content_base, full_context=False,
-                               paths=review_paths, untracked_paths=untracked)
-    if diff_output is None and content_base != diff_base:
+    _sharded = sharded_review_enabled()
+    _plan_kw = {"cap": None if _sharded else MAX_DIFF_FILES,
+                "hard_cap": 10 * MAX_DIFF_FILES,
+                "max_tokens": (sharded_diff_token_budget(10 * MAX_DIFF_FILES)
+                               if _sharded else None)}
+    _plan = {}
+    diff_files = get_git_diff_files(repo_root, content_base, paths=review_paths,
+                                    untracked_paths=untracked, plan_out=_plan,
+                                    **_plan_kw)
+    if diff_files is None and content_base != diff_base:
         debug_log(f"Stop hook: diff against {content_base[:12]} failed — falling back to {diff_base}")
-        diff_output = get_git_diff(repo_root, diff_base, full_context=False,
-                                   paths=review_paths, untracked_paths=untracked)
+        _plan = {}
+        diff_files = get_git_diff_files(repo_root, diff_base, paths=review_paths,
+                                        untracked_paths=untracked, plan_out=_plan,
+                                        **_plan_kw)
     # filter_preexisting_from_diff needs a resolvable pre-turn ref; fall
     # back to HEAD when UPS never captured a baseline (print mode).
     if not baseline_sha:
         baseline_sha = "HEAD"
 
-    if not diff_output or not diff_output.strip():
+    if not diff_files and not _plan.get("files"):
         debug_log("Stop hook: no changes since baseline")
         _skip(6)
 
-    # Parse diff into per-file content
-    diff_files = parse_diff_into_files(diff_output)
+    if _plan.get("pathological"):
+        debug_log(f"Stop hook: pathological diff ({_plan['reviewable']} files > "
+                  f"{10 * MAX_DIFF_FILES}), skipping")
+        _skip(8, diff_files_count=_plan["reviewable"])
+
     if not diff_files:
         debug_log("Stop hook: no source code files in diff")
         _skip(7)
 
-    # Mirror commit-review: hard-bail only on pathological diffs (>300 files,
-    # usually a bad baseline), otherwise prioritize by security-risk path
-    # tokens and review the top MAX_DIFF_FILES. Stop is the only surface for
-    # uncommitted edits; the old hard-skip at >30 files dropped the 31-300
-    # bucket entirely, which is where cross-file source→sink vulns hide.
-    # _cap_files_for_prompt already bounds bytes downstream.
-    _stop_dropped = 0
-    if len(diff_files) > 10 * MAX_DIFF_FILES:
-        debug_log(f"Stop hook: pathological diff ({len(diff_files)} files > "
-                  f"{10 * MAX_DIFF_FILES}), skipping")
-        _skip(8, diff_files_count=len(diff_files))
-    if len(diff_files) > MAX_DIFF_FILES:
-        diff_files, _stop_dropped = _prioritize_diff_files(
-            diff_files, MAX_DIFF_FILES)
+    _stop_dropped = _plan.get("dropped", 0)
+    if _stop_dropped:
         debug_log(f"Stop hook: prioritized to {len(diff_files)} files "
                   f"(dropped {_stop_dropped} lower-risk)")
 
@@ -1985,9 +2724,15 @@ def handle_stop_hook(input_data):
     # Stop hook is single-shot only. Agentic review is wired into
     # handle_commit_review_posttooluse (PostToolUse on `git commit`) — commits
     # are slower-OK and benefit from the deeper context-reading loop.
-    concrete_guidance, vulns = analyze_code_security(
-        diff_files, is_diff=True, previous_findings=previous_findings
-    )
+    # Files whose hunks an earlier fire (or commit review) already judged
+    # come from review_cache; only the rest go to the model.
+    # With SG_SHARDED_REVIEW the >MAX_DIFF_FILES cut above is skipped and
+    # _single_shot_review shards the whole diff instead.
+    def _single_shot(files):
+        return _single_shot_review(files, previous_findings, MAX_DIFF_FILES)
+
+    concrete_guidance, vulns, cache_metrics = _cached_review(
+        diff_files, previous_findings, "single", _single_shot)
     # NOTE: analyze_security_concerns disabled — it produces too many false positives
     # on pre-existing patterns in starter code. The concrete vulnerability analysis
     # is more precise and has severity filtering (high/critical only).
@@ -2043,7 +2788,7 @@ def handle_stop_hook(input_data):
             state["previous_findings_ts"] = _time.time()
             if new_sha:
                 state["baseline_sha"] = new_sha
-                state["untracked_at_baseline"] = new_untracked_baseline
+                set_untracked_baseline(state, session_id, new_untracked_baseline)
         with_locked_state(session_id, _record_fire)
 
         if new_sha:
@@ -2054,7 +2799,10 @@ def handle_stop_hook(input_data):
             s = v.get("severity", "medium")
             if s in sev:
                 sev[s] += 1
-        # 8 base keys + at most 2 sweep keys = 10 (cap). Drop the mask here.
+        # 9 base + diff_truncated_tokens + at most 2 sweep keys + the
+        # review_cache_hits tail = 13, behind up to 9 prepended pv/usage/
+        # http_err keys. Drop the mask here; review_cache_hits goes last so it,
+        # not the sweep keys, is what an over-cap emit loses.
         # untracked_baseline_n is the signal for whether the UPS-time
         # untracked-snapshot capture actually ran.
         sweep_trimmed = {k: v for k, v in sweep.items() if k != "warn_unresolved_mask"}
@@ -2073,9 +2821,10 @@ def handle_stop_hook(input_data):
             "touched_paths_count": len(touched_paths),
             "review_ms": review_ms,
             "fire_index": fire_index,
-            **({"diff_truncated": llm._last_review_truncated_bytes}
-               if llm._last_review_truncated_bytes else {}),
+            **({"diff_truncated_tokens": llm._last_review_truncated_tokens}
+               if llm._last_review_truncated_tokens else {}),
             **sweep_trimmed,
+            **cache_metrics,
         }, rewake_summary=_format_vulns_summary(vulns),
            additional_context=(PROVENANCE_BANNER + "\n\n"
                                + concrete_guidance + CONTINUATION_SUFFIX + "\n"),
@@ -2087,12 +2836,15 @@ def handle_stop_hook(input_data):
         restore_unreviewed_stop_state(session_id, touched_paths, snap_baseline)
     else:
         debug_log("Stop hook: no security issues found")
-    # CC truncates metrics to 10 keys by
-    # insertion order. The previous **sweep,**v2_metrics tail meant the 3
-    # v2_metrics keys were always sliced off this most-common path, so the
-    # diff-strategy diagnostics never reached telemetry. Drop sweep here (it's
-    # PostToolUse-warning state, orthogonal to diff-strategy comparison).
-    # 6 base + optional api_error + 3 v2_metrics = ≤10.
+    # CC keeps only the first 20 keys, in insertion order. The previous
+    # **sweep,**v2_metrics tail meant the v2_metrics keys were always sliced
+    # off this most-common path, so the diff-strategy diagnostics never
+    # reached telemetry. Drop sweep here (it's PostToolUse-warning state,
+    # orthogonal to diff-strategy comparison).
+    # 6 base + 4 v2_metrics (3 + the baseline key) = 10, behind up to 9
+    # prepended pv/usage/http_err keys = 19; api_error, diff_truncated_tokens
+    # and review_cache_hits follow, so an error run with every optional key
+    # loses the last two of those, never the v2/baseline diagnostics.
     emit_metrics({
         "vulns_found": 0,
         "diff_strategy_v2": True,
@@ -2100,10 +2852,11 @@ def handle_stop_hook(input_data):
         "touched_paths_count": len(touched_paths),
         "review_ms": review_ms,
         "fire_index": fire_index,
-        **({"api_error": llm._last_call_claude_http_error} if llm._last_call_claude_http_error is not None else {}),
-        **({"diff_truncated": llm._last_review_truncated_bytes}
-           if llm._last_review_truncated_bytes else {}),
         **v2_metrics,
+        **({"api_error": llm._last_call_claude_http_error} if llm._last_call_claude_http_error is not None else {}),
+        **({"diff_truncated_tokens": llm._last_review_truncated_tokens}
+           if llm._last_review_truncated_tokens else {}),
+        **cache_metrics,
     })
     sys.exit(0)
 
@@ -2153,6 +2906,12 @@ def main():
     """Main hook function."""
     debug_log(f"Hook called with args: {sys.argv}")
 
+    # Detached deferred-baseline worker spawned by _defer_baseline_capture.
+    if sys.argv[1:2] == ["--capture-baseline"] and len(sys.argv) == 5:
+        tracing.set_label("capture-baseline")
+        land_deferred_baseline(*sys.argv[2:5])
+        return
+
     # Master kill switch — honors ENABLE_SECURITY_REMINDER=0 (legacy) and
     # SECURITY_GUIDANCE_DISABLE=1 (clearer name, no double negative). Emit
     # empty metrics so asyncRewake hooks (Stop) don't hang waiting for stdout
@@ -2179,6 +2938,7 @@ def main():
     tool_input = input_data.get("tool_input", {})
     hook_event_name = input_data.get("hook_event_name", "")
     debug_log(f"Processing: hook_event={hook_event_name}, tool={tool_name}")
+    tracing.set_label(f"{hook_event_name}:{tool_name}" if tool_name else hook_event_name)
 
     # Load project-specific security guidance and custom patterns once
     # per invocation. Failures are non-fatal (debug-logged) so a malformed
@@ -2268,9 +3028,8 @@ def main():
             # This prevents flagging pre-existing insecure patterns when Claude rewrites a file
             if tool_name == "Write" and pattern_matches:
                 cwd = os.environ.get("CLAUDE_PROJECT_DIR", os.getcwd())
-                baseline_content = get_baseline_file_content(session_id, file_path, cwd)
-                if baseline_content is not None:
-                    baseline_matches = set(r for r, _ in check_patterns(file_path, baseline_content))
+                baseline_matches = baseline_pattern_rule_names(session_id, file_path, cwd)
+                if baseline_matches is not None:
                     pattern_matches = [(r, msg) for r, msg in pattern_matches if r not in baseline_matches]
                     if pattern_matches:
                         debug_log(f"New patterns (not in baseline): {[r for r, _ in pattern_matches]}")
@@ -2322,4 +3081,5 @@ def main():
     sys.exit(0)
 
 if __name__ == "__main__":
-    main()
+    with span("hook", "hook"):
+        main()
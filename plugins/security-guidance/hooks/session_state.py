@@ -2,8 +2,9 @@
 Per-session state-file plumbing for the security-guidance plugin.
 
 Holds the JSON state file location, fcntl-locked read-modify-write helper,
-and old-file GC. Side-effect-free at import time (no env-var reads beyond
-``CLAUDE_CODE_REMOTE_SESSION_ID`` inside the helpers).
+the opt-in SQLite backend behind the same helper, and old-file GC.
+Side-effect-free at import time (no env-var reads beyond
+``CLAUDE_CODE_REMOTE_SESSION_ID`` / ``SG_STATE_BACKEND`` inside the helpers).
 
 The ``atomic_check_*`` helpers that build on ``with_locked_state`` deliberately
 remain in ``security_reminder_hook.py`` so that tests which monkeypatch
@@ -17,9 +18,11 @@ except ImportError:
 import json
 import os
 import re
+import threading
 from datetime import datetime
 
 from _base import debug_log, state_dir as _state_dir
+from tracing import span
 
 
 def _state_key(session_id):
@@ -57,8 +60,8 @@ def cleanup_old_state_files():
         thirty_days_ago = current_time - (30 * 24 * 60 * 60)
 
         for filename in os.listdir(state_dir):
-            if filename.startswith("security_warnings_state_") and (
-                filename.endswith(".json") or filename.endswith(".lock")
+            if filename.startswith("security_warnings_state_") and filename.endswith(
+                (".json", ".lock", ".sqlite3", ".sqlite3-wal", ".sqlite3-shm")
             ):
                 file_path = os.path.join(state_dir, filename)
                 try:
@@ -122,6 +125,9 @@ def with_locked_state(session_id, callback):
     State is saved after the callback returns.
     Returns the callback's return value.
     """
+    if _sqlite_backend_enabled():
+        return _sqlite_with_locked_state(session_id, callback)
+
     lock_file = get_lock_file(session_id)
     state_dir = os.path.dirname(lock_file)
 
@@ -140,11 +146,13 @@ def with_locked_state(session_id, callback):
     lock_fd = None
     try:
         lock_fd = os.open(lock_file, os.O_RDWR | os.O_CREAT)
-        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        with span("state.lock_wait", "lock"):
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
 
-        state = load_state(session_id)
-        result = callback(state)
-        save_state(session_id, state)
+        with span("state.locked", "lock"):
+            state = load_state(session_id)
+            result = callback(state)
+            save_state(session_id, state)
         return result
 
     except (OSError, IOError) as e:
@@ -159,3 +167,323 @@ def with_locked_state(session_id, callback):
             except (OSError, IOError):
                 pass
 
+
+
+# =====================================================================
+# SQLite backend (SG_STATE_BACKEND=sqlite)
+# =====================================================================
+#
+# The JSON backend reads and rewrites the whole state file under flock on
+# every call, so a one-line mutation (mark a warning shown, append a touched
+# path) costs O(total state) in both lock hold time and bytes written, and
+# shown_warnings only ever grows over a long session.
+#
+# This backend keeps one WAL-mode database per session with a table per key
+# family. with_locked_state stays the API: the callback gets a dict whose
+# families are loaded on first access, and only families that changed are
+# written back, row by row where the shape allows (dict families upsert or
+# delete changed keys; list families append when the old list is a prefix
+# of the new one). shown_warnings is never loaded at all — it's a
+# list-like proxy whose `in`/append go straight to an indexed table, so
+# atomic_check_and_mark_warning is O(log n) at any session length.
+#
+# BEGIN IMMEDIATE takes SQLite's write lock, which serializes writers the
+# way the flock did; WAL lets readers proceed concurrently. Any sqlite3
+# error returns None, the same fail-open signal as the JSON path's OSError.
+#
+# On first open the session's existing JSON file (if any) is migrated in,
+# inside the same write transaction, so a concurrent first open can't
+# migrate twice. The JSON file is left in place; cleanup_old_state_files
+# ages it out like any other.
+
+_SQLITE_SUFFIX = ".sqlite3"
+_SQLITE_BUSY_TIMEOUT_S = 30.0
+_LIST_FAMILIES = ("touched_paths", "previous_findings")
+_DICT_FAMILIES = ("pending_warnings", "rate_limits", "counters", "untracked_at_baseline",
+                  "baseline_verdicts")
+_MISSING = object()
+
+_SQLITE_CONNS = {}
+_SQLITE_LOCK = threading.RLock()
+
+
+def _sqlite_backend_enabled():
+    if os.environ.get("SG_STATE_BACKEND", "").strip().lower() != "sqlite":
+        return False
+    try:
+        import sqlite3  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_sqlite_file(session_id):
+    """Get session-specific SQLite state path."""
+    return os.path.join(
+        _state_dir(), f"security_warnings_state_{_state_key(session_id)}{_SQLITE_SUFFIX}"
+    )
+
+
+def _sqlite_conn(session_id):
+    import sqlite3
+    path = get_sqlite_file(session_id)
+    conn = _SQLITE_CONNS.get(path)
+    if conn is not None:
+        return conn
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=_SQLITE_BUSY_TIMEOUT_S,
+                           isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v TEXT NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS shown_warnings (k TEXT PRIMARY KEY)")
+    for name in _LIST_FAMILIES:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {name} "
+                     "(seq INTEGER PRIMARY KEY, v TEXT NOT NULL)")
+    for name in _DICT_FAMILIES:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {name} "
+                     "(k TEXT PRIMARY KEY, v TEXT NOT NULL)")
+    _SQLITE_CONNS[path] = conn
+    return conn
+
+
+class _ShownWarnings:
+    """List-like view of the shown_warnings table: membership and append
+    hit the primary-key index instead of materializing the list."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __contains__(self, key):
+        return self._conn.execute(
+            "SELECT 1 FROM shown_warnings WHERE k = ?", (str(key),)
+        ).fetchone() is not None
+
+    def append(self, key):
+        self._conn.execute("INSERT OR IGNORE INTO shown_warnings (k) VALUES (?)", (str(key),))
+
+    def _rows(self):
+        return [r[0] for r in self._conn.execute("SELECT k FROM shown_warnings ORDER BY rowid")]
+
+    def __iter__(self):
+        return iter(self._rows())
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM shown_warnings").fetchone()[0]
+
+    def __getitem__(self, idx):
+        return self._rows()[idx]
+
+
+def _dumps(value):
+    return json.dumps(value, sort_keys=True)
+
+
+def _read_family(conn, key):
+    if key == "shown_warnings":
+        return _ShownWarnings(conn)
+    row = conn.execute("SELECT v FROM kv WHERE k = ?", (key,)).fetchone()
+    if row is not None:
+        return json.loads(row[0])
+    if key in _LIST_FAMILIES:
+        vals = [json.loads(v) for (v,) in conn.execute(f"SELECT v FROM {key} ORDER BY seq")]
+        return vals if vals else _MISSING
+    if key in _DICT_FAMILIES:
+        vals = {k: json.loads(v) for k, v in conn.execute(f"SELECT k, v FROM {key}")}
+        return vals if vals else _MISSING
+    return _MISSING
+
+
+def _write_family(conn, key, value, orig):
+    """Persist one family. `orig` is the value as loaded (or _MISSING)."""
+    conn.execute("DELETE FROM kv WHERE k = ?", (key,))
+    if key == "shown_warnings" and isinstance(value, list):
+        conn.execute("DELETE FROM shown_warnings")
+        conn.executemany("INSERT OR IGNORE INTO shown_warnings (k) VALUES (?)",
+                         [(str(k),) for k in value])
+        return
+    if key in _LIST_FAMILIES and isinstance(value, list):
+        if isinstance(orig, list) and value[:len(orig)] == orig:
+            tail = value[len(orig):]
+        else:
+            conn.execute(f"DELETE FROM {key}")
+            tail = value
+        conn.executemany(f"INSERT INTO {key} (v) VALUES (?)", [(_dumps(v),) for v in tail])
+        return
+    if key in _DICT_FAMILIES and isinstance(value, dict) and all(isinstance(k, str) for k in value):
+        if not isinstance(orig, dict):
+            conn.execute(f"DELETE FROM {key}")
+            orig = {}
+        conn.executemany(f"DELETE FROM {key} WHERE k = ?",
+                         [(k,) for k in orig if k not in value])
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {key} (k, v) VALUES (?, ?)",
+            [(k, _dumps(v)) for k, v in value.items()
+             if k not in orig or _dumps(orig[k]) != _dumps(v)],
+        )
+        return
+    # Scalars, and any family a callback replaced with an off-shape value.
+    if key in _LIST_FAMILIES or key in _DICT_FAMILIES or key == "shown_warnings":
+        conn.execute(f"DELETE FROM {key}")
+    conn.execute("INSERT INTO kv (k, v) VALUES (?, ?)", (key, _dumps(value)))
+
+
+def _delete_family(conn, key):
+    conn.execute("DELETE FROM kv WHERE k = ?", (key,))
+    if key in _LIST_FAMILIES or key in _DICT_FAMILIES or key == "shown_warnings":
+        conn.execute(f"DELETE FROM {key}")
+
+
+class _SqliteState(dict):
+    """The callback-facing state dict. Families load on first touch; save()
+    writes back only those whose value changed."""
+
+    def __init__(self, conn):
+        super().__init__()
+        self._conn = conn
+        self._orig = {}  # key -> (loaded value or _MISSING, json snapshot)
+
+    def _load(self, key):
+        if key in self._orig:
+            return
+        value = _read_family(self._conn, key)
+        if isinstance(value, _ShownWarnings):
+            self._orig[key] = (value, None)
+        elif value is _MISSING:
+            self._orig[key] = (_MISSING, None)
+        else:
+            snap = _dumps(value)
+            self._orig[key] = (json.loads(snap), snap)
+        if value is not _MISSING:
+            dict.__setitem__(self, key, value)
+
+    def __getitem__(self, key):
+        self._load(key)
+        return dict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        self._load(key)
+        return dict.__contains__(self, key)
+
+    def __setitem__(self, key, value):
+        self._load(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._load(key)
+        dict.__delitem__(self, key)
+
+    def get(self, key, default=None):
+        self._load(key)
+        return dict.get(self, key, default)
+
+    def setdefault(self, key, default=None):
+        self._load(key)
+        return dict.setdefault(self, key, default)
+
+    def pop(self, key, *default):
+        self._load(key)
+        return dict.pop(self, key, *default)
+
+    def save(self):
+        for key, (orig, snap) in self._orig.items():
+            present = dict.__contains__(self, key)
+            value = dict.get(self, key)
+            if isinstance(orig, _ShownWarnings) and value is orig:
+                continue  # write-through proxy
+            if not present:
+                if orig is not _MISSING:
+                    _delete_family(self._conn, key)
+                continue
+            if snap is not None and _dumps(value) == snap:
+                continue
+            _write_family(self._conn, key, value,
+                          orig if not isinstance(orig, _ShownWarnings) else _MISSING)
+
+
+def _migrate_json_state(conn, session_id):
+    """Import the session's JSON state once. Caller holds the write txn."""
+    if conn.execute("SELECT 1 FROM meta WHERE k = 'json_migrated'").fetchone():
+        return
+    if os.path.exists(get_state_file(session_id)):
+        for key, value in load_state(session_id).items():
+            if key == "shown_warnings" and not value:
+                continue
+            _write_family(conn, key, value, _MISSING)
+        debug_log(f"session_state: migrated {get_state_file(session_id)} to SQLite")
+    conn.execute("INSERT OR REPLACE INTO meta (k, v) VALUES ('json_migrated', '1')")
+
+
+def _sqlite_with_locked_state(session_id, callback):
+    import sqlite3
+    with _SQLITE_LOCK:
+        try:
+            with span("state.lock_wait", "lock", backend="sqlite"):
+                conn = _sqlite_conn(session_id)
+                conn.execute("BEGIN IMMEDIATE")
+        except (sqlite3.Error, OSError) as e:
+            debug_log(f"SQLite state open failed: {e}")
+            return None
+        try:
+            with span("state.locked", "lock", backend="sqlite"):
+                _migrate_json_state(conn, session_id)
+                state = _SqliteState(conn)
+                result = callback(state)
+                state.save()
+                conn.execute("COMMIT")
+            return result
+        except sqlite3.Error as e:
+            debug_log(f"SQLite state operation failed: {e}")
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            return None
+        except BaseException:
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            raise
+
+
+if __name__ == "__main__":
+    # `python3 session_state.py` — lock hold time and bytes written for one
+    # atomic_check_and_mark_warning-shaped call, JSON vs SQLite, at 1k/10k/100k
+    # existing shown warnings. Runs against a throwaway state dir.
+    import tempfile
+    import time
+
+    def _mark(key):
+        def _cb(state):
+            warnings = state["shown_warnings"]
+            if key in warnings:
+                return False
+            warnings.append(key)
+            return True
+        return _cb
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["SECURITY_WARNINGS_STATE_DIR"] = tmp
+        for n in (1000, 10000, 100000):
+            seed = [f"/repo/src/file_{i}.py-eval_injection" for i in range(n)]
+            for backend in ("json", "sqlite"):
+                sid = f"bench-{backend}-{n}"
+                os.environ["SG_STATE_BACKEND"] = "json"
+                save_state(sid, {"shown_warnings": list(seed)})
+                os.environ["SG_STATE_BACKEND"] = backend
+                with_locked_state(sid, lambda s: None)  # migrate / warm
+                path = get_sqlite_file(sid) + "-wal" if backend == "sqlite" else get_state_file(sid)
+                times, written = [], []
+                for j in range(50):
+                    if backend == "sqlite":
+                        # Empty the WAL so its size afterwards is this call's write.
+                        _sqlite_conn(sid).execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                    t0 = time.perf_counter()
+                    with_locked_state(sid, _mark(f"/repo/new_{j}.py-eval_injection"))
+                    times.append((time.perf_counter() - t0) * 1000)
+                    written.append(os.path.getsize(path))
+                times.sort()
+                print(f"{backend:6s} n={n:>6}: p50 {times[len(times) // 2]:.2f}ms "
+                      f"max {times[-1]:.2f}ms, ~{sum(written) // len(written)} B/call")
@@ -0,0 +1,219 @@
+"""
+Per-invocation span tracing for the security-guidance hooks.
+
+emit_metrics carries a handful of coarse timings (review_ms,
+investigate_ms, ...) under a 20-key cap, which can't say whether a slow
+Stop review spent its time in compute_v2_review_set, get_git_diff, a
+with_locked_state lock wait, the reachability probe or the model call.
+With SG_TRACE=1 every hook process records nested spans and, on exit,
+writes them as one Chrome trace-event JSON file under
+``<state dir>/traces/`` (open in chrome://tracing or ui.perfetto.dev).
+
+What gets a span:
+  - ``span(name, **args)`` blocks and ``@traced()`` functions (handler
+    phases, diffstate/gitutil/review_cache entry points, the LLM calls),
+  - every ``subprocess.run`` — git and otherwise — with its argv and exit
+    code (the module wraps subprocess.run when tracing is on),
+  - every HTTP request in llm._http_request and every git cat-file batch
+    round-trip in gitutil.GitObjectReader,
+  - with_locked_state's lock wait and hold, separately.
+
+Disabled (the default), ``span`` returns a shared no-op context manager and
+``traced`` returns the function unchanged, so the cost is one call per
+span site and nothing per decorated function. The newest TRACE_KEEP files
+are kept.
+"""
+import atexit
+import functools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from _base import debug_log, state_dir as _state_dir
+
+ENABLED = os.environ.get("SG_TRACE", "").strip().lower() in ("1", "on", "true", "yes")
+
+TRACE_DIRNAME = "traces"
+TRACE_KEEP = 200
+
+_events = []
+_threads = {}
+_label = ""
+_flush_registered = False
+_lock = threading.Lock()
+# perf_counter → epoch microseconds, so traces from concurrent hook
+# processes line up when loaded together.
+_EPOCH_OFFSET_US = time.time() * 1e6 - time.perf_counter() * 1e6
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, et, ev, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "_t0")
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def set(self, **args):
+        """Attach args learned inside the span (status, sizes, ...)."""
+        self.args.update(args)
+
+    def __exit__(self, et, ev, tb):
+        t1 = time.perf_counter()
+        if et is SystemExit:
+            self.args["exit"] = ev.code if isinstance(ev.code, int) else 1
+        elif et is not None:
+            self.args["error"] = et.__name__
+        _record(self.name, self.cat, self._t0, t1, self.args)
+        return False
+
+
+def span(name, cat="sg", **args):
+    """Context manager timing its block as one complete ("X") event."""
+    if not ENABLED:
+        return _NOOP
+    return _Span(name, cat, args)
+
+
+def traced(name=None, cat="sg"):
+    """Decorator form of span(); a no-op when tracing is off."""
+    def deco(fn):
+        if not ENABLED:
+            return fn
+        mod = fn.__module__
+        if mod in ("__main__", "security_reminder_hook"):
+            mod = "hook"  # same name whether run as a script or in the worker
+        label = name or f"{mod}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*a, **kw):
+            with _Span(label, cat, {}):
+                return fn(*a, **kw)
+        return wrapper
+    return deco
+
+
+def set_label(label):
+    """Name this process in the trace and the trace file (hook event)."""
+    global _label
+    _label = label
+
+
+def _record(name, cat, t0, t1, args):
+    global _flush_registered
+    t = threading.current_thread()
+    ev = {"name": name, "cat": cat, "ph": "X",
+          "ts": round(t0 * 1e6 + _EPOCH_OFFSET_US, 1),
+          "dur": round((t1 - t0) * 1e6, 1),
+          "pid": os.getpid(), "tid": t.ident}
+    if args:
+        ev["args"] = args
+    with _lock:
+        _threads.setdefault(t.ident, t.name)
+        _events.append(ev)
+        if not _flush_registered:
+            _flush_registered = True
+            atexit.register(flush)
+
+
+def flush():
+    """Write the recorded events to a new trace file. Runs at exit."""
+    with _lock:
+        events = list(_events)
+        threads = dict(_threads)
+        _events.clear()
+    if not events:
+        return None
+    pid = os.getpid()
+    meta = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0,
+             "args": {"name": f"sg {_label or os.path.basename(sys.argv[0])}"}}]
+    meta += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+              "args": {"name": tname}} for tid, tname in threads.items()]
+    d = os.path.join(_state_dir(), TRACE_DIRNAME)
+    safe = "".join(c if c.isalnum() else "-" for c in (_label or "hook"))[:40]
+    path = os.path.join(d, f"{time.strftime('%Y%m%d-%H%M%S')}-{pid}-{safe}.json")
+    try:
+        os.makedirs(d, mode=0o700, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": meta + events, "displayTimeUnit": "ms"}, f)
+        _prune(d)
+    except OSError as e:
+        debug_log(f"trace: write failed: {e}")
+        return None
+    debug_log(f"trace: wrote {len(events)} spans to {path}")
+    return path
+
+
+def _prune(d):
+    try:
+        names = sorted(n for n in os.listdir(d) if n.endswith(".json"))
+    except OSError:
+        return
+    for n in names[:-TRACE_KEEP]:
+        try:
+            os.unlink(os.path.join(d, n))
+        except OSError:
+            pass
+
+
+def _argv_span(argv):
+    """(span name, argv shown in args) for a subprocess. Git gets
+    `git <subcommand>` and its argv from the subcommand on, without the
+    -c/-C options GIT_CMD carries; anything else its program basename."""
+    if isinstance(argv, (str, bytes)):
+        argv = [argv]
+    argv = [a if isinstance(a, str) else os.fsdecode(a) for a in (argv or [])]
+    if not argv:
+        return "subprocess", ""
+    prog = os.path.basename(argv[0])
+    if prog == "git":
+        i = 1
+        while i < len(argv):
+            if argv[i] in ("-c", "-C"):
+                i += 2
+                continue
+            if not argv[i].startswith("-"):
+                return f"git {argv[i]}", " ".join(["git"] + argv[i:])[:300]
+            i += 1
+    return prog, " ".join(argv)[:300]
+
+
+def _install_subprocess_spans():
+    orig_run = subprocess.run
+
+    @functools.wraps(orig_run)
+    def run(*popenargs, **kwargs):
+        name, shown = _argv_span(popenargs[0] if popenargs else kwargs.get("args"))
+        with _Span(name, "subprocess", {"argv": shown}) as s:
+            r = orig_run(*popenargs, **kwargs)
+            s.args["rc"] = r.returncode
+            return r
+
+    subprocess.run = run
+
+
+if ENABLED:
+    _install_subprocess_spans()
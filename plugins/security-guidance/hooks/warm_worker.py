@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""Opt-in warm worker for the PostToolUse[Edit|Write] pattern hook.
+
+Every Edit/Write/MultiEdit/NotebookEdit fires a fresh interpreter that
+imports security_reminder_hook (and with it llm, gitutil, diffstate,
+patterns, extensibility) just to run check_patterns(). In busy sessions that
+is hundreds of cold starts per hour. With SG_WARM_WORKER=1 this script
+becomes a thin client: it forwards the hook's stdin to a long-lived per-user
+worker over a Unix socket under the state dir, and relays the worker's
+stdout/stderr and exit code back to Claude Code. The worker keeps the
+modules imported and the `re` cache warm between calls.
+
+Fallback is always in-process: worker disabled, AF_UNIX/fcntl unavailable
+(Windows), socket absent/stale, or any error before a response arrives all
+run security_reminder_hook.main() in this interpreter, exactly as the plain
+hook command would. A missing worker is spawned detached for next time, so
+the first edit of a session pays the cold start and later edits don't.
+
+Only the synchronous Edit/Write path is forwarded. UserPromptSubmit, Stop
+and Bash (commit/push) events run in-process: they are asyncRewake or spawn
+long LLM calls, and serializing them through one worker would block edits.
+
+Session state stays on disk (session_state.with_locked_state) rather than
+in worker memory, so the in-process fallback and the async hooks always see
+the same warnings/touched-paths the worker wrote.
+
+The socket name carries a fingerprint of the interpreter, the hook sources'
+mtimes, and the config env vars read at import time (ENABLE_*, SG_*,
+SECURITY_*, ...). A plugin update or a session with different settings
+therefore talks to its own worker; stale workers exit after
+SG_WARM_WORKER_IDLE_S seconds (default 600) without a request. A state dir
+too deep for an AF_UNIX path puts the socket in a private per-user
+directory under $XDG_RUNTIME_DIR (or /tmp) instead, and a worker that
+fails to start is respawned at most every _SPAWN_THROTTLE_S seconds.
+
+A request the worker has received but not answered within
+_RESPONSE_TIMEOUT_S is not rerun in-process: the worker may already have
+recorded its warning as shown, so a rerun would only dedupe it away.
+
+    python3 warm_worker.py               # hook entrypoint (client)
+    python3 warm_worker.py --serve       # worker (spawned by the client)
+    python3 warm_worker.py --bench [N]   # cold vs warm p50/p99 latency
+"""
+import hashlib
+import io
+import json
+import os
+import socket
+import sys
+import traceback
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _base import debug_log, state_dir as _resolve_state_dir  # noqa: E402
+
+_HOOK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Tool names whose PostToolUse is forwarded; everything else runs in-process.
+_WORKER_TOOLS = ("Edit", "Write", "MultiEdit", "NotebookEdit")
+
+# Env prefixes whose values are frozen into module constants at import time
+# (ENABLE_PATTERN_RULES, MAX_DIFF_FILES, DEBUG_LOG_FILE, ...). A worker
+# imported under one set can't serve a client running under another.
+_FINGERPRINT_ENV_PREFIXES = (
+    "SG_", "ENABLE_", "SECURITY_", "MAX_", "ANTHROPIC_", "CLAUDE_CONFIG_DIR",
+)
+
+# Connect should be near-instant on a local socket; a slow connect means a
+# wedged worker and the in-process path is faster. The response budget
+# covers the Write-baseline `git show`, which is the slowest thing the
+# forwarded path does.
+_CONNECT_TIMEOUT_S = 0.5
+_RESPONSE_TIMEOUT_S = 10.0
+
+# sun_path is 108 bytes on Linux and 104 on macOS, NUL included.
+_MAX_SOCKET_PATH = 100
+# Minimum gap between two worker spawns for one socket, so a worker that
+# can't start doesn't cost every edit a second interpreter.
+_SPAWN_THROTTLE_S = 60
+
+
+class _ResponseTimeout(Exception):
+    """The worker has the whole request but did not answer in time."""
+
+
+def is_warm_worker_enabled():
+    """SG_WARM_WORKER=1|on opts in. Default off."""
+    v = os.environ.get("SG_WARM_WORKER", "").strip().lower()
+    return v in ("1", "on", "true", "yes") and fcntl is not None and hasattr(socket, "AF_UNIX")
+
+
+def _idle_timeout_s():
+    try:
+        return max(1.0, float(os.environ.get("SG_WARM_WORKER_IDLE_S", "600")))
+    except ValueError:
+        return 600.0
+
+
+def _fingerprint():
+    h = hashlib.sha256()
+    h.update(sys.executable.encode("utf-8", "replace"))
+    h.update(_HOOK_DIR.encode("utf-8", "replace"))
+    try:
+        for name in sorted(os.listdir(_HOOK_DIR)):
+            if name.endswith(".py"):
+                st = os.stat(os.path.join(_HOOK_DIR, name))
+                h.update(f"{name}:{st.st_mtime_ns}:{st.st_size}".encode("utf-8", "replace"))
+    except OSError:
+        pass
+    for k in sorted(os.environ):
+        if k.startswith(_FINGERPRINT_ENV_PREFIXES):
+            h.update(f"{k}={os.environ[k]}\0".encode("utf-8", "replace"))
+    return h.hexdigest()[:16]
+
+
+def _private_runtime_dir():
+    """$XDG_RUNTIME_DIR, or /tmp/sg-<uid> created 0700. None unless the
+    directory is ours and closed to other users, since the socket carries
+    the client's environment (API keys included)."""
+    base = os.environ.get("XDG_RUNTIME_DIR") or ""
+    d = base if os.path.isabs(base) else os.path.join("/tmp", f"sg-{os.getuid()}")
+    try:
+        os.mkdir(d, 0o700)
+    except FileExistsError:
+        pass
+    except OSError:
+        return None
+    try:
+        st = os.lstat(d)
+    except OSError:
+        return None
+    import stat
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        return None
+    return d
+
+
+def worker_socket_path():
+    """Socket for this fingerprint under the state dir, or under
+    _private_runtime_dir() when that path would not fit in sun_path.
+    None when neither is usable."""
+    state = _resolve_state_dir()
+    fp = _fingerprint()
+    path = os.path.join(state, f"worker-{fp}.sock")
+    if len(os.fsencode(path)) <= _MAX_SOCKET_PATH:
+        return path
+    d = _private_runtime_dir()
+    if d is None:
+        return None
+    key = hashlib.sha256(f"{state}\0{fp}".encode("utf-8", "replace")).hexdigest()[:16]
+    path = os.path.join(d, f"sg-worker-{key}.sock")
+    return path if len(os.fsencode(path)) <= _MAX_SOCKET_PATH else None
+
+
+# =====================================================================
+# Client
+# =====================================================================
+
+def _should_forward(raw):
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return False
+    return (
+        isinstance(data, dict)
+        and data.get("hook_event_name") == "PostToolUse"
+        and data.get("tool_name") in _WORKER_TOOLS
+    )
+
+
+def _forward(sock_path, raw):
+    """Send one request; return the decoded response dict. Raises on any
+    transport failure so the caller can fall back, or _ResponseTimeout
+    once the worker holds the full request and may already be running it."""
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.settimeout(_CONNECT_TIMEOUT_S)
+        s.connect(sock_path)
+        s.settimeout(_RESPONSE_TIMEOUT_S)
+        req = {"stdin": raw, "cwd": os.getcwd(), "env": dict(os.environ), "argv": sys.argv}
+        s.sendall(json.dumps(req).encode("utf-8"))
+        s.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            try:
+                b = s.recv(65536)
+            except socket.timeout:
+                raise _ResponseTimeout() from None
+            if not b:
+                break
+            chunks.append(b)
+    finally:
+        s.close()
+    resp = json.loads(b"".join(chunks).decode("utf-8", errors="replace"))
+    if not isinstance(resp, dict) or "code" not in resp:
+        raise ValueError("malformed worker response")
+    return resp
+
+
+def _spawn_worker(sock_path):
+    """Detached `--serve`; the worker's own flock makes concurrent spawns
+    collapse to one listener. Throttled by a stamp file next to the socket
+    so a worker that keeps failing to bind is retried once a minute, not
+    once per edit."""
+    import subprocess
+    import time as _time
+    stamp = sock_path + ".spawned"
+    try:
+        if _time.time() - os.path.getmtime(stamp) < _SPAWN_THROTTLE_S:
+            return
+    except OSError:
+        pass
+    try:
+        os.makedirs(os.path.dirname(stamp), mode=0o700, exist_ok=True)
+        # Stamp BEFORE spawning so a burst of edits spawns one worker.
+        open(stamp, "w").close()
+    except OSError:
+        return
+    try:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve"],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL, start_new_session=True, close_fds=True,
+        )
+    except OSError as e:
+        debug_log(f"warm_worker: spawn failed: {e}")
+
+
+def _run_in_process(raw):
+    sys.stdin = io.StringIO(raw)
+    import security_reminder_hook
+    from tracing import span
+    with span("hook", "hook", in_process=True):
+        security_reminder_hook.main()
+
+
+def client_main():
+    raw = sys.stdin.read()
+    sock_path = None
+    if is_warm_worker_enabled() and _should_forward(raw):
+        sock_path = worker_socket_path()
+    if sock_path is not None:
+        try:
+            resp = _forward(sock_path, raw)
+        except _ResponseTimeout:
+            # The worker has the request and may have recorded its warning
+            # as shown; an in-process rerun would dedupe it to nothing.
+            debug_log("warm_worker: no response in time, not rerunning")
+            sys.exit(0)
+        except (OSError, ValueError) as e:
+            # ENOENT/ECONNREFUSED = no live worker; start one for the next
+            # edit. A timeout means a live-but-busy worker, don't pile on.
+            if not isinstance(e, socket.timeout):
+                _spawn_worker(sock_path)
+            debug_log(f"warm_worker: falling back in-process ({type(e).__name__})")
+        else:
+            sys.stdout.write(resp.get("stdout") or "")
+            sys.stdout.flush()
+            if resp.get("stderr"):
+                sys.stderr.write(resp["stderr"])
+                sys.stderr.flush()
+            sys.exit(int(resp["code"]))
+    _run_in_process(raw)
+
+
+# =====================================================================
+# Worker
+# =====================================================================
+
+def _recv_all(conn):
+    chunks = []
+    while True:
+        b = conn.recv(65536)
+        if not b:
+            break
+        chunks.append(b)
+    return b"".join(chunks)
+
+
+def _serve_one(conn, hook):
+    import tracing
+    conn.settimeout(_RESPONSE_TIMEOUT_S)
+    try:
+        req = json.loads(_recv_all(conn).decode("utf-8", errors="replace"))
+    except (OSError, ValueError) as e:
+        debug_log(f"warm_worker: bad request: {e}")
+        return
+
+    # Run main() under the client's env/cwd/stdio. Restored afterwards so
+    # one request can't leak CLAUDE_PROJECT_DIR etc. into the next.
+    saved_env = dict(os.environ)
+    saved_cwd = os.getcwd()
+    saved_io = (sys.stdin, sys.stdout, sys.stderr, sys.argv)
+    out, err = io.StringIO(), io.StringIO()
+    code = 0
+    try:
+        os.environ.clear()
+        os.environ.update(req.get("env") or {})
+        try:
+            os.chdir(req.get("cwd") or saved_cwd)
+        except OSError:
+            pass
+        sys.stdin = io.StringIO(req.get("stdin") or "")
+        sys.stdout, sys.stderr = out, err
+        sys.argv = list(req.get("argv") or [hook.__file__])
+        try:
+            with tracing.span("hook", "hook", worker=True):
+                hook.main()
+        except SystemExit as e:
+            if e.code is None:
+                code = 0
+            elif isinstance(e.code, int):
+                code = e.code
+            else:
+                err.write(f"{e.code}\n")
+                code = 1
+        except Exception:
+            # Same shape as an uncaught exception in the cold hook.
+            err.write(traceback.format_exc())
+            code = 1
+        # One trace file per request (under the client's state dir), not
+        # one per worker lifetime.
+        tracing.flush()
+    finally:
+        sys.stdin, sys.stdout, sys.stderr, sys.argv = saved_io
+        os.environ.clear()
+        os.environ.update(saved_env)
+        try:
+            os.chdir(saved_cwd)
+        except OSError:
+            pass
+
+    resp = {"stdout": out.getvalue(), "stderr": err.getvalue(), "code": code}
+    try:
+        conn.sendall(json.dumps(resp).encode("utf-8"))
+    except OSError as e:
+        debug_log(f"warm_worker: reply failed: {e}")
+
+
+def serve():
+    if not is_warm_worker_enabled():
+        return
+    sock_path = worker_socket_path()
+    if sock_path is None:
+        debug_log("warm_worker: no usable socket path")
+        return
+    try:
+        os.makedirs(os.path.dirname(sock_path), mode=0o700, exist_ok=True)
+        lock_fd = os.open(sock_path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+    except OSError as e:
+        debug_log(f"warm_worker: cannot open lock: {e}")
+        return
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(lock_fd)  # another worker owns this fingerprint
+        return
+
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        # The lock holder is the only binder, so any existing socket file is
+        # a leftover from a crashed worker.
+        try:
+            os.unlink(sock_path)
+        except FileNotFoundError:
+            pass
+        old_umask = os.umask(0o177)
+        try:
+            srv.bind(sock_path)
+        finally:
+            os.umask(old_umask)
+        srv.listen(16)
+        srv.settimeout(_idle_timeout_s())
+
+        import security_reminder_hook as hook
+        debug_log(f"warm_worker: serving on {sock_path} (pid {os.getpid()})")
+        while True:
+            try:
+                conn, _ = srv.accept()
+            except socket.timeout:
+                break
+            with conn:
+                _serve_one(conn, hook)
+    except OSError as e:
+        debug_log(f"warm_worker: serve failed: {e}")
+    finally:
+        srv.close()
+        try:
+            os.unlink(sock_path)
+        except OSError:
+            pass
+        os.close(lock_fd)
+        debug_log("warm_worker: idle, exiting")
+
+
+# =====================================================================
+# Benchmark
+# =====================================================================
+
+def bench(n):
+    """Time `n` Edit hook runs cold (SG_WARM_WORKER=0) and warm, each as a
+    real subprocess the way Claude Code spawns it, against a throwaway state
+    dir. Prints p50/p99 in milliseconds."""
+    import subprocess
+    import tempfile
+    import time as _time
+
+    def _pct(xs, p):
+        xs = sorted(xs)
+        return xs[min(len(xs) - 1, int(round(p / 100.0 * (len(xs) - 1))))]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # A fresh throttle stamp keeps _maybe_bootstrap_agent_sdk_async from
+        # building a venv in the throwaway dir mid-benchmark.
+        open(os.path.join(tmp, ".sdk_bootstrap_spawned"), "w").close()
+        base_env = dict(os.environ)
+        base_env.update({
+            "SECURITY_WARNINGS_STATE_DIR": tmp,
+            "SG_WARM_WORKER_IDLE_S": "10",
+            "PYTHONUTF8": "1",
+        })
+
+        def _payload(i):
+            return json.dumps({
+                "session_id": "bench",
+                "hook_event_name": "PostToolUse",
+                "tool_name": "Edit",
+                "cwd": tmp,
+                "tool_input": {
+                    "file_path": os.path.join(tmp, f"f{i}.py"),
+                    "new_string": "result = eval(user_input)\n",
+                },
+            })
+
+        def _run(env, i):
+            t0 = _time.perf_counter()
+            subprocess.run([sys.executable, os.path.abspath(__file__)],
+                           input=_payload(i).encode("utf-8"), env=env,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return (_time.perf_counter() - t0) * 1000.0
+
+        cold_env = dict(base_env, SG_WARM_WORKER="0")
+        warm_env = dict(base_env, SG_WARM_WORKER="1")
+        cold = [_run(cold_env, i) for i in range(n)]
+
+        # Prime: first warm call spawns the worker; wait for it to listen.
+        _run(warm_env, -1)
+        deadline = _time.time() + 10
+        saved = dict(os.environ)
+        os.environ.update(warm_env)
+        try:
+            sock = worker_socket_path()
+        finally:
+            os.environ.clear()
+            os.environ.update(saved)
+        while sock and not os.path.exists(sock) and _time.time() < deadline:
+            _time.sleep(0.05)
+        warm = [_run(warm_env, i) for i in range(n)]
+
+        for label, xs in (("cold", cold), ("warm", warm)):
+            print(f"{label}: n={len(xs)} p50={_pct(xs, 50):.1f}ms p99={_pct(xs, 99):.1f}ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        serve()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        bench(int(sys.argv[2]) if len(sys.argv) > 2 else 50)
+    else:
+        client_main()